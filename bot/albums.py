@@ -0,0 +1,45 @@
+# bot/albums.py
+"""
+Photos sent together as an album (one media_group_id) are identified as one dog.
+
+Telegram delivers each photo of an album as its own message, a few ms to a few hundred ms
+apart. The first message of a group waits until ALBUM_WAIT_MS pass without a new part and
+then handles the whole album; the handlers for the other parts return right away.
+With several webhook workers, parts that land on another worker form their own album there.
+"""
+import asyncio
+
+from kas_config import ALBUM_WAIT_MS
+
+
+class QueryAlbum:
+    """Several photos of one dog, recognized in the same batch and fused into one ranking."""
+
+    __slots__ = ("photos",)
+
+    def __init__(self, photos):
+        self.photos = list(photos)
+
+
+class AlbumCollector:
+    def __init__(self, wait_ms=ALBUM_WAIT_MS):
+        self.wait = wait_ms / 1000
+        self._albums = {}  # media_group_id -> messages received so far
+
+    async def collect(self, message):
+        """All messages of the album, in order, for its first message; None for the others."""
+        album = self._albums.get(message.media_group_id)
+        if album is not None:
+            album.append(message)
+            return None
+
+        album = self._albums[message.media_group_id] = [message]
+        seen = 0
+        while len(album) != seen:
+            seen = len(album)
+            await asyncio.sleep(self.wait)
+        del self._albums[message.media_group_id]
+        return sorted(album, key=lambda m: m.message_id)
+
+
+albums = AlbumCollector()
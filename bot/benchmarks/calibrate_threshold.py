@@ -0,0 +1,66 @@
+# bot/benchmarks/calibrate_threshold.py
+"""
+Show (and optionally store) the match threshold of the current index by leave-one-out search.
+
+For every reference photo we look at its nearest photo of the *same* dog (genuine)
+and its nearest photo of a *different* dog (impostor). A photo of a dog that is not
+in the index behaves like an impostor. By default the threshold sits at the equal error
+rate (impostors accepted = genuine pairs lost); `--false-accept` asks for a given share of
+impostor neighbours under it instead, trading recognized photos for fewer wrong dogs.
+
+Index builds store this threshold in the manifest (bot/dog_index.json) and recognition
+uses it unless MATCH_MAX_DISTANCE is set. `--write` stores it for an index built before that:
+
+    python -m bot.benchmarks.calibrate_threshold --write
+"""
+import argparse
+import os
+
+import faiss
+import numpy as np
+
+from bot import index_factory
+from bot.recognition import INDEX_PATH, METADATA_PATH
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--k", type=int, default=index_factory.CALIBRATION_K, help="neighbours to inspect per photo")
+    parser.add_argument("--false-accept", type=float, default=index_factory.CALIBRATION_FALSE_ACCEPT,
+                        help="tolerated impostor rate (default: equal error rate)")
+    parser.add_argument("--write", action="store_true", help="store the threshold in the index manifest")
+    args = parser.parse_args()
+
+    # Read directly: the bot's IndexHolder refuses an index without a threshold
+    manifest_file = index_factory.manifest_path(INDEX_PATH)
+    manifest = index_factory.read_manifest(manifest_file)
+    index = faiss.read_index(INDEX_PATH)
+    index_factory.configure_search(index, manifest)
+    labels = index_factory.read_labels(METADATA_PATH, manifest, mmap=False)
+    genuine, impostor = index_factory.nearest_by_kind(index, labels, manifest, args.k)
+
+    print(f"{index.ntotal} photos, {len(genuine)} with another photo of the same dog")
+    for name, values in (("genuine", genuine), ("impostor", impostor)):
+        if len(values):
+            p5, p50, p95 = np.percentile(values, [5, 50, 95])
+            print(f"{name:<9} nearest distance  p5={p5:.2f}  p50={p50:.2f}  p95={p95:.2f}")
+
+    match = index_factory.calibrate_threshold(index, labels, manifest, args.false_accept, args.k, sample=None)
+    if match is None:
+        print("Not enough different dogs among the neighbours to calibrate; increase --k.")
+        return
+    stored = (manifest.get("match") or {}).get("max_distance")
+    print(f"\nThreshold {match['max_distance']:.2f} "
+          f"({match['operating_point']}: {match['false_accept']:.0%} impostor accepts, "
+          f"{match['genuine_kept'] or 0:.0%} of genuine pairs kept); "
+          f"stored in the manifest: {stored if stored is not None else 'none'}")
+
+    if args.write:
+        manifest["match"] = match
+        index_factory.save_manifest(manifest_file + ".tmp", manifest)
+        os.replace(manifest_file + ".tmp", manifest_file)
+        print(f"Saved to {manifest_file}; running bots reload it within INDEX_WATCH_INTERVAL or on /reload_index")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+# bot/benchmarks/collage.py
+"""
+Collage rendering time and peak memory for 10/50/200 dogs.
+
+Compares the old path (write each photo to a temp file, full-resolution decode, write the
+collage to disk and read it back) with build_collage on in-memory bytes using JPEG draft
+decoding. Each run is a fresh interpreter so peak RSS is not shared.
+
+    python -m bot.benchmarks.collage --sizes 10 50 200 --photo-size 1600x1200
+"""
+import argparse
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+from PIL import Image
+
+MODES = ("files-full-decode", "memory-draft")
+
+
+def make_photos(directory, count, size):
+    # Smooth noise compresses like a real photo far better than white noise
+    rng = np.random.default_rng(0)
+    for i in range(count):
+        small = rng.integers(0, 255, (size[1] // 16, size[0] // 16, 3), dtype=np.uint8)
+        Image.fromarray(small).resize(size, Image.BILINEAR).save(os.path.join(directory, f"{i}.jpg"), quality=90)
+
+
+def rss_mb():
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def legacy_create_collage(dog_data, cell_size=(350, 300), cols=2):
+    """The renderer the bot used before build_collage: every photo decoded at full size and kept open."""
+    from PIL import ImageDraw, ImageFont
+
+    images = [(Image.open(path).convert("RGB"), name) for path, name in dog_data]
+    rows = (len(images) + cols - 1) // cols
+    font_size = 24
+    font = ImageFont.load_default()
+    top_margin = font_size + 20
+    collage = Image.new("RGB", (cols * cell_size[0], rows * (cell_size[1] + font_size + 10) + top_margin), "white")
+    draw = ImageDraw.Draw(collage)
+    for idx, (img, name) in enumerate(images):
+        img.thumbnail(cell_size, Image.LANCZOS)
+        x = (idx % cols) * cell_size[0] + (cell_size[0] - img.width) // 2
+        y = top_margin + (idx // cols) * (cell_size[1] + font_size + 10)
+        collage.paste(img, (x, y))
+        draw.text((x, y + img.height + 5), name, fill="black", font=font)
+    fd, out_path = tempfile.mkstemp(suffix=".jpg")
+    with os.fdopen(fd, "wb") as f:
+        collage.save(f, format="JPEG")
+    return out_path
+
+
+def run_child(mode, directory, count, repeats):
+    from bot.utils.helpers import build_collage
+
+    photos = []
+    for i in range(count):
+        with open(os.path.join(directory, f"{i}.jpg"), "rb") as f:
+            photos.append(f.read())
+    names = [f"Dog {i}" for i in range(count)]
+    baseline = rss_mb()
+
+    def files_full_decode():
+        paths = []
+        for data in photos:
+            fd, path = tempfile.mkstemp(suffix=".jpg")
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            paths.append(path)
+        out_path = legacy_create_collage(list(zip(paths, names)))
+        with open(out_path, "rb") as f:
+            data = f.read()
+        for path in paths + [out_path]:
+            os.remove(path)
+        return data
+
+    def memory_draft():
+        return build_collage(list(zip(photos, names)), cell_size=(350, 300), cols=2)
+
+    render = files_full_decode if mode == "files-full-decode" else memory_draft
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        data = render()
+        timings.append((time.perf_counter() - start) * 1000)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(json.dumps({"ms": float(np.median(timings)), "peak_mb": peak - baseline, "kb": len(data) / 1024}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 50, 200])
+    parser.add_argument("--photo-size", default="1600x1200", help="WxH of the generated originals")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--child", choices=MODES, help=argparse.SUPPRESS)
+    parser.add_argument("--dir", help=argparse.SUPPRESS)
+    parser.add_argument("--count", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child, args.dir, args.count, args.repeats)
+        return
+
+    size = tuple(int(x) for x in args.photo_size.split("x"))
+    directory = tempfile.mkdtemp(prefix="kas_collage_")
+    make_photos(directory, max(args.sizes), size)
+
+    print(f"originals {size[0]}x{size[1]}, median of {args.repeats} runs, peak RSS above the loaded inputs")
+    print(f"{'dogs':>5}  {'mode':<20}{'ms':>9}{'peak MB':>10}{'JPEG KB':>10}")
+    for count in args.sizes:
+        for mode in MODES:
+            proc = subprocess.run(
+                [sys.executable, "-m", "bot.benchmarks.collage", "--child", mode, "--dir", directory,
+                 "--count", str(count), "--repeats", str(args.repeats)],
+                capture_output=True, text=True,
+            )
+            if proc.returncode != 0:
+                print(f"{count:>5}  {mode:<20}failed: {proc.stderr.strip().splitlines()[-1] if proc.stderr else ''}")
+                continue
+            r = json.loads(proc.stdout.strip().splitlines()[-1])
+            print(f"{count:>5}  {mode:<20}{r['ms']:>9.0f}{r['peak_mb']:>10.1f}{r['kb']:>10.0f}")
+    shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+# bot/benchmarks/encoder_backends.py
+"""
+Latency, memory and parity of the embedding backends in bot/encoder.py on CPU.
+
+Each backend runs in a fresh interpreter so load time and peak RSS are not shared. A backend
+the Encoder replaced with torch (load failure or parity drift) is reported, not measured.
+
+    python -m bot.benchmarks.encoder_backends --model resnet50 --threads 4
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from bot.encoder import BACKENDS, MODELS, parity, parity_batch
+
+
+def run_child(model_name, backend, threads, out_path, repeats):
+    start = time.perf_counter()
+    from bot.encoder import Encoder
+    encoder = Encoder(model_name, device="cpu", backend=backend, threads=threads)
+    load_s = time.perf_counter() - start
+
+    # The Encoder falls back to torch when a backend fails to load or drifts; report what ran
+    stats = {"load_s": load_s, "backend": encoder.backend}
+    for batch_size in (1, 8):
+        batch = parity_batch(batch_size, seed=1)
+        encoder.embed_arrays(batch)  # warm up
+        timings = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            encoder.embed_arrays(batch)
+            timings.append((time.perf_counter() - start) * 1000)
+        stats[f"b{batch_size}_ms"] = float(np.median(timings))
+
+    np.save(out_path, encoder.embed_arrays(parity_batch(16, seed=2)))
+    stats["rss_mb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(json.dumps(stats))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", choices=tuple(MODELS), default="resnet50")
+    parser.add_argument("--backends", nargs="+", choices=BACKENDS, default=list(BACKENDS))
+    parser.add_argument("--threads", type=int, default=0)
+    parser.add_argument("--repeats", type=int, default=10)
+    parser.add_argument("--child", choices=BACKENDS, help=argparse.SUPPRESS)
+    parser.add_argument("--out", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.model, args.child, args.threads, args.out, args.repeats)
+        return
+
+    backends = ["torch"] + [b for b in args.backends if b != "torch"]
+    out_dir = tempfile.mkdtemp(prefix="kas_encoders_")
+    results = {}
+    for backend in backends:
+        out_path = os.path.join(out_dir, f"{backend}.npy")
+        proc = subprocess.run(
+            [sys.executable, "-m", "bot.benchmarks.encoder_backends", "--child", backend, "--out", out_path,
+             "--model", args.model, "--threads", str(args.threads), "--repeats", str(args.repeats)],
+            capture_output=True, text=True,
+        )
+        if proc.returncode != 0:
+            print(f"{backend}: failed\n{proc.stderr.strip().splitlines()[-1] if proc.stderr else ''}")
+            continue
+        results[backend] = json.loads(proc.stdout.strip().splitlines()[-1])
+        if results[backend]["backend"] != backend:
+            print(f"{backend}: fell back to {results[backend]['backend']}\n"
+                  f"{next((line for line in proc.stdout.splitlines() if 'FALLING BACK' in line), '')}")
+        results[backend]["emb"] = np.load(out_path)
+        os.remove(out_path)
+    os.rmdir(out_dir)
+
+    print(f"{args.model}, threads={args.threads or 'default'}, median of {args.repeats} runs")
+    print(f"{'backend':<12}{'load s':>8}{'b1 ms':>9}{'b8 ms':>9}{'RSS MB':>9}{'min cos':>10}{'max diff':>10}")
+    reference = results.get("torch", {}).get("emb")
+    for backend, r in results.items():
+        if r["backend"] != backend:
+            print(f"{backend:<12}  not measured: the encoder fell back to {r['backend']} (see the log above)")
+            continue
+        cosine, max_diff = parity(reference, r["emb"]) if reference is not None else (float("nan"), float("nan"))
+        print(f"{backend:<12}{r['load_s']:>8.2f}{r['b1_ms']:>9.1f}{r['b8_ms']:>9.1f}{r['rss_mb']:>9.0f}"
+              f"{cosine:>10.5f}{max_diff:>10.4f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+# bot/benchmarks/index_types.py
+"""
+Recall vs latency of the index types in bot/index_factory.py against the flat baseline.
+
+Uses the local embedding store (bot/dog_embeddings.npz) when present, otherwise a synthetic
+collection shaped like ours (several photos per dog) so the larger-shelter case can be tried:
+
+    python -m bot.benchmarks.index_types --synthetic 30000 --dim 2048 --metric cosine
+"""
+import argparse
+import os
+import time
+
+import faiss
+import numpy as np
+
+from bot import index_factory
+
+STORE_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "dog_embeddings.npz")
+
+
+def synthetic_embeddings(count, dim, photos_per_dog=5, seed=0):
+    rng = np.random.default_rng(seed)
+    dogs = rng.normal(size=(max(1, count // photos_per_dog), dim)).astype("float32")
+    owner = rng.integers(0, len(dogs), count)
+    return dogs[owner] + 0.35 * rng.normal(size=(count, dim)).astype("float32")
+
+
+def make_queries(vectors, count, seed=1):
+    # New photos of known dogs: existing vectors plus some noise
+    rng = np.random.default_rng(seed)
+    picked = vectors[rng.integers(0, len(vectors), count)]
+    scale = 0.25 * vectors.std()
+    return (picked + scale * rng.normal(size=picked.shape)).astype("float32")
+
+
+def run(spec, vectors, queries, k, truth=None):
+    ids = np.arange(len(vectors))
+    start = time.perf_counter()
+    index = index_factory.build_index(spec, vectors, ids)
+    build_s = time.perf_counter() - start
+
+    latencies = []
+    found = []
+    for q in queries:
+        start = time.perf_counter()
+        _, I = index_factory.search(index, spec, q[None], k)
+        latencies.append((time.perf_counter() - start) * 1000)
+        found.append(I[0])
+    found = np.array(found)
+
+    recall = 1.0
+    if truth is not None:
+        recall = np.mean([len(np.intersect1d(f, t)) / k for f, t in zip(found, truth)])
+    return {
+        "build_s": build_s,
+        "p50_ms": np.percentile(latencies, 50),
+        "p95_ms": np.percentile(latencies, 95),
+        "recall": recall,
+        "size_mb": faiss.serialize_index(index).nbytes / 1e6,
+        "found": found,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--synthetic", type=int, help="use N synthetic vectors instead of the embedding store")
+    parser.add_argument("--dim", type=int, default=2048)
+    parser.add_argument("--metric", choices=index_factory.METRICS, default="l2")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--types", nargs="+", default=["ivf", "hnsw", "pq", "ivfpq"],
+                        choices=index_factory.INDEX_TYPES)
+    args = parser.parse_args()
+
+    if args.synthetic or not os.path.exists(STORE_PATH):
+        vectors = synthetic_embeddings(args.synthetic or 20000, args.dim)
+        source = "synthetic"
+    else:
+        vectors = np.load(STORE_PATH)["embeddings"]
+        source = STORE_PATH
+    queries = make_queries(vectors, args.queries)
+    k = min(args.k, len(vectors))
+
+    print(f"{len(vectors)} vectors x {vectors.shape[1]} ({source}), metric={args.metric}, "
+          f"{len(queries)} queries, recall@{k} vs flat")
+    print(f"{'type':<8}{'build s':>9}{'p50 ms':>9}{'p95 ms':>9}{'recall':>9}{'size MB':>10}")
+
+    baseline = run(index_factory.make_spec("flat", args.metric), vectors, queries, k)
+    rows = [("flat", baseline)]
+    for kind in args.types:
+        try:
+            rows.append((kind, run(index_factory.make_spec(kind, args.metric), vectors, queries, k, baseline["found"])))
+        except ValueError as e:
+            print(f"{kind:<8}skipped: {e}")
+    for kind, r in rows:
+        print(f"{kind:<8}{r['build_s']:>9.2f}{r['p50_ms']:>9.3f}{r['p95_ms']:>9.3f}{r['recall']:>9.3f}{r['size_mb']:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
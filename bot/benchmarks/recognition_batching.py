@@ -0,0 +1,91 @@
+# bot/benchmarks/recognition_batching.py
+"""
+Throughput/latency of the recognition worker on CPU: single-image vs micro-batched.
+
+    python -m bot.benchmarks.recognition_batching --requests 64 --batch 8 --wait-ms 20
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+import numpy as np
+from PIL import Image
+
+from bot import recognition
+from bot.inference import RecognitionWorker
+
+
+def embed_batch(paths):
+    # Forward pass only: this is what batching speeds up, and it does not depend on the index contents
+    return list(recognition.get_embeddings([recognition.load_image(p) for p in paths]))
+
+
+def make_photos(count, size=(640, 480)):
+    temp_dir = tempfile.mkdtemp(prefix="kas_bench_")
+    rng = np.random.default_rng(0)
+    paths = []
+    for i in range(count):
+        pixels = rng.integers(0, 255, (size[1], size[0], 3), dtype=np.uint8)
+        path = os.path.join(temp_dir, f"photo_{i}.jpg")
+        Image.fromarray(pixels).save(path, format="JPEG")
+        paths.append(path)
+    return paths
+
+
+async def run_mode(paths, max_batch_size, max_wait_ms, workers):
+    worker = RecognitionWorker(embed_batch, max_batch_size=max_batch_size,
+                               max_wait_ms=max_wait_ms, workers=workers)
+    worker.start()
+
+    async def one(path):
+        start = time.perf_counter()
+        await worker.submit(path)
+        return time.perf_counter() - start
+
+    # Warm up once so model init is not billed to the first request
+    await one(paths[0])
+
+    start = time.perf_counter()
+    latencies = await asyncio.gather(*(one(p) for p in paths))
+    elapsed = time.perf_counter() - start
+    await worker.stop()
+
+    latencies = np.array(latencies) * 1000
+    return {
+        "throughput": len(paths) / elapsed,
+        "p50": np.percentile(latencies, 50),
+        "p95": np.percentile(latencies, 95),
+        "max": latencies.max(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=64)
+    parser.add_argument("--batch", type=int, default=8)
+    parser.add_argument("--wait-ms", type=float, default=20)
+    parser.add_argument("--workers", type=int, default=1)
+    args = parser.parse_args()
+
+    paths = make_photos(args.requests)
+    modes = [
+        ("single", 1, 0),
+        (f"batched x{args.batch}", args.batch, args.wait_ms),
+    ]
+
+    encoder = recognition.encoder_for(recognition.index_holder.snapshot()[2])
+    print(f"{args.requests} concurrent requests, {encoder.model_name} on {encoder.device}, {args.workers} worker(s)")
+    print(f"{'mode':<14}{'img/s':>8}{'p50 ms':>10}{'p95 ms':>10}{'max ms':>10}")
+    for name, batch, wait_ms in modes:
+        stats = asyncio.run(run_mode(paths, batch, wait_ms, args.workers))
+        print(f"{name:<14}{stats['throughput']:>8.1f}{stats['p50']:>10.0f}{stats['p95']:>10.0f}{stats['max']:>10.0f}")
+
+    for path in paths:
+        os.remove(path)
+    os.rmdir(os.path.dirname(paths[0]))
+
+
+if __name__ == "__main__":
+    main()
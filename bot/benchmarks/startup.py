@@ -0,0 +1,78 @@
+# bot/benchmarks/startup.py
+"""
+Cold-start cost of the bot: how long importing it takes, whether that pulls in torch/FAISS,
+and how long the background warm-up (index + model + one forward pass) takes afterwards.
+
+Each measurement runs in a fresh interpreter so nothing is already cached in sys.modules.
+
+    python -m bot.benchmarks.startup --repeats 3
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+HEAVY_MODULES = ("torch", "torchvision", "faiss", "onnxruntime")
+
+
+def run_child(module, warm_up):
+    start = time.perf_counter()
+    __import__(module)
+    stats = {"import_s": time.perf_counter() - start}
+    stats["heavy"] = [name for name in HEAVY_MODULES if name in sys.modules]
+    if warm_up:
+        from bot.recognition import warm_up as recognition_warm_up
+
+        start = time.perf_counter()
+        recognition_warm_up()
+        stats["warm_up_s"] = time.perf_counter() - start
+    print(json.dumps(stats))
+
+
+def measure(module, warm_up, repeats):
+    # The bot modules create Telegram/Supabase clients at import; dummy values are enough offline
+    env = dict(os.environ)
+    env.setdefault("BOT_TOKEN", "123456:bench")
+    env.setdefault("SUPABASE_URL", "http://localhost")
+    env.setdefault("SUPABASE_KEY", "bench.bench.bench")
+    runs = []
+    for _ in range(repeats):
+        cmd = [sys.executable, "-m", "bot.benchmarks.startup", "--child", module]
+        if warm_up:
+            cmd.append("--warm-up")
+        proc = subprocess.run(cmd, capture_output=True, text=True, env=env)
+        if proc.returncode != 0:
+            print(f"{module}: failed\n{proc.stderr.strip().splitlines()[-1] if proc.stderr else ''}")
+            return None
+        runs.append(json.loads(proc.stdout.strip().splitlines()[-1]))
+    return runs
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    parser.add_argument("--warm-up", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child, args.warm_up)
+        return
+
+    print(f"median of {args.repeats} fresh interpreters")
+    print(f"{'module':<22}{'import s':>10}{'warm-up s':>11}  heavy modules loaded at import")
+    for module, warm_up in (("bot.handlers.catalog", False), ("bot.main", True)):
+        runs = measure(module, warm_up, args.repeats)
+        if not runs:
+            continue
+        import_s = np.median([r["import_s"] for r in runs])
+        warm_up_s = np.median([r["warm_up_s"] for r in runs]) if warm_up else float("nan")
+        print(f"{module:<22}{import_s:>10.2f}{warm_up_s:>11.2f}  {', '.join(runs[0]['heavy']) or 'none'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,35 +1,17 @@
 # build_index.py
+# Builds the recognition index from a local folder instead of Supabase Storage.
 import os
 import numpy as np
-import torch
-import torchvision.models as models
-import torchvision.transforms as T
-from PIL import Image
-import faiss
+from bot import index_factory
+from bot.encoder import get_encoder, load_image, embedding_info
+from kas_config import INDEX_TYPE, INDEX_METRIC, EMBEDDING_MODEL
 
-# --- Model ---
-device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-resnet = models.resnet18(pretrained=True)
-resnet.fc = torch.nn.Identity()
-resnet = resnet.to(device).eval()
-
-transform = T.Compose([
-    T.Resize((224, 224)),
-    T.ToTensor(),
-    T.Normalize(mean=[0.485, 0.456, 0.406],
-                std=[0.229, 0.224, 0.225]),
-])
-
-def get_embedding(img_path: str) -> np.ndarray:
-    img = Image.open(img_path).convert("RGB")
-    tensor = transform(img).unsqueeze(0).to(device)
-    with torch.no_grad():
-        emb = resnet(tensor).cpu().numpy()
-    return emb.astype("float32")
+# --- Model (same backend as bot/embeddings.py and bot/recognition.py) ---
+encoder = get_encoder(EMBEDDING_MODEL)
 
 # --- Build index ---
 embeddings = []
-metadata = []  # stores {id, category, name}
+labels = []  # dog id per embedding, same format as bot/embeddings.py
 
 root = "dogs_dataset"  # local root with subfolders like 0001/, 0002/
 for folder in os.listdir(root):
@@ -40,24 +22,19 @@ for folder in os.listdir(root):
         if not fname.lower().endswith((".jpg", ".jpeg", ".png")):
             continue
 
-        img_path = os.path.join(folder_path, fname)
-        emb = get_embedding(img_path)
-        embeddings.append(emb)
-
-        dog_id = folder  # folder name is ID (e.g. "0001")
-        name = os.path.splitext(fname)[0]
-
-        metadata.append({
-            "id": dog_id,        # instead of local path
-            "category": folder,  # category = folder (can be refined later)
-            "name": name,        # filename without extension
-        })
+        img = load_image(os.path.join(folder_path, fname))
+        if img is None:
+            continue
+        embeddings.append(encoder.embed_images([img])[0])
+        labels.append(folder)  # folder name is ID (e.g. "0001")
 
 # --- Save index ---
 emb_matrix = np.vstack(embeddings)
-index = faiss.IndexFlatL2(emb_matrix.shape[1])
-index.add(emb_matrix)
-
-faiss.write_index(index, "dog_index.faiss")
-np.save("dogs.npy", metadata)
-print(f"✅ Saved {len(metadata)} embeddings")
+spec = index_factory.make_spec(INDEX_TYPE, INDEX_METRIC)
+index = index_factory.build_index(spec, emb_matrix, np.arange(len(emb_matrix)))
+
+match = index_factory.calibrate_threshold(index, np.array(labels), spec)  # "no match" cutoff for recognition
+manifest = index_factory.manifest_for(spec, index, trained_on=len(emb_matrix), embedding=embedding_info(EMBEDDING_MODEL),
+                                      match=match)
+index_factory.write_index_files(index, np.array(labels), manifest)
+print(f"✅ Saved {len(labels)} embeddings")
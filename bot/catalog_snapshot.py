@@ -0,0 +1,150 @@
+# bot/catalog_snapshot.py
+import asyncio
+import hashlib
+import json
+import re
+import time
+
+from bot.dog_store import store
+from kas_config import CATALOG_TTL
+
+CATALOG_COLUMNS = "id, name, category, pen, sector, status, description"
+
+
+def natural_sort_key(s):
+    return [int(text) if text.isdigit() else text.lower() for text in re.split(r'(\d+)', str(s))]
+
+
+class Catalog:
+    """
+    One immutable copy of the dogs table with the menu indexes precomputed:
+    category -> sectors -> pens -> dog ids, each list already in display order.
+    """
+
+    def __init__(self, rows, generation):
+        self.generation = generation
+        self.loaded_at = time.monotonic()
+        self.version = hashlib.sha1(json.dumps(rows, sort_keys=True, default=str).encode()).hexdigest()
+        self.by_id = {str(row["id"]): row for row in rows}
+
+        self.categories = sorted({row["category"] for row in rows if row["category"]})
+        sectors, pens, members = {}, {}, {}
+        for row in rows:
+            category, sector, pen = row["category"], row["sector"], row["pen"]
+            if sector is not None:
+                sectors.setdefault(category, set()).add(sector)
+                if pen is not None:
+                    pens.setdefault((category, str(sector)), set()).add(pen)
+            # A dog shows up under its category, its sector and its pen (same filters as the queries)
+            for key in {self._key(category), self._key(category, sector), self._key(category, sector, pen)}:
+                members.setdefault(key, []).append(row)
+        self._sectors = {category: sorted(values) for category, values in sectors.items()}
+        self._pens = {key: sorted(values, key=natural_sort_key) for key, values in pens.items()}
+        self._members = members
+
+    @staticmethod
+    def _key(category, sector=None, pen=None):
+        # Filters arrive as callback strings, the table may hold numbers
+        return (category, None if sector in (None, "") else str(sector), None if pen in (None, "") else str(pen))
+
+    def sectors(self, category):
+        return self._sectors.get(category, [])
+
+    def pens(self, category, sector):
+        return self._pens.get((category, str(sector)), [])
+
+    def dogs(self, category=None, sector=None, pen=None):
+        """Rows matching the filters, in id order."""
+        return list(self._members.get(self._key(category, sector, pen), []))
+
+    def dog(self, dog_id):
+        return self.by_id.get(str(dog_id))
+
+    def filters(self):
+        """Every (category, sector, pen) filter the catalog menus can lead to."""
+        result = []
+        for category in self.categories:
+            if category.lower() != "shelter":
+                result.append((category, None, None))
+                continue
+            for sector in self.sectors(category):
+                pens = self.pens("shelter", sector)
+                if len(pens) <= 1:
+                    result.append(("shelter", sector, pens[0] if pens else None))
+                else:
+                    result.extend(("shelter", sector, pen) for pen in pens)
+        return result
+
+
+class CatalogSnapshot:
+    """
+    Serves menu navigation from an in-memory Catalog, loaded from the dog store (Supabase
+    or the SQLite replica, see bot/dog_store.py). The first call loads it; after `ttl`
+    seconds the current copy keeps being served while a refresh runs in the background.
+    A refresh that finds the same rows keeps the old copy (and its generation), so caches
+    keyed on the generation only turn over when the table actually changed; callbacks added
+    with `on_change` run for every new generation.
+    """
+
+    def __init__(self, store, ttl=CATALOG_TTL):
+        self.store = store
+        self.ttl = ttl
+        self.generation = 0
+        self._catalog = None
+        self._refreshing = None
+        self._listeners = []
+
+    def on_change(self, callback):
+        """Call `callback(catalog)` whenever a new generation is loaded (the first load included)."""
+        self._listeners.append(callback)
+
+    async def refresh(self):
+        """Reload now (joining a refresh already in progress) and return the current Catalog."""
+        if self._refreshing is None:
+            self._refreshing = asyncio.ensure_future(self._load())
+            self._refreshing.add_done_callback(self._refresh_done)
+        return await asyncio.shield(self._refreshing)
+
+    def _refresh_done(self, future):
+        self._refreshing = None
+        if not future.cancelled():
+            future.exception()  # failures are reported to whoever awaited refresh()
+
+    async def _load(self):
+        start = time.perf_counter()
+        rows = await self.store.all_dogs(CATALOG_COLUMNS)
+        catalog = Catalog(rows, self.generation + 1)
+        if self._catalog is not None and catalog.version == self._catalog.version:
+            self._catalog.loaded_at = catalog.loaded_at
+            return self._catalog
+        self.generation += 1
+        self._catalog = catalog
+        print(f"[Catalog] Loaded generation {catalog.generation}: {len(rows)} dogs, "
+              f"{len(catalog.categories)} categories in {time.perf_counter() - start:.2f}s")
+        for callback in self._listeners:
+            try:
+                callback(catalog)
+            except Exception as e:
+                print(f"[Catalog] Change listener failed: {e}")
+        return catalog
+
+    async def get(self):
+        if self._catalog is None:
+            return await self.refresh()
+        if time.monotonic() - self._catalog.loaded_at > self.ttl and self._refreshing is None:
+            asyncio.ensure_future(self.refresh_in_background())
+        return self._catalog
+
+    async def refresh_in_background(self):
+        try:
+            await self.refresh()
+        except Exception as e:
+            print(f"[Catalog] Refresh failed, serving generation {self.generation}: {e}")
+
+    def invalidate(self):
+        """Make the next get() start a refresh (it still serves the current copy meanwhile)."""
+        if self._catalog is not None:
+            self._catalog.loaded_at = float("-inf")
+
+
+catalog = CatalogSnapshot(store)
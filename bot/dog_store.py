@@ -0,0 +1,212 @@
+# bot/dog_store.py
+"""
+Where the bot reads the dogs table from: Supabase directly, or the local SQLite replica
+in cache/dogs.db kept up to date by `sync_replica`. The replica is the bot's own file: its
+columns are whatever the remote rows carry, added as they first show up.
+
+    DOG_STORE=sqlite python -m bot.main     # serve from the replica, sync in the background
+    python -m bot.dog_store                 # one sync from Supabase into the replica
+"""
+import asyncio
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from bot.repository import repo
+from kas_config import DOG_STORE, DOG_DB_PATH, DOG_SYNC_CURSOR
+
+STORES = ("supabase", "sqlite")
+SKIP_COLUMNS = {"embeddings"}  # legacy local column, never synced or served
+
+# id is the primary key; menu filters are category, then sector, then pen
+FILTER_COLUMNS = ("category", "sector", "pen")
+COLUMN_NAME = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+
+class SupabaseDogStore:
+    """Reads straight from the Supabase table through the repository."""
+
+    name = "supabase"
+
+    def __init__(self, repository):
+        self.repository = repository
+
+    async def all_dogs(self, columns="*"):
+        return await self.repository.all_dogs(columns)
+
+    async def dog(self, dog_id):
+        return await self.repository.dog(dog_id)
+
+
+class SQLiteDogStore:
+    """
+    Reads from a local SQLite copy of the dogs table. All access goes through one worker
+    thread, so the connection is never shared and the event loop never waits on disk.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path=DOG_DB_PATH):
+        self.path = path
+        self._conn = None
+        self._columns = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite")
+
+    def _db(self):
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._conn = sqlite3.connect(self.path)
+            self._conn.row_factory = sqlite3.Row
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            # Columns without a declared type keep values as Supabase returned them
+            self._conn.execute("CREATE TABLE IF NOT EXISTS dogs (id TEXT PRIMARY KEY)")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS dog_sync (id TEXT PRIMARY KEY, row_hash TEXT NOT NULL)"
+            )
+            self._conn.execute("CREATE TABLE IF NOT EXISTS sync_state (key TEXT PRIMARY KEY, value TEXT)")
+            self._conn.commit()
+            self._columns = [row["name"] for row in self._conn.execute("PRAGMA table_info(dogs)")
+                             if row["name"] not in SKIP_COLUMNS]
+        return self._conn
+
+    def _add_columns(self, conn, rows):
+        """Add the columns remote rows carry that the replica doesn't have yet."""
+        new = []
+        for row in rows:
+            new.extend(c for c in row if c not in self._columns and c not in new and c not in SKIP_COLUMNS)
+        for column in new:
+            if not COLUMN_NAME.match(column):
+                raise ValueError(f"Unexpected column name {column!r} in the dogs table")
+            conn.execute(f'ALTER TABLE dogs ADD COLUMN "{column}"')
+            self._columns.append(column)
+        if new and all(c in self._columns for c in FILTER_COLUMNS):
+            conn.execute(f"CREATE INDEX IF NOT EXISTS idx_dogs_filters ON dogs ({', '.join(FILTER_COLUMNS)})")
+
+    async def _run(self, fn, *args):
+        return await asyncio.get_event_loop().run_in_executor(self._executor, fn, *args)
+
+    def _select(self, columns):
+        self._db()
+        if columns == "*":
+            return ", ".join(self._columns)
+        # Columns no synced row has carried yet read as NULL, like a Supabase column of NULLs
+        wanted = [c.strip() for c in columns.split(",")]
+        return ", ".join(c if c in self._columns else f"NULL AS {c}" for c in wanted if COLUMN_NAME.match(c))
+
+    async def all_dogs(self, columns="*"):
+        def query():
+            rows = self._db().execute(f"SELECT {self._select(columns)} FROM dogs ORDER BY id")
+            return [dict(row) for row in rows]
+
+        return await self._run(query)
+
+    async def dog(self, dog_id):
+        def query():
+            row = self._db().execute(f"SELECT {self._select('*')} FROM dogs WHERE id = ?", (str(dog_id),)).fetchone()
+            return dict(row) if row else None
+
+        return await self._run(query)
+
+    # --- Replica maintenance (see sync_replica) ---
+    async def sync_state(self, key):
+        def query():
+            row = self._db().execute("SELECT value FROM sync_state WHERE key = ?", (key,)).fetchone()
+            return row["value"] if row else None
+
+        return await self._run(query)
+
+    async def apply(self, rows, deleted_ids, state):
+        """Upsert changed rows and delete removed ids in one transaction; returns (upserted, deleted)."""
+        def write():
+            conn = self._db()
+            upserted = 0
+            with conn:
+                self._add_columns(conn, rows)
+                for row in rows:
+                    row = {k: v for k, v in row.items() if k in self._columns}
+                    row_hash = hashlib.sha1(json.dumps(row, sort_keys=True, default=str).encode()).hexdigest()
+                    stored = conn.execute("SELECT row_hash FROM dog_sync WHERE id = ?", (str(row["id"]),)).fetchone()
+                    if stored and stored["row_hash"] == row_hash:
+                        continue
+                    cols = list(row)
+                    conn.execute(
+                        f"INSERT INTO dogs ({', '.join(cols)}) VALUES ({', '.join('?' * len(cols))}) "
+                        f"ON CONFLICT(id) DO UPDATE SET {', '.join(f'{c} = excluded.{c}' for c in cols if c != 'id')}",
+                        [row[c] if not isinstance(row[c], (dict, list)) else json.dumps(row[c]) for c in cols],
+                    )
+                    conn.execute("INSERT OR REPLACE INTO dog_sync VALUES (?, ?)", (str(row["id"]), row_hash))
+                    upserted += 1
+                for dog_id in deleted_ids:
+                    conn.execute("DELETE FROM dogs WHERE id = ?", (dog_id,))
+                    conn.execute("DELETE FROM dog_sync WHERE id = ?", (dog_id,))
+                for key, value in state.items():
+                    conn.execute("INSERT OR REPLACE INTO sync_state VALUES (?, ?)", (key, str(value)))
+            return upserted, len(deleted_ids)
+
+        return await self._run(write)
+
+    async def ids(self):
+        def query():
+            return {row["id"] for row in self._db().execute("SELECT id FROM dogs")}
+
+        return await self._run(query)
+
+
+async def sync_replica(store, repository=repo, cursor_column=DOG_SYNC_CURSOR):
+    """
+    Pull changes from Supabase into the SQLite replica; returns (upserted, deleted).
+
+    With `cursor_column` (e.g. an updated_at column) only rows changed since the last sync
+    are fetched, plus the id list to spot deletions. Without one every row is fetched and
+    only rows whose content hash changed are written.
+    """
+    start = time.perf_counter()
+    state = {"last_sync_at": time.time()}
+    if cursor_column:
+        since = await store.sync_state("cursor")
+        rows = await repository.dogs_changed_since(cursor_column, since)
+        remote_ids = await repository.dog_ids()
+        cursors = [row[cursor_column] for row in rows if row.get(cursor_column) is not None]
+        if cursors:
+            state["cursor"] = max(cursors)
+    else:
+        rows = await repository.all_dogs("*")
+        remote_ids = {str(row["id"]) for row in rows}
+
+    deleted = sorted(await store.ids() - remote_ids)
+    upserted, deleted = await store.apply(rows, deleted, state)
+    print(f"[Sync] {len(rows)} rows fetched, {upserted} updated, {deleted} deleted "
+          f"in {time.perf_counter() - start:.2f}s")
+    return upserted, deleted
+
+
+async def sync_forever(store, interval, on_change=None):
+    while True:
+        try:
+            if any(await sync_replica(store)) and on_change:
+                on_change()
+        except Exception as e:
+            print(f"[Sync] Failed, serving the local copy as is: {e}")
+        await asyncio.sleep(interval)
+
+
+def make_store(kind=DOG_STORE):
+    if kind not in STORES:
+        raise ValueError(f"Unknown DOG_STORE {kind!r}, expected one of {STORES}")
+    return SQLiteDogStore() if kind == "sqlite" else SupabaseDogStore(repo)
+
+
+store = make_store()
+
+
+if __name__ == "__main__":
+    async def main():
+        replica = store if isinstance(store, SQLiteDogStore) else SQLiteDogStore()
+        await sync_replica(replica)
+        await repo.close()
+
+    asyncio.run(main())
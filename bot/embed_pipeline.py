@@ -0,0 +1,95 @@
+# bot/embed_pipeline.py
+import multiprocessing
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+import numpy as np
+
+from bot.encoder import preprocess_bytes
+
+
+class PipelineStats:
+    def __init__(self, total, report_every):
+        self.total = total
+        self.report_every = report_every
+        self.done = 0
+        self.failed = 0
+        self.start = time.perf_counter()
+
+    @property
+    def rate(self):
+        elapsed = time.perf_counter() - self.start
+        return self.done / elapsed if elapsed > 0 else 0.0
+
+    def add(self, count, failed=0):
+        before = self.done
+        self.done += count
+        self.failed += failed
+        if self.report_every and self.done // self.report_every != before // self.report_every:
+            print(f"[Pipeline] {self.done}/{self.total} images, {self.rate:.1f} img/s, {self.failed} failed")
+
+    def summary(self):
+        elapsed = time.perf_counter() - self.start
+        print(f"[Pipeline] Done: {self.done - self.failed} embedded, {self.failed} failed "
+              f"in {elapsed:.1f}s ({self.rate:.1f} img/s)")
+
+
+def embed_files(paths, download, embed_batch, batch_size=32, download_workers=8,
+                decode_workers=None, max_in_flight=64, report_every=100):
+    """
+    Stream (path, embedding) pairs for `paths`, in order; failed images yield (path, None).
+
+    Downloads run in a thread pool, decoding/preprocessing in worker processes, and the model
+    gets stacked batches of `batch_size`. At most `max_in_flight` images are downloaded or
+    decoded ahead of the model, so memory stays flat no matter how large the bucket is.
+    Decode processes are spawned, not forked: this process already runs torch and download threads.
+    """
+    paths = list(paths)
+    stats = PipelineStats(len(paths), report_every)
+    pending = deque()
+    batch_paths, batch_arrays = [], []  # failed images stay in place with a None array
+
+    with ThreadPoolExecutor(max_workers=download_workers, thread_name_prefix="download") as downloads, \
+            ProcessPoolExecutor(max_workers=decode_workers, mp_context=multiprocessing.get_context("spawn")) as decoders:
+
+        def fetch(path):
+            # Runs in a download thread; hands the bytes straight to a decode process
+            return decoders.submit(preprocess_bytes, download(path))
+
+        def flush():
+            arrays = [arr for arr in batch_arrays if arr is not None]
+            embs = iter(embed_batch(np.stack(arrays)) if arrays else ())
+            results = [(path, None if arr is None else next(embs)) for path, arr in zip(batch_paths, batch_arrays)]
+            stats.add(len(arrays))
+            batch_paths.clear()
+            batch_arrays.clear()
+            return results
+
+        queued = iter(paths)
+        for path in queued:
+            pending.append((path, downloads.submit(fetch, path)))
+            if len(pending) >= max_in_flight:
+                break
+
+        while pending:
+            path, job = pending.popleft()
+            next_path = next(queued, None)
+            if next_path is not None:
+                pending.append((next_path, downloads.submit(fetch, next_path)))
+
+            try:
+                arr = job.result().result()
+            except Exception as e:
+                print(f"Skipping {path}: {e}")
+                stats.add(1, failed=1)
+                arr = None
+
+            batch_paths.append(path)
+            batch_arrays.append(arr)
+            if arr is not None and sum(a is not None for a in batch_arrays) >= batch_size:
+                yield from flush()
+
+        yield from flush()
+
+    stats.summary()
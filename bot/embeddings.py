@@ -1,63 +1,62 @@
 import os
 import numpy as np
-import torch
-import torchvision.models as models
-import torchvision.transforms as T
 import faiss
-from supabase import create_client, Client
 from PIL import Image
 import io
+from bot.db import get_supabase
+from bot.embed_pipeline import embed_files
+from bot import index_factory, photo_manifest
+from bot.encoder import get_encoder, embedding_info
+from kas_config import EMBEDDING_MODEL
 
-from dotenv import load_dotenv
-import os
-
-# --- Load environment variables ---
-load_dotenv()
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_KEY = os.getenv("SUPABASE_KEY")
+# --- Storage (the client is created on the first call, see bot/db.py) ---
 BUCKET_NAME = "kas.dogs"  # your bucket name
 
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
-
-# --- Load ResNet50 once ---
-_model = models.resnet50(weights=models.ResNet50_Weights.DEFAULT)
-_model.fc = torch.nn.Identity()  # remove classification head
-_model.eval()
-
-# --- Image transforms ---
-_transform = T.Compose([
-    T.Resize((224, 224)),
-    T.ToTensor(),
-    T.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225])
-])
-
-def get_embedding(img):
-    img_tensor = _transform(img).unsqueeze(0)
-    with torch.no_grad():
-        emb = _model(img_tensor).numpy()
-    return emb.squeeze()
+# --- Output files (read by bot/recognition.py) ---
+BASE_DIR = os.path.dirname(__file__)
+INDEX_PATH = index_factory.INDEX_PATH
+LABELS_PATH = index_factory.LABELS_PATH
+MANIFEST_PATH = index_factory.MANIFEST_PATH
+CACHE_PATH = os.path.join(BASE_DIR, "dog_embeddings.npz")  # embedding store for incremental builds
+LIST_PAGE_SIZE = 100
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+
+# --- Embeddings (shared backend, see bot/encoder.py) ---
+def get_embedding(img, model_name=EMBEDDING_MODEL):
+    return get_encoder(model_name).embed_images([img])[0]
+
+def list_all_objects(path=""):
+    """Recursively list all files in a Supabase bucket as {path: version} (etag or updated_at)."""
+    objects = {}
+    offset = 0
+    while True:
+        items = get_supabase().storage.from_(BUCKET_NAME).list(path, {"limit": LIST_PAGE_SIZE, "offset": offset})
+
+        for item in items:
+            # If item has no id → it's a folder
+            if item.get("id") is None:
+                sub_path = f"{path}{item['name']}" if path == "" else f"{path}/{item['name']}"
+                objects.update(list_all_objects(sub_path))
+            else:
+                # Build full path
+                file_path = f"{path}/{item['name']}" if path else item["name"]
+                meta = item.get("metadata") or {}
+                objects[file_path] = str(meta.get("eTag") or item.get("updated_at") or "")
+
+        if len(items) < LIST_PAGE_SIZE:
+            return objects
+        offset += LIST_PAGE_SIZE
 
 def list_all_files(path=""):
     """Recursively list all files in a Supabase bucket, with correct paths."""
-    all_files = []
-    items = supabase.storage.from_(BUCKET_NAME).list(path)
-
-    for item in items:
-        # If item has no id → it's a folder
-        if item.get("id") is None:
-            sub_path = f"{path}{item['name']}" if path == "" else f"{path}/{item['name']}"
-            all_files.extend(list_all_files(sub_path))
-        else:
-            # Build full path
-            file_path = f"{path}/{item['name']}" if path else item["name"]
-            all_files.append(file_path)
+    return list(list_all_objects(path))
 
-    return all_files
+def download_image(file_path) -> bytes:
+    return get_supabase().storage.from_(BUCKET_NAME).download(file_path)
 
 def get_image_from_supabase(file_path):
     """Download image from Supabase and return PIL.Image"""
-    response = supabase.storage.from_(BUCKET_NAME).download(file_path)
-    data = io.BytesIO(response)
+    data = io.BytesIO(download_image(file_path))
     return Image.open(data).convert("RGB")
 
 if __name__ == "__main__":
@@ -65,33 +64,184 @@ if __name__ == "__main__":
     for f in files[:20]:
         print("Found file:", f)
 
-def build_index_from_supabase():
+# --- Embedding store: one row per storage object, id = FAISS id ---
+def load_embedding_cache(path=CACHE_PATH, model_name=EMBEDDING_MODEL):
+    """Return {file_path: (id, version, embedding)} from the local embedding store."""
+    if not os.path.exists(path):
+        return {}
+    data = np.load(path)
+    stored = str(data["model"]) if "model" in data else None
+    if stored != model_name or int(data.get("embedding_version", -1)) != embedding_info(model_name)["version"]:
+        print(f"Embedding store was built with {stored}, not {model_name}; re-embedding everything.")
+        return {}
+    return {
+        file_path: (int(idx), version, emb)
+        for file_path, idx, version, emb in zip(data["paths"], data["ids"], data["versions"], data["embeddings"])
+    }
+
+def save_embedding_cache(cache, path=CACHE_PATH, model_name=EMBEDDING_MODEL):
+    paths = sorted(cache, key=lambda p: cache[p][0])
+    tmp_path = path + ".tmp.npz"
+    np.savez(
+        tmp_path,
+        model=np.array(model_name),
+        embedding_version=np.array(embedding_info(model_name)["version"]),
+        paths=np.array(paths, dtype=str),
+        ids=np.array([cache[p][0] for p in paths], dtype="int64"),
+        versions=np.array([cache[p][1] for p in paths], dtype=str),
+        embeddings=np.vstack([cache[p][2] for p in paths]).astype("float32"),
+    )
+    os.replace(tmp_path, path)
+
+def label_for(file_path):
+    return file_path.split("/")[0]
+
+def build_labels(cache):
+    """Labels are indexed by FAISS id; ids freed by deleted images map to an empty label."""
+    size = max(idx for idx, _, _ in cache.values()) + 1
+    labels = np.full(size, "", dtype=object)
+    for file_path, (idx, _, _) in cache.items():
+        labels[idx] = label_for(file_path)
+    return labels.astype(str)
+
+def load_id_index(expected_size, spec):
+    """Return the saved ID-mapped index if it matches the embedding store and spec, else None."""
+    if not os.path.exists(INDEX_PATH) or not expected_size:
+        return None
+    manifest = index_factory.read_manifest(MANIFEST_PATH)
+    if (manifest["index_type"], manifest["metric"]) != (spec["index_type"], spec["metric"]):
+        print(f"Switching index type {manifest['index_type']}/{manifest['metric']} -> "
+              f"{spec['index_type']}/{spec['metric']}, rebuilding it.")
+        return None
+    # Trained indexes (IVF/PQ) are retrained once the collection outgrows their training set
+    if expected_size > 4 * manifest.get("trained_on", expected_size):
+        print("Collection grew well past the index training set, rebuilding it.")
+        return None
+    index = faiss.read_index(INDEX_PATH)
+    if not isinstance(index, faiss.IndexIDMap2) or index.ntotal != expected_size:
+        print("Saved index does not match the embedding store, rebuilding it.")
+        return None
+    index_factory.configure_search(index, spec)
+    return index
+
+def index_from_cache(cache, spec):
+    ids = np.array([idx for idx, _, _ in cache.values()], dtype="int64")
+    embeddings = np.vstack([emb for _, _, emb in cache.values()]).astype("float32")
+    return index_factory.build_index(spec, embeddings, ids)
+
+def build_index_from_supabase(incremental=True, batch_size=32, download_workers=8, decode_workers=None, spec=None,
+                              model_name=EMBEDDING_MODEL, false_accept=index_factory.CALIBRATION_FALSE_ACCEPT):
+    """
+    Build the FAISS index from every image in the bucket.
+    In incremental mode only new or changed objects are downloaded and embedded;
+    deleted ones are removed from the index by id.
+    Images go through the streaming pipeline in bot/embed_pipeline.py.
+    `spec` (see bot/index_factory.py) picks the index type; default is flat L2.
+    `model_name` picks the embedding model (see bot/encoder.py); it is recorded in the manifest.
+    `false_accept` sets the calibrated "no match" cutoff (None = equal error rate).
+    """
+    spec = spec or index_factory.make_spec()
     print("Listing all images in Supabase bucket...")
-    file_list = list_all_files()
-    if not file_list:
+    objects = {
+        path: version for path, version in list_all_objects().items()
+        if path.lower().endswith(IMAGE_EXTENSIONS)
+    }
+    if not objects:
         print("No images found.")
         return None, None
 
-    embeddings, labels = [], []
-    for file_path in file_list:
-        try:
-            img = get_image_from_supabase(file_path)
-            emb = get_embedding(img)
-            embeddings.append(emb)
-            labels.append(file_path.split("/")[0])
-        except Exception as e:
-            print(f"Skipping {file_path}: {e}")
-
-    embeddings = np.vstack(embeddings).astype("float32")
-    index = faiss.IndexFlatL2(embeddings.shape[1])
-    index.add(embeddings)
-
-    # Save index + labels
-    faiss.write_index(index, "dog_index.faiss")
-    np.save("dog_labels.npy", np.array(labels))
-    
-    print(f"✅ Built FAISS index with {len(labels)} images.")
+    # The catalog reads cover photos from this instead of listing every folder
+    try:
+        photo_manifest.publish(get_supabase(), BUCKET_NAME, objects)
+    except Exception as e:
+        print(f"Could not publish the photo manifest: {e}")
+
+    cache = load_embedding_cache(CACHE_PATH, model_name=model_name) if incremental else {}
+    stale = [p for p in cache if p not in objects or cache[p][1] != objects[p]]
+    todo = [p for p in objects if p not in cache or cache[p][1] != objects[p]]
+    print(f"{len(objects)} images: {len(todo)} to embed, {len(stale)} stale, {len(cache) - len(stale)} cached.")
+
+    index = load_id_index(len(cache), spec)
+    trained_on = index_factory.read_manifest(MANIFEST_PATH).get("trained_on", len(cache)) if index else None
+
+    # Changed images keep their id, deleted ones free it
+    removed_ids = np.array([cache[p][0] for p in stale], dtype="int64")
+    reused_ids = {p: cache[p][0] for p in stale if p in objects}
+    for p in stale:
+        del cache[p]
+
+    next_id = max([idx for idx, _, _ in cache.values()] + list(reused_ids.values()) + [-1]) + 1
+    new_ids, new_embs = [], []
+    embedded = embed_files(
+        todo, download_image, get_encoder(model_name).embed_arrays,
+        batch_size=batch_size, download_workers=download_workers, decode_workers=decode_workers,
+    )
+    for file_path, emb in embedded:
+        if emb is None:
+            continue
+        if file_path in reused_ids:
+            idx = reused_ids[file_path]
+        else:
+            idx, next_id = next_id, next_id + 1
+        cache[file_path] = (idx, objects[file_path], emb)
+        new_ids.append(idx)
+        new_embs.append(emb)
+
+    if not cache:
+        print("No embeddings could be computed.")
+        return None, None
+
+    can_remove = spec["index_type"] in index_factory.REMOVABLE_TYPES
+    if index is None or (new_embs and index.d != new_embs[0].shape[0]) or (len(removed_ids) and not can_remove):
+        index = index_from_cache(cache, spec)
+        trained_on = len(cache)
+    else:
+        if len(removed_ids):
+            index.remove_ids(removed_ids)
+        if new_embs:
+            index_factory.add_vectors(index, spec, np.vstack(new_embs), new_ids)
+
+    # Save index + labels + manifest, then the store they were derived from
+    labels = build_labels(cache)
+    match = index_factory.calibrate_threshold(index, labels, spec, false_accept)
+    if match is None:
+        print("⚠️ Too few different dogs to calibrate the match threshold; set MATCH_MAX_DISTANCE to serve this index.")
+    manifest = index_factory.manifest_for(spec, index, trained_on=trained_on, embedding=embedding_info(model_name),
+                                          match=match)
+    index_factory.write_index_files(index, labels, manifest, INDEX_PATH, LABELS_PATH)
+    save_embedding_cache(cache, CACHE_PATH, model_name=model_name)
+
+    print(f"✅ FAISS index has {index.ntotal} images ({len(new_embs)} embedded, {len(removed_ids)} removed).")
     return index, labels
 
 if __name__ == "__main__":
-    build_index_from_supabase()
+    import argparse
+    from kas_config import INDEX_TYPE, INDEX_METRIC
+    from bot.encoder import MODELS
+    parser = argparse.ArgumentParser(description="Build the dog FAISS index from Supabase Storage.")
+    parser.add_argument("--full", action="store_true", help="ignore the embedding store and re-embed everything")
+    parser.add_argument("--batch-size", type=int, default=32, help="images per model forward pass")
+    parser.add_argument("--download-workers", type=int, default=8, help="concurrent Storage downloads")
+    parser.add_argument("--decode-workers", type=int, default=None, help="decode processes (default: CPU count)")
+    parser.add_argument("--index-type", choices=index_factory.INDEX_TYPES, default=INDEX_TYPE)
+    parser.add_argument("--metric", choices=index_factory.METRICS, default=INDEX_METRIC)
+    parser.add_argument("--model", choices=tuple(MODELS), default=EMBEDDING_MODEL, help="embedding model")
+    parser.add_argument("--nlist", type=int, help="IVF cells")
+    parser.add_argument("--nprobe", type=int, help="IVF cells searched per query")
+    parser.add_argument("--hnsw-m", type=int, help="HNSW graph degree")
+    parser.add_argument("--ef-search", type=int, help="HNSW search depth")
+    parser.add_argument("--pq-m", type=int, help="PQ sub-quantizers")
+    parser.add_argument("--false-accept", type=float, help="impostor rate for the match threshold (default: equal error rate)")
+    args = parser.parse_args()
+    build_index_from_supabase(
+        incremental=not args.full,
+        batch_size=args.batch_size,
+        download_workers=args.download_workers,
+        decode_workers=args.decode_workers,
+        spec=index_factory.make_spec(
+            args.index_type, args.metric,
+            nlist=args.nlist, nprobe=args.nprobe, hnsw_m=args.hnsw_m, ef_search=args.ef_search, pq_m=args.pq_m,
+        ),
+        model_name=args.model,
+        false_accept=args.false_accept,
+    )
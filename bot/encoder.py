@@ -0,0 +1,340 @@
+# bot/encoder.py
+"""
+The single embedding backend used to build and to query the index.
+
+Model name, dimension, version and preprocessing are written into the index manifest
+(see bot/index_factory.py) and checked when the index is loaded, so a query can never be
+embedded differently from the photos it is compared against. Preprocessing here is
+torch-free so index-build worker processes can use it without loading the model.
+"""
+import io
+import json
+import os
+import threading
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+from kas_config import EMBEDDING_BACKEND, EMBEDDING_THREADS, EMBEDDING_PARITY_MIN_COSINE
+
+# Bump when preprocessing or feature extraction changes in a way that alters embeddings
+EMBEDDING_VERSION = 1
+
+# fp32 PyTorch, frozen TorchScript, ONNX Runtime fp32, ONNX Runtime with dynamic int8 weights
+BACKENDS = ("torch", "torchscript", "onnx", "onnx-int8")
+MODEL_DIR = os.path.join(os.path.dirname(__file__), "models")  # exported ONNX files
+
+MODELS = {
+    # name: (torchvision builder, weights enum, embedding dimension)
+    "resnet18": ("resnet18", "ResNet18_Weights", 512),
+    "resnet50": ("resnet50", "ResNet50_Weights", 2048),
+}
+
+# --- Preprocessing (equivalent to T.Resize + T.ToTensor + T.Normalize) ---
+INPUT_SIZE = (224, 224)
+MEAN = [0.485, 0.456, 0.406]
+STD = [0.229, 0.224, 0.225]
+PREPROCESSING = {"resize": list(INPUT_SIZE), "interpolation": "bilinear", "mean": MEAN, "std": STD}
+
+# What indexes built before embedding versioning used: full-size decode, then torchvision T.Resize
+LEGACY_PREPROCESSING = dict(PREPROCESSING, decode="full", resize_impl="torchvision")
+
+_MEAN = np.array(MEAN, dtype="float32").reshape(3, 1, 1)
+_STD = np.array(STD, dtype="float32").reshape(3, 1, 1)
+
+
+def load_image(source):
+    """
+    Decode a photo from a file path, raw bytes, a file-like object or a PIL image.
+    JPEGs are decoded at a reduced scale (draft mode) that still covers the model input size.
+    """
+    try:
+        if isinstance(source, Image.Image):
+            img = source
+        else:
+            if isinstance(source, (bytes, bytearray, memoryview)):
+                source = io.BytesIO(source)
+            img = Image.open(source)
+            img.draft("RGB", INPUT_SIZE)
+        return img.convert("RGB")
+    except Exception as e:
+        name = source if isinstance(source, str) else type(source).__name__
+        print(f"[Encoder] Failed to open image {name}: {e}")
+        return None
+
+
+def preprocess(img: Image.Image) -> np.ndarray:
+    """Resize and normalize an RGB image into a CHW float32 array."""
+    img = img.convert("RGB").resize(INPUT_SIZE, Image.BILINEAR)
+    arr = np.asarray(img, dtype="float32").transpose(2, 0, 1) / 255.0
+    return (arr - _MEAN) / _STD
+
+
+def preprocess_bytes(data: bytes) -> np.ndarray:
+    img = load_image(data)
+    if img is None:
+        raise ValueError("could not decode image")
+    return preprocess(img)
+
+
+# --- Manifest ---
+def embedding_info(model_name):
+    if model_name not in MODELS:
+        raise ValueError(f"Unknown embedding model {model_name!r}, expected one of {tuple(MODELS)}")
+    _, weights, dim = MODELS[model_name]
+    return {
+        "model": model_name,
+        "weights": f"{weights}.DEFAULT",
+        "dim": dim,
+        "version": EMBEDDING_VERSION,
+        "preprocessing": PREPROCESSING,
+    }
+
+
+def legacy_embedding_info(model_name):
+    """Embedding info of an index built before versioning: version 0, the old preprocessing."""
+    return dict(embedding_info(model_name), version=0, legacy=True, preprocessing=LEGACY_PREPROCESSING)
+
+
+def manifest_embedding(manifest):
+    """
+    Embedding info recorded in an index manifest. Indexes built before manifests carried it
+    are identified by their dimension and marked legacy.
+    """
+    if "embedding" in manifest:
+        return manifest["embedding"]
+    by_dim = [name for name, (_, _, dim) in MODELS.items() if dim == manifest.get("dim")]
+    if not by_dim:
+        raise ValueError(f"Index has no embedding info and no known model has dim {manifest.get('dim')}")
+    return legacy_embedding_info(by_dim[0])
+
+
+def check_manifest(manifest, dim):
+    """
+    Raise ValueError unless the index was built with an embedding this code can reproduce.
+    Legacy indexes are still served, with a warning: queries are decoded and resized
+    slightly differently from their photos, which costs some accuracy.
+    """
+    info = manifest_embedding(manifest)
+    expected = embedding_info(info["model"])
+    if info.get("legacy"):
+        if dim != expected["dim"]:
+            raise ValueError(f"Index has dim {dim} but {info['model']} embeddings have dim {expected['dim']}")
+        print(f"[Encoder] ⚠️ Legacy index: built before embedding version {EMBEDDING_VERSION} "
+              f"(full-size decode, torchvision Resize), queries use the current preprocessing. "
+              f"Rebuild it with `python -m bot.embeddings --full`.")
+        return info
+    for key in ("dim", "version", "preprocessing"):
+        if info.get(key) != expected[key]:
+            raise ValueError(f"Index built with {key}={info.get(key)!r}, this code uses {expected[key]!r}; rebuild it")
+    if dim != expected["dim"]:
+        raise ValueError(f"Index has dim {dim} but {info['model']} embeddings have dim {expected['dim']}")
+    return info
+
+
+# --- Model ---
+def _torch_model(model_name, device="cpu"):
+    import torch
+    import torchvision.models as models
+
+    builder, weights, _ = MODELS[model_name]
+    model = getattr(models, builder)(weights=getattr(models, weights).DEFAULT)
+    model.fc = torch.nn.Identity()  # Remove classification head
+    return model.to(device).eval()
+
+
+def parity(reference: np.ndarray, candidate: np.ndarray):
+    """Worst-case cosine similarity and max abs difference between two embedding batches."""
+    ref = reference / np.linalg.norm(reference, axis=1, keepdims=True)
+    cand = candidate / np.linalg.norm(candidate, axis=1, keepdims=True)
+    return float((ref * cand).sum(axis=1).min()), float(np.abs(reference - candidate).max())
+
+
+def parity_batch(count=8, seed=0):
+    """
+    Deterministic photo-like inputs: smooth colour fields with shapes, edges and grain, run
+    through the real preprocessing. Int8 quantization error depends on activation ranges,
+    which Gaussian noise in tensor space does not reproduce.
+    """
+    rng = np.random.default_rng(seed)
+    batch = []
+    for _ in range(count):
+        coarse = rng.integers(0, 256, (rng.integers(2, 8), rng.integers(2, 8), 3), dtype=np.uint8)
+        img = Image.fromarray(coarse).resize((320, 240), Image.BICUBIC)
+        draw = ImageDraw.Draw(img)
+        for _ in range(6):
+            x, y = rng.integers(0, 320), rng.integers(0, 240)
+            w, h = rng.integers(10, 160), rng.integers(10, 120)
+            shape = draw.ellipse if rng.random() < 0.5 else draw.rectangle
+            shape((x, y, x + w, y + h), fill=tuple(int(c) for c in rng.integers(0, 256, 3)))
+        grain = rng.normal(0, 8, (240, 320, 3))
+        img = Image.fromarray(np.clip(np.asarray(img, dtype="float32") + grain, 0, 255).astype(np.uint8))
+        batch.append(preprocess(img))
+    return np.stack(batch)
+
+
+def check_parity(backend, reference, candidate, min_cosine):
+    cosine, max_diff = parity(reference, candidate)
+    print(f"[Encoder] {backend} parity vs fp32: min cosine {cosine:.5f}, max abs diff {max_diff:.4f}")
+    if cosine < min_cosine:
+        raise RuntimeError(f"{backend} embeddings drift too far from fp32 (cosine {cosine:.4f} < {min_cosine})")
+    return cosine
+
+
+def weights_id(model_name):
+    """The torchvision checkpoint URL, which carries a hash of the weights file."""
+    import torchvision.models as models
+
+    return getattr(models, MODELS[model_name][1]).DEFAULT.url
+
+
+def onnx_path(model_name, backend):
+    suffix = ".int8.onnx" if backend == "onnx-int8" else ".onnx"
+    return os.path.join(MODEL_DIR, model_name + suffix)
+
+
+def _read_stamp(path):
+    """What an exported file was made from and how it compared to fp32 ({} if unknown)."""
+    try:
+        with open(path + ".json") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_stamp(path, **stamp):
+    with open(path + ".json", "w") as f:
+        json.dump(stamp, f, indent=2)
+
+
+def export_onnx(model_name, backend, min_cosine=EMBEDDING_PARITY_MIN_COSINE):
+    """
+    Export (and for onnx-int8 quantize) the model, keeping the file only if its embeddings
+    stay within `min_cosine` of the fp32 PyTorch model. A stamp next to the file records the
+    weights it came from and its parity, so an existing file is re-exported and checked
+    again when torchvision ships other weights.
+    """
+    import torch
+
+    path = onnx_path(model_name, backend)
+    weights = weights_id(model_name)
+    stamp = _read_stamp(path)
+    if os.path.exists(path) and stamp.get("weights") == weights and stamp.get("cosine", -1) >= min_cosine:
+        return path
+
+    os.makedirs(MODEL_DIR, exist_ok=True)
+    model = _torch_model(model_name)
+    fp32_path = onnx_path(model_name, "onnx")
+    if not os.path.exists(fp32_path) or _read_stamp(fp32_path).get("weights") != weights:
+        print(f"[Encoder] Exporting {model_name} to {fp32_path}...")
+        torch.onnx.export(
+            model, torch.zeros(1, 3, *INPUT_SIZE), fp32_path + ".tmp",
+            input_names=["input"], output_names=["embedding"],
+            dynamic_axes={"input": {0: "batch"}, "embedding": {0: "batch"}},
+            opset_version=17, dynamo=False,
+        )
+        os.replace(fp32_path + ".tmp", fp32_path)
+        _write_stamp(fp32_path, weights=weights)
+
+    if backend == "onnx-int8":
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+
+        print(f"[Encoder] Quantizing {model_name} weights to int8...")
+        quantize_dynamic(fp32_path, path + ".tmp", weight_type=QuantType.QUInt8)
+        os.replace(path + ".tmp", path)
+
+    batch = parity_batch()
+    with torch.no_grad():
+        reference = model(torch.from_numpy(batch)).numpy()
+    candidate = _onnx_session(path, threads=EMBEDDING_THREADS).run(None, {"input": batch})[0]
+    try:
+        cosine = check_parity(backend, reference, candidate, min_cosine)
+    except RuntimeError:
+        os.remove(path)
+        raise
+    _write_stamp(path, weights=weights, cosine=cosine)
+    return path
+
+
+def _onnx_session(path, threads=0):
+    try:
+        import onnxruntime as ort
+    except ImportError as e:
+        raise RuntimeError("The onnx backends need onnxruntime: pip install onnxruntime") from e
+
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    if threads:
+        options.intra_op_num_threads = threads
+    return ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+
+
+class Encoder:
+    """A torchvision backbone with its classification head removed, run on the chosen backend."""
+
+    def __init__(self, model_name, device=None, backend=EMBEDDING_BACKEND, threads=EMBEDDING_THREADS):
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown embedding backend {backend!r}, expected one of {BACKENDS}")
+        _, _, dim = MODELS[model_name]
+        self.model_name = model_name
+        self.dim = dim
+        self.info = embedding_info(model_name)
+        try:
+            self._load(backend, device, threads)
+        except Exception as e:
+            if backend == "torch":
+                raise
+            # Embeddings must match the index; the fp32 model always does, only slower
+            print(f"[Encoder] ⚠️ {backend} backend unusable for {model_name} ({e}), FALLING BACK to torch fp32")
+            self._load("torch", device, threads)
+        print(f"[Encoder] Loaded {model_name} ({dim}-d) with {self.backend} on {self.device}")
+
+    def _load(self, backend, device, threads):
+        self.backend = backend
+        if backend.startswith("onnx"):
+            self.device = "cpu"
+            self._session = _onnx_session(export_onnx(self.model_name, backend), threads)
+            return
+
+        import torch
+
+        if threads:
+            torch.set_num_threads(threads)
+        self.device = torch.device(device or ("cuda" if torch.cuda.is_available() else "cpu"))
+        self.model = _torch_model(self.model_name, self.device)
+        if backend == "torchscript":
+            with torch.no_grad():
+                traced = torch.jit.trace(self.model, torch.zeros(1, 3, *INPUT_SIZE, device=self.device))
+                traced = torch.jit.optimize_for_inference(torch.jit.freeze(traced))
+                batch = torch.from_numpy(parity_batch()).to(self.device)
+                check_parity(backend, self.model(batch).cpu().numpy(), traced(batch).cpu().numpy(),
+                             EMBEDDING_PARITY_MIN_COSINE)
+            self.model = traced
+
+    def embed_arrays(self, batch: np.ndarray) -> np.ndarray:
+        """Embed a stacked (N, 3, 224, 224) batch of preprocessed images in one forward pass."""
+        batch = np.ascontiguousarray(batch, dtype="float32")
+        if self.backend.startswith("onnx"):
+            return self._session.run(None, {"input": batch})[0].astype("float32")
+
+        import torch
+
+        with torch.no_grad():
+            emb = self.model(torch.from_numpy(batch).to(self.device)).cpu().numpy()
+        return emb.astype("float32")
+
+    def embed_images(self, images) -> np.ndarray:
+        return self.embed_arrays(np.stack([preprocess(img) for img in images]))
+
+
+_encoders = {}
+_encoders_lock = threading.Lock()
+
+
+def get_encoder(model_name, backend=EMBEDDING_BACKEND):
+    """Load each model once per process."""
+    with _encoders_lock:
+        key = (model_name, backend)
+        if key not in _encoders:
+            _encoders[key] = Encoder(model_name, backend=backend)
+        return _encoders[key]
@@ -1,28 +1,27 @@
-import re
-import requests
-import os
-import tempfile
 from aiogram import types
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
-from aiogram.types import InputMediaPhoto
 from bot.loader import dp, bot               
 from bot.utils.helpers import clean_text, escape_md  
-from bot.db import supabase              
-from bot.main import get_categories     
+from bot.repository import repo
+from bot.telegram_files import send_stored_photo, send_stored_media_group
 from bot.utils.show_dogs import show_dogs_by_filters
+from bot.catalog_snapshot import catalog
 from bot.utils.helpers import create_collage
-from bot.state import user_dog_profiles, user_dog_index, profile_cache, recognized_dog_photos
-from bot.utils.helpers import create_placeholder_image
+from bot.state import sessions, BROWSE
+from bot.metrics import metrics
+from bot.utils.helpers import placeholder_image
 from bot.handlers.start import back_to_menu
 from bot.utils.show_dogs import get_dog_by_id
-from PIL import Image
-import aiohttp
 from io import BytesIO
 
 @dp.callback_query_handler(lambda c: c.data == 'catalog')
 async def handle_catalog_callback(callback_query: types.CallbackQuery):
     await bot.answer_callback_query(callback_query.id)
-    categories = get_categories()
+    try:
+        categories = (await catalog.get()).categories
+    except Exception as e:
+        print(f"Error fetching categories: {e}")
+        categories = []
     if not categories:
         await bot.send_message(callback_query.from_user.id, "📍 No categories available.")
         return
@@ -63,8 +62,7 @@ async def handle_category(callback_query: types.CallbackQuery):
     if category.lower() == "shelter":
         # Step 1: Show plan image
         try:
-            res = supabase.storage.from_('kas.dogs').get_public_url("Shelter_plan.jpg")
-            image_url = res.get("publicURL") if isinstance(res, dict) else res
+            image_url = repo.public_url("Shelter_plan.jpg")
 
             if image_url:
                 caption_text = escape_md("🗺️ Shelter Plan\nUse this map to find the sector you're interested in.")
@@ -81,13 +79,7 @@ async def handle_category(callback_query: types.CallbackQuery):
             await bot.send_message(callback_query.from_user.id, "⚠️ Shelter plan not available.")
 
         # Step 2: Fetch sector list and build 3-column keyboard
-        response = supabase.table("dogs") \
-            .select("sector") \
-            .eq("category", category) \
-            .neq("sector", None) \
-            .execute()
-
-        sectors = sorted(set(row["sector"] for row in response.data)) if response.data else []
+        sectors = (await catalog.get()).sectors(category)
 
         keyboard = InlineKeyboardMarkup(row_width=3)  # 3 columns
 
@@ -112,17 +104,7 @@ async def handle_sector(callback_query: types.CallbackQuery):
     await bot.answer_callback_query(callback_query.id)
     sector = callback_query.data[len("sector_") :]
 
-    response = supabase.table("dogs") \
-        .select("pen") \
-        .eq("category", "shelter") \
-        .eq("sector", sector) \
-        .neq("pen", None) \
-        .execute()
-
-    def natural_sort_key(s):
-        return [int(text) if text.isdigit() else text.lower() for text in re.split(r'(\d+)', s)]
-
-    pens = sorted({row["pen"] for row in response.data}, key=natural_sort_key) if response.data else []
+    pens = (await catalog.get()).pens("shelter", sector)  # already in natural order
 
     if not pens or len(pens) == 1:
         pen = pens[0] if pens else None
@@ -150,22 +132,24 @@ async def handle_pen(callback_query: types.CallbackQuery):
 @dp.callback_query_handler(lambda c: c.data == "show_profile_")
 async def show_filtered_profiles(callback_query: types.CallbackQuery):
     user_id = callback_query.from_user.id
-    filtered_profiles = user_dog_profiles.get(user_id, [])
+    session = await sessions.get(user_id, BROWSE)
+    dog_ids = session["dogs"] if session else []
 
-    if not filtered_profiles:
+    if not dog_ids:
         await callback_query.answer("No profiles found.", show_alert=True)
         return
 
     keyboard = InlineKeyboardMarkup(row_width=2)
 
-    for text, dog_id, photo_list, filter_key in filtered_profiles:
-        first_line = text.split("\n")[0]
-        dog_name_match = re.match(r"🐶 \*(.*)\*", first_line)
-        
+    for dog_id in dog_ids:
+        dog = await get_dog_by_id(dog_id)
+        if not dog:
+            continue
+
         # 🛠️ Updated logic to handle unnamed dogs
-        raw_name = dog_name_match.group(1).strip() if dog_name_match else ""
+        raw_name = (dog.get('name') or "").strip()
         dog_name = raw_name if raw_name else "** unnamed**"
-        
+
         keyboard.insert(InlineKeyboardButton(dog_name, callback_data=f"dog_{dog_id}"))
 
     await callback_query.message.edit_text(
@@ -174,9 +158,11 @@ async def show_filtered_profiles(callback_query: types.CallbackQuery):
     )
 
 @dp.callback_query_handler(lambda c: c.data.startswith("dog_"))
+@metrics.timed("profile.total")
 async def show_dog_profile_handler(callback_query: types.CallbackQuery):
     dog_id = callback_query.data.split("_")[1]
-    dog = await get_dog_by_id(dog_id)  
+    with metrics.span("profile.lookup"):
+        dog = await get_dog_by_id(dog_id)
 
     if not dog:
         await callback_query.answer("Dog not found.", show_alert=True)
@@ -196,48 +182,31 @@ async def show_dog_profile_handler(callback_query: types.CallbackQuery):
         f"📜 {escape_md(dog.get('description', 'No description yet'))}"
     )
 
-    photo_path = None
-
-    photos_response = supabase.storage.from_('kas.dogs').list(str(dog_id), {"limit": 100})
-    if photos_response:
-        photo_filenames = [
-            file['name'] for file in photos_response
-            if file['name'].lower().endswith(('.jpg', '.jpeg', '.png'))
-        ]
-        if photo_filenames:
-            first_photo = photo_filenames[0]
-            res = supabase.storage.from_('kas.dogs').get_public_url(f"{dog_id}/{first_photo}")
-            url = res.get("publicURL") if isinstance(res, dict) else res
-
-            if url:
-                try:
-                    img_data = requests.get(url, timeout=10).content
-                    photo_path = os.path.join(tempfile.gettempdir(), f"{dog_id}_{first_photo}")
-                    with open(photo_path, "wb") as f:
-                        f.write(img_data)
-                except Exception as e:
-                    print(f"[ERROR] Downloading image {first_photo}: {e}")
-
-    if not photo_path:
-        photo_path = create_placeholder_image(dog['name'])
-
-    if photo_path and os.path.exists(photo_path):
+    with metrics.span("profile.photo_list"):
+        photo_filenames = await repo.photos(dog_id)
+    sent = False
+    if photo_filenames:
+        # Resent by file_id when Telegram already has it, else uploaded from the thumbnail cache
+        path = f"{dog_id}/{photo_filenames[0]}"
         try:
-            with open(photo_path, "rb") as photo_file:
-                await bot.send_photo(
-                    callback_query.from_user.id,
-                    photo=photo_file,
-                    caption=text,
-                    parse_mode="MarkdownV2",
-                    reply_markup=profile_kb
+            with metrics.span("profile.send"):
+                await send_stored_photo(
+                    callback_query.from_user.id, path, repo.photo_version(path), "profile",
+                    lambda: repo.thumbnail(path, "profile"),
+                    caption=text, parse_mode="MarkdownV2", reply_markup=profile_kb,
                 )
-        finally:
-            if os.path.exists(photo_path):
-                os.remove(photo_path)
-    else:
-        await bot.send_message(
+            sent = True
+        except Exception as e:
+            print(f"[ERROR] Sending image {path}: {e}")
+
+    if not sent:
+        photo = BytesIO()
+        placeholder_image(dog['name']).save(photo, format="JPEG")
+        photo.seek(0)
+        await bot.send_photo(
             callback_query.from_user.id,
-            text,
+            photo=photo,
+            caption=text,
             parse_mode="MarkdownV2",
             reply_markup=profile_kb
         )
@@ -247,6 +216,7 @@ async def show_dog_profile_handler(callback_query: types.CallbackQuery):
 
 
 @dp.callback_query_handler(lambda c: c.data.startswith("more_photos_"))
+@metrics.timed("gallery.total")
 async def show_more_photos(callback_query: types.CallbackQuery):
     await bot.answer_callback_query(callback_query.id)
     wait_msg = await bot.send_message(callback_query.from_user.id, "⏳ Please wait...")
@@ -255,11 +225,8 @@ async def show_more_photos(callback_query: types.CallbackQuery):
 
     # Step 1: Get up to 10 filenames from Supabase storage
     try:
-        response = supabase.storage.from_('kas.dogs').list(str(dog_id), {"limit": 10})
-        photo_filenames = [
-            file['name'] for file in response
-            if file['name'].lower().endswith(('.jpg', '.jpeg', '.png'))
-        ]
+        with metrics.span("gallery.photo_list"):
+            photo_filenames = (await repo.photos(dog_id))[:10]
     except Exception as e:
         await wait_msg.edit_text("❌ Failed to access Supabase storage.")
         print(f"[Supabase Error] {e}")
@@ -269,43 +236,19 @@ async def show_more_photos(callback_query: types.CallbackQuery):
         await wait_msg.edit_text("⚠️ No photos available for this dog.")
         return
 
-    media = []
-
-    # Step 2: Download and resize each image
-    async with aiohttp.ClientSession() as session:
-        for filename in photo_filenames[:10]:
-            try:
-                res = supabase.storage.from_('kas.dogs').get_public_url(f"{dog_id}/{filename}")
-                url = res.get("publicURL") if isinstance(res, dict) else res
-                if not url:
-                    continue
-
-                async with session.get(url) as resp:
-                    if resp.status != 200:
-                        continue
-
-                    img_bytes = await resp.read()
-                    image = Image.open(BytesIO(img_bytes)).convert("RGB")
-                    image.thumbnail((400, 400))  # Shrink for fast upload
-
-                    buf = BytesIO()
-                    image.save(buf, format="JPEG", quality=80)
-                    buf.seek(0)
-                    media.append(InputMediaPhoto(media=buf))
-
-            except Exception as e:
-                print(f"[Image Error] Failed to process {filename}: {e}")
-                continue
-
-    # Step 3: Send photos or fallback message
-    if media:
-        try:
-            await bot.send_media_group(callback_query.from_user.id, media=media)
-        except Exception as e:
-            print(f"[Telegram Error] Failed to send media group: {e}")
-            await bot.send_message(callback_query.from_user.id, "❌ Failed to send images.")
-    else:
-        await bot.send_message(callback_query.from_user.id, "⚠️ Couldn't load any images.")
+    # Step 2: Send as one album; photos sent before go by file_id, the rest from the thumbnail cache
+    photos = [(f"{dog_id}/{filename}", repo.photo_version(f"{dog_id}/{filename}")) for filename in photo_filenames]
+    try:
+        with metrics.span("gallery.send"):
+            messages = await send_stored_media_group(
+                callback_query.from_user.id, photos, "gallery",
+                lambda paths: repo.thumbnail_many(paths, "gallery"),
+            )
+        if not messages:
+            await bot.send_message(callback_query.from_user.id, "⚠️ Couldn't load any images.")
+    except Exception as e:
+        print(f"[Telegram Error] Failed to send media group: {e}")
+        await bot.send_message(callback_query.from_user.id, "❌ Failed to send images.")
 
     await wait_msg.delete()
 
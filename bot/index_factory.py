@@ -0,0 +1,304 @@
+# bot/index_factory.py
+import json
+import os
+import zlib
+
+import faiss
+import numpy as np
+
+# --- Index files (written by the builders, read by bot/recognition.py) ---
+BASE_DIR = os.path.dirname(__file__)
+INDEX_PATH = os.path.join(BASE_DIR, "dog_index.faiss")
+LABELS_PATH = os.path.join(BASE_DIR, "dog_labels.npy")
+
+INDEX_TYPES = ("flat", "ivf", "hnsw", "pq", "ivfpq")
+METRICS = ("l2", "cosine")
+
+# Types whose underlying FAISS index supports remove_ids; the others are rebuilt from the embedding store
+REMOVABLE_TYPES = ("flat", "ivf", "pq", "ivfpq")
+
+DEFAULT_PARAMS = {
+    "nlist": 256,       # IVF cells
+    "nprobe": 16,       # IVF cells visited per query
+    "hnsw_m": 32,       # HNSW graph degree
+    "ef_construction": 80,
+    "ef_search": 64,
+    "pq_m": 64,         # PQ sub-quantizers (must divide the dimension)
+    "pq_bits": 8,
+}
+
+
+def manifest_path(index_path):
+    return os.path.splitext(index_path)[0] + ".json"
+
+
+MANIFEST_PATH = manifest_path(INDEX_PATH)
+
+
+def read_flags(mmap):
+    """
+    faiss.read_index flags: with `mmap` the vectors stay in the page cache, mapped read-only,
+    so every process serving the same file shares one copy instead of reading its own.
+    """
+    if not mmap:
+        return 0
+    return getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP) | faiss.IO_FLAG_READ_ONLY
+
+
+# --- Labels: FAISS id -> dog id, as an int32 ordinal per id plus a table of dog ids ---
+class Labels:
+    """
+    `ordinals[faiss_id]` is a position in `dogs`, or -1 for ids freed by deleted images.
+    Indexing returns dog id strings ("" for freed ids), like the string arrays it replaces.
+    """
+
+    __slots__ = ("ordinals", "dogs", "_table")
+
+    def __init__(self, ordinals, dogs):
+        self.ordinals = ordinals
+        self.dogs = np.asarray(dogs, dtype=str)
+        self._table = np.append(self.dogs, "")  # ordinal -1 picks the trailing ""
+
+    @classmethod
+    def from_strings(cls, labels):
+        labels = np.asarray(labels, dtype=str)
+        dogs, ordinals = np.unique(labels, return_inverse=True)
+        ordinals = ordinals.reshape(-1).astype("int32")
+        if len(dogs) and dogs[0] == "":  # "" sorts first
+            dogs, ordinals = dogs[1:], ordinals - 1
+        return cls(ordinals, dogs)
+
+    def __len__(self):
+        return len(self.ordinals)
+
+    def __getitem__(self, ids):
+        return self._table[self.ordinals[ids]]
+
+    @property
+    def live(self):
+        return int(np.count_nonzero(self.ordinals >= 0))
+
+
+def read_labels(path, manifest, mmap=True):
+    """
+    Labels written by write_index_files (int32 .npy, memory-mapped with `mmap`, dog table in
+    the manifest), or a plain array of dog id strings from before the split.
+    """
+    data = np.load(path, mmap_mode="r" if mmap else None, allow_pickle=False)
+    if data.dtype.kind == "U":
+        return Labels.from_strings(data)
+    info = manifest.get("labels")
+    if data.dtype != np.int32 or info is None:
+        raise ValueError(f"{path}: int32 labels need the dog table in the manifest")
+    if len(data) != info["count"] or zlib.crc32(data) != info["crc32"]:
+        # The files are swapped one by one; a reload in between sees a new and an old one
+        raise ValueError(f"{path} does not match the manifest (files from different builds)")
+    labels = Labels(data, info["dogs"])
+    if len(data) and data.max() >= len(labels.dogs):
+        raise ValueError(f"{path} refers to dog {data.max()} but the table has {len(labels.dogs)}")
+    return labels
+
+
+def make_spec(index_type="flat", metric="l2", **params):
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Unknown index type {index_type!r}, expected one of {INDEX_TYPES}")
+    if metric not in METRICS:
+        raise ValueError(f"Unknown metric {metric!r}, expected one of {METRICS}")
+    merged = dict(DEFAULT_PARAMS)
+    merged.update({k: v for k, v in params.items() if v is not None})
+    return {"index_type": index_type, "metric": metric, "params": merged}
+
+
+def _faiss_metric(metric):
+    return faiss.METRIC_INNER_PRODUCT if metric == "cosine" else faiss.METRIC_L2
+
+
+def prepare_vectors(vectors, metric):
+    """Vectors as contiguous float32; L2-normalized for cosine so inner product == cosine similarity."""
+    vectors = np.ascontiguousarray(vectors, dtype="float32")
+    if metric == "cosine":
+        vectors = vectors.copy()
+        faiss.normalize_L2(vectors)
+    return vectors
+
+
+def _make_base(spec, dim, train_size):
+    kind, params = spec["index_type"], spec["params"]
+    metric = _faiss_metric(spec["metric"])
+    # IVF wants ~39 training points per cell; shrink the cell count for small collections
+    nlist = max(1, min(params["nlist"], train_size // 39))
+
+    if kind == "flat":
+        return faiss.IndexFlat(dim, metric)
+    if kind == "ivf":
+        return faiss.IndexIVFFlat(faiss.IndexFlat(dim, metric), dim, nlist, metric)
+    if kind == "hnsw":
+        index = faiss.IndexHNSWFlat(dim, params["hnsw_m"], metric)
+        index.hnsw.efConstruction = params["ef_construction"]
+        return index
+    if dim % params["pq_m"]:
+        raise ValueError(f"pq_m={params['pq_m']} must divide the embedding dimension {dim}")
+    if train_size < 2:
+        raise ValueError(f"{kind} needs at least 2 vectors to train, got {train_size}")
+    # Each sub-quantizer trains 2**pq_bits centroids, which needs at least as many points
+    pq_bits = min(params["pq_bits"], int(np.log2(train_size)))
+    if kind == "pq":
+        return faiss.IndexPQ(dim, params["pq_m"], pq_bits, metric)
+    return faiss.IndexIVFPQ(faiss.IndexFlat(dim, metric), dim, nlist, params["pq_m"], pq_bits, metric)
+
+
+def build_index(spec, vectors, ids):
+    """Create, train (if needed) and fill an ID-mapped index of the given spec."""
+    vectors = prepare_vectors(vectors, spec["metric"])
+    base = _make_base(spec, vectors.shape[1], len(vectors))
+    if not base.is_trained:
+        base.train(vectors)
+    index = faiss.IndexIDMap2(base)
+    index.add_with_ids(vectors, np.asarray(ids, dtype="int64"))
+    configure_search(index, spec)
+    return index
+
+
+def add_vectors(index, spec, vectors, ids):
+    index.add_with_ids(prepare_vectors(vectors, spec["metric"]), np.asarray(ids, dtype="int64"))
+
+
+def _base_index(index):
+    return faiss.downcast_index(index.index) if isinstance(index, faiss.IndexIDMap) else index
+
+
+def configure_search(index, spec):
+    """Apply query-time knobs (nprobe / efSearch) stored in the spec."""
+    base = _base_index(index)
+    params = spec.get("params", {})
+    if isinstance(base, faiss.IndexIVF):
+        base.nprobe = min(params.get("nprobe", DEFAULT_PARAMS["nprobe"]), base.nlist)
+    elif isinstance(base, faiss.IndexHNSW):
+        base.hnsw.efSearch = params.get("ef_search", DEFAULT_PARAMS["ef_search"])
+
+
+def search(index, spec, queries, k):
+    """
+    Search and return (distances, ids) where smaller distance is always better:
+    squared L2 for "l2", 1 - cosine similarity for "cosine".
+    """
+    D, I = index.search(prepare_vectors(queries, spec["metric"]), k)
+    if spec["metric"] == "cosine":
+        D = 1.0 - D
+    return D, I
+
+
+# --- Match threshold: calibrated when the index is built, stored in its manifest ---
+CALIBRATION_K = 20             # neighbours inspected per photo
+# Operating point: None = equal error rate (as many impostors accepted as genuine pairs lost),
+# else the tolerated share of impostor neighbours under the threshold
+CALIBRATION_FALSE_ACCEPT = None
+CALIBRATION_FALLBACK_FALSE_ACCEPT = 0.05  # used when no dog has two photos, so no error rate to balance
+CALIBRATION_SAMPLE = 2000      # photos used as leave-one-out queries on large collections
+
+
+def index_vectors(index):
+    """Return (ids, vectors) stored in the index; PQ types give their compressed approximation."""
+    ids = np.arange(index.ntotal)
+    if isinstance(index, faiss.IndexIDMap):
+        ids = faiss.vector_to_array(index.id_map)
+        index = faiss.downcast_index(index.index)
+    if isinstance(index, faiss.IndexIVF) and index.direct_map.type == faiss.DirectMap.NoMap:
+        index.make_direct_map()
+        try:
+            return ids, index.reconstruct_n(0, index.ntotal)
+        finally:
+            index.make_direct_map(False)  # don't write the map into the index file
+    return ids, index.reconstruct_n(0, index.ntotal)
+
+
+def nearest_by_kind(index, labels, spec, k=CALIBRATION_K, sample=None):
+    """
+    Leave-one-out search: each photo's nearest photo of the same dog (genuine) and of a
+    different dog (impostor). `labels` maps FAISS ids to dog ids ("" for freed ids).
+    """
+    ids, vectors = index_vectors(index)
+    if sample and len(ids) > sample:
+        pick = np.random.default_rng(0).choice(len(ids), sample, replace=False)
+        ids, vectors = ids[pick], vectors[pick]
+    D, I = search(index, spec, vectors, min(k + 1, index.ntotal))
+
+    own = labels[ids][:, None]
+    valid = (I >= 0) & (I != ids[:, None])
+    neighbour_labels = labels[np.where(I >= 0, I, 0)]
+    same = valid & (neighbour_labels == own)
+    other = valid & (neighbour_labels != own) & (neighbour_labels != "")
+
+    genuine = np.where(same, D, np.inf).min(axis=1)
+    impostor = np.where(other, D, np.inf).min(axis=1)
+    return genuine[np.isfinite(genuine)], impostor[np.isfinite(impostor)]
+
+
+def calibrate_threshold(index, labels, spec, false_accept=CALIBRATION_FALSE_ACCEPT, k=CALIBRATION_K,
+                        sample=CALIBRATION_SAMPLE):
+    """
+    The "match" manifest entry. By default the threshold sits at the equal error rate: the share
+    of impostor neighbours under it (a dog missing from the index looks like an impostor) equals
+    the share of genuine pairs above it. A `false_accept` rate picks a stricter or looser point.
+    None when the collection has too few different dogs to tell.
+    """
+    genuine, impostor = nearest_by_kind(index, labels, spec, k, sample)
+    if not len(impostor):
+        return None
+    if false_accept is None and len(genuine):
+        operating_point = "eer"
+        thresholds = np.sort(np.concatenate([genuine, impostor]))
+        accepted = np.searchsorted(np.sort(impostor), thresholds, side="right") / len(impostor)
+        lost = 1 - np.searchsorted(np.sort(genuine), thresholds, side="right") / len(genuine)
+        threshold = float(thresholds[np.argmin(np.abs(accepted - lost))])
+    else:
+        operating_point = "false_accept"
+        threshold = float(np.quantile(impostor, CALIBRATION_FALLBACK_FALSE_ACCEPT if false_accept is None else false_accept))
+    return {
+        "max_distance": round(threshold, 4),
+        "operating_point": operating_point,
+        "false_accept": round(float(np.mean(impostor <= threshold)), 4),
+        "genuine_kept": round(float(np.mean(genuine <= threshold)), 4) if len(genuine) else None,
+    }
+
+
+def manifest_for(spec, index, **extra):
+    """Everything a reader needs to query the index correctly."""
+    return dict(spec, dim=index.d, ntotal=index.ntotal, **extra)
+
+
+def save_manifest(path, manifest):
+    with open(path, "w") as f:
+        json.dump(manifest, f, indent=2)
+
+
+def read_manifest(path):
+    """Manifest of the stored index; indexes built before manifests existed are flat L2."""
+    if not os.path.exists(path):
+        return make_spec("flat", "l2")
+    with open(path) as f:
+        return json.load(f)
+
+
+def write_index_files(index, labels, manifest, index_path=INDEX_PATH, labels_path=LABELS_PATH):
+    """
+    Write to temp files first, then swap them in with os.replace so readers never see partial
+    files. `labels` are dog id strings per FAISS id ("" for freed ids) or a Labels.
+    """
+    manifest_file = manifest_path(index_path)
+    tmp_labels = labels_path + ".tmp.npy"
+    tmp_index = index_path + ".tmp"
+    tmp_manifest = manifest_file + ".tmp"
+    if not isinstance(labels, Labels):
+        labels = Labels.from_strings(labels)
+    ordinals = np.ascontiguousarray(labels.ordinals, dtype="int32")
+    manifest = dict(manifest, labels={"count": len(ordinals), "crc32": zlib.crc32(ordinals),
+                                      "dogs": labels.dogs.tolist()})
+    np.save(tmp_labels, ordinals)
+    faiss.write_index(index, tmp_index)
+    save_manifest(tmp_manifest, manifest)
+    # Labels go first: they are a superset of the ids the old index can return. A reader that
+    # sees the new labels with the old manifest fails the checksum and retries later
+    os.replace(tmp_labels, labels_path)
+    os.replace(tmp_manifest, manifest_file)
+    os.replace(tmp_index, index_path)
@@ -0,0 +1,114 @@
+# bot/index_holder.py
+import asyncio
+import os
+import threading
+
+import faiss
+
+from bot import index_factory
+from bot.encoder import check_manifest
+from kas_config import INDEX_MMAP
+
+
+class IndexHolder:
+    """
+    Owns the FAISS index and its metadata and swaps in rebuilt files without a restart.
+
+    Readers call `snapshot()` once per search and keep using that (index, metadata, manifest)
+    triple, so a reload never exposes a half-loaded or mismatched state.
+
+    With `mmap` the vectors and labels are mapped from the files instead of copied into each
+    process. Rebuilds replace the files rather than writing into them, so a mapped generation
+    stays valid until the last reader drops it.
+    """
+
+    def __init__(self, index_path, metadata_path, mmap=INDEX_MMAP, check=None):
+        self.index_path = index_path
+        self.metadata_path = metadata_path
+        self.mmap = mmap
+        self.check = check  # check(manifest) raises for an index the reader can't serve
+        self.manifest_path = index_factory.manifest_path(index_path)
+        self.generation = 0
+        self._state = None
+        self._mtimes = None
+        self._reload_lock = threading.RLock()
+
+    def _file_mtimes(self):
+        # The manifest alone changes too, e.g. a new threshold from calibrate_threshold --write
+        manifest = os.path.getmtime(self.manifest_path) if os.path.exists(self.manifest_path) else None
+        return os.path.getmtime(self.index_path), os.path.getmtime(self.metadata_path), manifest
+
+    @staticmethod
+    def validate(index, metadata):
+        """Raise ValueError unless every vector in the index maps to a metadata entry."""
+        if isinstance(index, faiss.IndexIDMap):
+            ids = faiss.vector_to_array(index.id_map)
+            if len(ids) and (ids.min() < 0 or ids.max() >= len(metadata)):
+                raise ValueError(f"index ids up to {ids.max()} but only {len(metadata)} metadata entries")
+            live = metadata.live
+            if live != index.ntotal:
+                raise ValueError(f"index has {index.ntotal} vectors but metadata has {live} live entries")
+        elif index.ntotal != len(metadata):
+            raise ValueError(f"index has {index.ntotal} vectors but metadata has {len(metadata)} entries")
+
+    def load(self):
+        """Load and validate the files, then swap them in. Raises on failure and keeps the old state."""
+        with self._reload_lock:
+            mtimes = self._file_mtimes()
+            index = faiss.read_index(self.index_path, index_factory.read_flags(self.mmap))
+            manifest = index_factory.read_manifest(self.manifest_path)
+            metadata = index_factory.read_labels(self.metadata_path, manifest, mmap=self.mmap)
+            manifest.setdefault("dim", index.d)
+            self.validate(index, metadata)
+            if manifest.get("ntotal", index.ntotal) != index.ntotal:
+                raise ValueError(f"manifest describes {manifest['ntotal']} vectors but index has {index.ntotal}")
+            embedding = check_manifest(manifest, index.d)
+            if self.check:
+                self.check(manifest)
+            index_factory.configure_search(index, manifest)
+
+            # Single reference assignment: concurrent searches see either the old or the new state
+            self._state = (index, metadata, manifest)
+            self._mtimes = mtimes
+            self.generation += 1
+            print(f"[Index] Loaded generation {self.generation}: {manifest['index_type']}/{manifest['metric']} "
+                  f"({embedding['model']}), "
+                  f"{index.ntotal} vectors, {len(metadata)} labels of {len(metadata.dogs)} dogs"
+                  f"{' (memory-mapped)' if self.mmap else ''}")
+
+    def snapshot(self):
+        """Current (index, metadata, manifest); the first call loads the files."""
+        if self._state is None:
+            with self._reload_lock:
+                if self._state is None:
+                    self.load()
+        return self._state
+
+    def changed(self):
+        if self._mtimes is None:
+            return False  # nothing loaded yet; the first snapshot() loads the files
+        try:
+            return self._file_mtimes() != self._mtimes
+        except OSError:
+            return False  # files are being swapped right now
+
+    def reload(self):
+        """Reload from disk; returns True on success and keeps serving the old index on failure."""
+        try:
+            self.load()
+            return True
+        except Exception as e:
+            print(f"[Index] Reload failed, keeping generation {self.generation}: {e}")
+            return False
+
+    async def reload_async(self):
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(None, self.reload)
+
+    async def watch(self, interval=30):
+        """Poll the files' mtimes and reload in the background when they change."""
+        while True:
+            await asyncio.sleep(interval)
+            if self.changed():
+                print("[Index] Index files changed on disk, reloading...")
+                await self.reload_async()
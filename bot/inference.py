@@ -0,0 +1,120 @@
+# bot/inference.py
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from bot.metrics import metrics
+
+
+class RecognitionWorker:
+    """
+    Collects concurrent recognition requests into micro-batches and runs
+    each batch in a thread pool, so the event loop never blocks on a forward pass.
+    """
+
+    def __init__(self, recognize_batch, max_batch_size=8, max_wait_ms=20, workers=1):
+        self.recognize_batch = recognize_batch
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0, max_wait_ms) / 1000
+        self.workers = max(1, int(workers))
+
+        self._queue = None
+        self._executor = None
+        self._slots = None
+        self._task = None
+        self._collecting = []
+
+    @property
+    def queue_depth(self):
+        return self._queue.qsize() if self._queue else 0
+
+    def start(self):
+        if self._task:
+            return
+        self._queue = asyncio.Queue()
+        self._slots = asyncio.Semaphore(self.workers)
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="recognition")
+        self._task = asyncio.get_event_loop().create_task(self._run())
+        print(f"[Inference] Worker started (batch={self.max_batch_size}, "
+              f"wait={self.max_wait * 1000:.0f}ms, workers={self.workers})")
+
+    async def stop(self):
+        if not self._task:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+        # Let running batches finish, fail whatever is still queued
+        for _ in range(self.workers):
+            await self._slots.acquire()
+        pending = self._collecting
+        while not self._queue.empty():
+            pending.append(self._queue.get_nowait())
+        self._collecting = []
+        for _, fut in pending:
+            if not fut.done():
+                fut.set_exception(RuntimeError("Recognition worker stopped"))
+        self._executor.shutdown(wait=False)
+
+    def submit(self, item) -> asyncio.Future:
+        """Queue one item for recognition and return a future with its result."""
+        if not self._task:
+            self.start()
+        fut = asyncio.get_event_loop().create_future()
+        self._queue.put_nowait((item, fut))
+        return fut
+
+    async def _collect(self):
+        loop = asyncio.get_event_loop()
+        batch = self._collecting = [await self._queue.get()]
+        deadline = loop.time() + self.max_wait
+
+        while len(batch) < self.max_batch_size:
+            if not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+                continue
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        self._collecting = []
+        return batch
+
+    async def _run(self):
+        loop = asyncio.get_event_loop()
+        while True:
+            # Wait for a free pool slot first, so requests keep piling into the next batch
+            await self._slots.acquire()
+            try:
+                batch = await self._collect()
+            except asyncio.CancelledError:
+                self._slots.release()
+                raise
+            items = [item for item, _ in batch]
+            metrics.observe("recognition.batch_size", len(batch))
+            job = loop.run_in_executor(self._executor, self.recognize_batch, items)
+            job.add_done_callback(lambda job, batch=batch, start=time.perf_counter(): self._resolve(batch, job, start))
+
+    def _resolve(self, batch, job, start):
+        self._slots.release()
+        metrics.observe("recognition.batch", (time.perf_counter() - start) * 1000, unit="ms")
+        try:
+            results = job.result()
+        except Exception as e:
+            print(f"[Inference] Batch of {len(batch)} failed: {e}")
+            results = None
+
+        for i, (_, fut) in enumerate(batch):
+            if fut.done():
+                continue
+            if results is None:
+                fut.set_exception(RuntimeError("Recognition batch failed"))
+            else:
+                fut.set_result(results[i])
@@ -1,49 +1,118 @@
 # bot/main.py
 
-import os
-import gc
-import uuid
-import tempfile
+import asyncio
+import time
+from io import BytesIO
 from PIL import Image
 from aiogram import Bot, Dispatcher, types
-from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton, InputMediaPhoto
+from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.utils import executor
 from aiogram.utils.markdown import escape_md
-from kas_config import BOT_TOKEN
+from kas_config import BOT_TOKEN, RECOGNITION_MAX_BATCH, RECOGNITION_MAX_WAIT_MS, RECOGNITION_WORKERS
+from kas_config import ADMIN_IDS, INDEX_WATCH_INTERVAL, RECOGNITION_WARMUP, COLLAGE_PRERENDER, COLLAGE_PRERENDER_INTERVAL
+from kas_config import DOG_SYNC_INTERVAL, BOT_MODE, DROP_PENDING_UPDATES, METRICS_PORT
 from bot.loader import dp, bot
 import bot.handlers.catalog
 from bot.loader import dp, bot
-from bot.recognition import get_dog_by_photo
+from bot.inference import RecognitionWorker
 from bot.utils.helpers import create_collage
-from supabase import create_client
+from bot.utils.show_dogs import prerender_collages_forever, prerender_on_change, get_dog_by_id
+from bot.catalog_snapshot import catalog
+from bot.dog_store import store, sync_forever, SQLiteDogStore
+from bot.repository import repo
+from bot.telegram_files import file_ids, send_stored_photo, send_stored_media_group
+from bot.state import sessions, RECOGNIZED
+from bot.query_cache import query_cache, QueryPhoto
+from bot.albums import albums, QueryAlbum
+from bot.photo_sizes import pick_photo_size, largest_size, needs_more_detail, best_distance, retry_distance
+from bot.metrics import metrics, start_server as start_metrics_server
 
-# --- Supabase Client ---
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_KEY = os.getenv("SUPABASE_KEY")
-supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
+# --- Recognition (torch, FAISS and the index are only imported/loaded when first needed) ---
+def recognize_batch(photos):
+    from bot.recognition import recognize_photos
+    return recognize_photos(photos)
 
-# --- Store recognized dog photos per user ---
-recognized_dog_photos = {}
+def warm_up_recognition():
+    from bot.recognition import warm_up
+    warm_up()
+
+async def start_recognition_background():
+    loop = asyncio.get_event_loop()
+    if RECOGNITION_WARMUP:
+        try:
+            await loop.run_in_executor(None, warm_up_recognition)
+        except Exception as e:
+            print(f"[Recognition] Warm-up failed, will retry on first photo: {e}")
+    if INDEX_WATCH_INTERVAL > 0:
+        from bot.recognition import index_holder
+        await index_holder.watch(INDEX_WATCH_INTERVAL)
+
+# --- Recognition worker (micro-batches photos off the event loop) ---
+recognition_worker = RecognitionWorker(
+    recognize_batch,
+    max_batch_size=RECOGNITION_MAX_BATCH,
+    max_wait_ms=RECOGNITION_MAX_WAIT_MS,
+    workers=RECOGNITION_WORKERS,
+)
+
+# --- Metrics (bot/metrics.py): queue depths and cache counters read on each scrape ---
+def register_gauges():
+    metrics.gauge("recognition.queue_depth", lambda: recognition_worker.queue_depth)
+    metrics.gauge("thumbnails", repo.thumbnail_cache.stats)
+    metrics.gauge("telegram_file_ids", file_ids.stats)
+    metrics.gauge("sessions", sessions.stats)
+    metrics.gauge("query_cache", query_cache.stats)
+    metrics.gauge("catalog.generation", lambda: catalog.generation)
 
 # --- Startup ---
+async def start_services(primary=True, worker=0):
+    recognition_worker.start()
+    register_gauges()
+    if METRICS_PORT:
+        # One port per webhook worker: METRICS_PORT, METRICS_PORT + 1, ...
+        await start_metrics_server(METRICS_PORT + worker)
+    if primary and COLLAGE_PRERENDER:
+        # Each new catalog generation (this first load, a replica sync, /reload_catalog) renders the collages
+        catalog.on_change(prerender_on_change)
+    # Updates are handled right away; the catalog, model and index load in the background
+    asyncio.get_event_loop().create_task(catalog.refresh_in_background())
+    asyncio.get_event_loop().create_task(start_recognition_background())
+    if not primary:
+        return  # jobs below write shared files, one process runs them
+    if isinstance(store, SQLiteDogStore) and DOG_SYNC_INTERVAL > 0:
+        # Serve from the local replica; pull Supabase changes in the background
+        asyncio.get_event_loop().create_task(sync_forever(
+            store, DOG_SYNC_INTERVAL, on_change=lambda: asyncio.ensure_future(catalog.refresh_in_background())
+        ))
+    if COLLAGE_PRERENDER_INTERVAL > 0:
+        asyncio.get_event_loop().create_task(prerender_collages_forever(COLLAGE_PRERENDER_INTERVAL))
+
 async def on_startup(_):
-    print("🔄 Deleting webhook and flushing old updates...")
-    await bot.delete_webhook(drop_pending_updates=True)
+    # Updates sent while the bot was down are kept unless DROP_PENDING_UPDATES=1
+    print("🔄 Deleting webhook...")
+    await bot.delete_webhook(drop_pending_updates=DROP_PENDING_UPDATES)
+    await start_services()
+
+# --- Shutdown ---
+async def stop_services():
+    await recognition_worker.stop()
+    await repo.close()
+    for name, s in repo.stats.summary().items():
+        print(f"[Repository] {name}: {s['count']} calls, mean {s['mean_ms']:.0f}ms, "
+              f"max {s['max_ms']:.0f}ms, {s['errors']} failed")
+    print(f"[Thumbnails] {repo.thumbnail_cache.stats()}")
+    print(f"[Telegram] file_id reuse: {file_ids.stats()}")
+    print(f"[Sessions] {sessions.stats()}")
+    print(f"[QueryCache] {query_cache.stats()}")
+
+async def on_shutdown(_):
+    await stop_services()
 
 # --- Utility ---
 def clean_text(text: str) -> str:
     """Escape text for MarkdownV2."""
     return escape_md(text)
 
-def get_categories():
-    try:
-        response = supabase.table("dogs").select("category").neq("category", None).execute()
-        rows = response.data
-        return list({row["category"] for row in rows if row["category"]})
-    except Exception as e:
-        print(f"Error fetching categories: {e}")
-        return []
-
 # --- /start handler ---
 @dp.message_handler(commands=['start'])
 async def send_main_menu_command(message: types.Message):
@@ -58,6 +127,31 @@ async def back_to_menu(callback_query: types.CallbackQuery):
     text, keyboard = get_main_menu()
     await bot.send_message(callback_query.from_user.id, text, reply_markup=keyboard, parse_mode="MarkdownV2")
 
+# --- Admin: reload recognition index ---
+@dp.message_handler(commands=['reload_index'])
+async def reload_index_command(message: types.Message):
+    if message.from_user.id not in ADMIN_IDS:
+        return
+    from bot.recognition import index_holder
+    wait_msg = await message.reply("🔄 Reloading recognition index...")
+    if await index_holder.reload_async():
+        index = index_holder.snapshot()[0]
+        await wait_msg.edit_text(f"✅ Index reloaded: {index.ntotal} photos (generation {index_holder.generation}).")
+    else:
+        await wait_msg.edit_text("❌ Reload failed, still serving the previous index. See logs.")
+
+# --- Admin: refresh the in-memory catalog ---
+@dp.message_handler(commands=['reload_catalog'])
+async def reload_catalog_command(message: types.Message):
+    if message.from_user.id not in ADMIN_IDS:
+        return
+    try:
+        snapshot = await catalog.refresh()
+        await message.reply(f"✅ Catalog reloaded: {len(snapshot.by_id)} dogs (generation {snapshot.generation}).")
+    except Exception as e:
+        print(f"[Catalog] Reload failed: {e}")
+        await message.reply("❌ Catalog reload failed, still serving the previous copy. See logs.")
+
 # --- Identify callback ---
 @dp.callback_query_handler(lambda c: c.data == 'identify')
 async def handle_identify_callback(callback_query: types.CallbackQuery):
@@ -65,54 +159,124 @@ async def handle_identify_callback(callback_query: types.CallbackQuery):
     await bot.send_message(callback_query.from_user.id, "📸 Please send a photo of the dog you want to identify.")
 
 # --- Photo handler ---
+def index_generation():
+    from bot.recognition import index_holder
+    return index_holder.generation
+
+def current_retry_distance():
+    from bot.recognition import index_holder, match_threshold
+    return retry_distance(match_threshold(index_holder.snapshot()[2]))
+
+async def download_photo(photo, fresh=False):
+    # Download straight into memory; recognition decodes the bytes once
+    buf = BytesIO()
+    with metrics.span("photo.download"):
+        await photo.download(destination_file=buf)
+    # download() seeks back to the start, so the size is the buffer length, not its position
+    metrics.observe("photo.download_kb", len(buf.getbuffer()) / 1024)
+    # Results are cached under the file id and the image hash
+    return QueryPhoto(buf.getvalue(), photo.file_unique_id, fresh)
+
+async def recognize_photo_size(photo, fresh=False):
+    query = await download_photo(photo, fresh)
+    with metrics.span("photo.recognize"):  # queue wait + decode/transform/forward/search
+        return await recognition_worker.submit(query)  # robust, won't crash
+
+async def recognize_message(message):
+    # Smallest size that covers the model input; the largest only if that isn't conclusive
+    photo = pick_photo_size(message.photo)
+
+    # A photo forwarded again is answered without downloading it
+    candidates = query_cache.get_file(photo.file_unique_id, index_generation())
+    if candidates is None:
+        candidates = await recognize_photo_size(photo)
+        largest = largest_size(message.photo)
+        # Nothing matched (RECOGNITION_RETRY_EMPTY) or the best match is close to the cutoff
+        if largest is not photo and needs_more_detail(candidates, current_retry_distance() if candidates else None):
+            # Counted by cause against photo.total, so the cost of the second download shows
+            metrics.incr("photo.retry_larger")
+            metrics.incr("photo.retry_larger.close_match" if candidates else "photo.retry_larger.no_match")
+            retry = await recognize_photo_size(largest, fresh=True)
+            if best_distance(retry) < best_distance(candidates):
+                metrics.incr("photo.retry_larger.improved")
+            if best_distance(retry) <= best_distance(candidates):
+                candidates = retry
+                # The next forward of the small size answers with the result kept here
+                query_cache.link_file(photo.file_unique_id, largest.file_unique_id, index_generation())
+    return candidates
+
+async def recognize_album(messages):
+    # All photos go to the worker as one item: same batch, one fused ranking
+    metrics.observe("album.photos", len(messages))
+    queries = await asyncio.gather(*[download_photo(pick_photo_size(m.photo)) for m in messages])
+    with metrics.span("photo.recognize"):
+        return await recognition_worker.submit(QueryAlbum(queries))
+
 @dp.message_handler(content_types=types.ContentType.PHOTO)
 async def handle_photo(message: types.Message):
-    wait_msg = await message.reply("⏳ Analyzing the photo...")
+    album = None
+    if message.media_group_id:
+        start = time.perf_counter()
+        album = await albums.collect(message)
+        if album is None:
+            return  # part of an album handled by its first message (and timed there)
+        metrics.observe("album.collect", (time.perf_counter() - start) * 1000, unit="ms")
+        message = album[0]
+    await answer_photo(message, album)
 
-    photo = message.photo[-1]  # highest resolution
-    temp_dir = tempfile.gettempdir()
-    temp_path = os.path.join(temp_dir, f"dog_{uuid.uuid4().hex}.jpg")
+# Timed once per reply: single photos and album leaders, not every part of an album
+@metrics.timed("photo.total")
+async def answer_photo(message, album=None):
+    if album and len(album) > 1:
+        wait_msg = await message.reply(f"⏳ Analyzing {len(album)} photos of the dog...")
+    else:
+        wait_msg = await message.reply("⏳ Analyzing the photo...")
 
     try:
-        await photo.download(destination_file=temp_path)
-        match = get_dog_by_photo(temp_path)  # robust, won't crash
+        candidates = await (recognize_album(album) if album and len(album) > 1 else recognize_message(message))
+        match = candidates[0] if candidates else None
 
         if not match:
             await message.reply("🐾 Sorry, I couldn't recognize this dog.")
         else:
             dog_id = match["id"]
-            response = supabase.table("dogs").select("*").eq("id", dog_id).execute()
-            dog = response.data[0] if response.data else None
+            with metrics.span("photo.profile"):
+                dog = await get_dog_by_id(dog_id)
 
             if dog:
                 text = (
-                    f"🐶 *{escape_md(dog.get('name') or match['name'])}*\n"
-                    f"📂 {escape_md(dog.get('category') or match['category'])}\n"
+                    f"🐶 *{escape_md(dog.get('name') or 'Unnamed')}*\n"
+                    f"📂 {escape_md(dog.get('category') or 'N/A')}\n"
                     f"📍 {escape_md(dog.get('pen') or dog.get('sector') or 'N/A')}\n"
                     f"📋 Status: {escape_md(dog.get('status') or 'N/A')}\n"
                     f"📜 {escape_md(dog.get('description') or 'No description yet')}"
                 )
 
-                storage_files = supabase.storage.from_("kas.dogs").list(dog_id)
-                photos = [
-                    supabase.storage.from_("kas.dogs").get_public_url(f"{dog_id}/{f['name']}").public_url
-                    for f in storage_files
-                    if f['name'].lower().endswith((".jpg", ".jpeg", ".png"))
-                ]
+                with metrics.span("photo.photo_list"):
+                    photos = [f"{dog_id}/{name}" for name in await repo.photos(dog_id)]
 
                 keyboard = InlineKeyboardMarkup().add(
                     InlineKeyboardButton("🔙 Back to Menu", callback_data="start_over")
                 )
 
+                sent = False
                 if photos:
-                    await message.reply_photo(
-                        photo=photos[0],
-                        caption=clean_text(text),
-                        parse_mode="MarkdownV2",
-                        reply_markup=keyboard
-                    )
-                    recognized_dog_photos[message.from_user.id] = photos
-                else:
+                    try:
+                        with metrics.span("photo.send"):
+                            await send_stored_photo(
+                                message.chat.id, photos[0], repo.photo_version(photos[0]), "profile",
+                                lambda: repo.thumbnail(photos[0], "profile"),
+                                caption=clean_text(text),
+                                parse_mode="MarkdownV2",
+                                reply_markup=keyboard,
+                                reply_to_message_id=message.message_id,
+                            )
+                        sent = True
+                    except Exception as e:
+                        # The dog was recognized; answer with the profile text instead of an error
+                        print(f"[ERROR] Sending image {photos[0]}: {e}")
+                    await sessions.set(message.from_user.id, RECOGNIZED, {"dog": dog_id})
+                if not sent:
                     await message.reply(
                         clean_text(text),
                         parse_mode="MarkdownV2",
@@ -122,13 +286,11 @@ async def handle_photo(message: types.Message):
                 await message.reply("🐾 Sorry, I couldn't find this dog in the database.")
 
     except Exception as e:
+        metrics.incr("photo.errors")
         await message.reply("❌ Error processing the photo.")
         print(f"Recognition error: {e}")
     finally:
         await wait_msg.delete()
-        if os.path.exists(temp_path):
-            os.remove(temp_path)
-        gc.collect()
 
 # --- More recognized photos ---
 @dp.callback_query_handler(lambda c: c.data == "more_rec_photos")
@@ -136,10 +298,14 @@ async def handle_more_rec_photos(callback_query: types.CallbackQuery):
     await bot.answer_callback_query(callback_query.id)
     wait_msg = await bot.send_message(callback_query.from_user.id, "⏳ Please wait...")
 
-    photos = recognized_dog_photos.get(callback_query.from_user.id)
-    if photos:
-        media = [InputMediaPhoto(types.InputFile(p)) for p in photos[:10]]
-        await bot.send_media_group(callback_query.from_user.id, media=media)
+    session = await sessions.get(callback_query.from_user.id, RECOGNIZED)
+    if session:
+        dog_id = session["dog"]
+        photos = [f"{dog_id}/{name}" for name in await repo.photos(dog_id)]
+        await send_stored_media_group(
+            callback_query.from_user.id, [(p, repo.photo_version(p)) for p in photos[:10]], "gallery",
+            lambda paths: repo.thumbnail_many(paths, "gallery"),
+        )
 
     await wait_msg.delete()
     keyboard = InlineKeyboardMarkup().add(InlineKeyboardButton("🔙 Back to Menu", callback_data="start_over"))
@@ -147,4 +313,8 @@ async def handle_more_rec_photos(callback_query: types.CallbackQuery):
 
 # --- Run bot ---
 if __name__ == '__main__':
-    executor.start_polling(dp, skip_updates=True, on_startup=on_startup)
+    if BOT_MODE == "webhook":
+        from bot.server import run_webhook
+        run_webhook(dp, start_services, stop_services)
+    else:
+        executor.start_polling(dp, skip_updates=DROP_PENDING_UPDATES, on_startup=on_startup, on_shutdown=on_shutdown)
@@ -0,0 +1,206 @@
+# bot/metrics.py
+"""
+In-process latency histograms, counters and gauges, and a local HTTP endpoint for them.
+
+    with metrics.span("photo.download"):
+        ...
+    @metrics.timed("photo.total")
+    async def handle_photo(message): ...
+    metrics.incr("recognition.no_match")
+    metrics.gauge("recognition.queue_depth", lambda: worker.queue_depth)
+
+With METRICS_PORT set, each process serves on METRICS_HOST (localhost by default):
+
+    GET /metrics            Prometheus text format (histograms with p50/p95/p99 as quantiles)
+    GET /metrics.json       the same as JSON
+    GET /profile?seconds=10 all threads sampled every METRICS_PROFILE_INTERVAL_MS, as folded
+                            stacks for flamegraph.pl or speedscope (only with METRICS_PROFILER=1)
+"""
+import asyncio
+import bisect
+import functools
+import json
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+from aiohttp import web
+
+from kas_config import METRICS_HOST, METRICS_PROFILER, METRICS_PROFILE_INTERVAL_MS
+
+# Bucket upper bounds: 0.1 .. 100000 (ms: up to 100s), 8 per decade, each ~33% wider than the last
+BUCKETS = [round(0.1 * 10 ** (i / 8), 4) for i in range(49)]
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+class Histogram:
+    """Counts per fixed bucket; quantiles are interpolated inside the bucket they fall in."""
+
+    def __init__(self, bounds=BUCKETS, unit=""):
+        self.bounds = bounds
+        self.unit = unit
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q):
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            if n and seen + n >= rank:
+                low = self.bounds[i - 1] if i else 0.0
+                high = self.bounds[i] if i < len(self.bounds) else self.max
+                return min(low + (high - low) * (rank - seen) / n, self.max)
+            seen += n
+        return self.max
+
+    def summary(self):
+        result = {"count": self.count, "mean": self.total / self.count if self.count else 0.0, "max": self.max}
+        result.update({f"p{int(q * 100)}": self.quantile(q) for q in QUANTILES})
+        return result
+
+
+class Metrics:
+    def __init__(self):
+        self.started_at = time.time()
+        self._histograms = {}
+        self._counters = {}
+        self._gauges = {}
+        self._lock = threading.Lock()  # recognition and Supabase calls record from worker threads
+
+    def observe(self, name, value, unit=""):
+        with self._lock:
+            histogram = self._histograms.get(name)
+            if histogram is None:
+                histogram = self._histograms[name] = Histogram(unit=unit)
+            histogram.observe(value)
+
+    @contextmanager
+    def span(self, name):
+        """Time the block in ms into histogram `name` (also when it raises)."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, (time.perf_counter() - start) * 1000, unit="ms")
+
+    def timed(self, name):
+        """Decorator: time every call of a coroutine function into histogram `name`."""
+        def decorate(fn):
+            @functools.wraps(fn)
+            async def wrapper(*args, **kwargs):
+                with self.span(name):
+                    return await fn(*args, **kwargs)
+            return wrapper
+        return decorate
+
+    def incr(self, name, n=1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + n
+
+    def gauge(self, name, read):
+        """Register `read()` -> number, or -> {label: number} for several related values."""
+        self._gauges[name] = read
+
+    def snapshot(self):
+        with self._lock:
+            histograms = {name + (f"_{h.unit}" if h.unit else ""): h.summary()
+                          for name, h in sorted(self._histograms.items())}
+            counters = dict(sorted(self._counters.items()))
+        gauges = {}
+        for name, read in sorted(self._gauges.items()):
+            try:
+                value = read()
+            except Exception as e:
+                print(f"[Metrics] Gauge {name} failed: {e}")
+                continue
+            if isinstance(value, dict):
+                gauges.update({f"{name}.{key}": v for key, v in value.items() if isinstance(v, (int, float))})
+            else:
+                gauges[name] = value
+        return {"uptime_s": time.time() - self.started_at, "histograms": histograms,
+                "counters": counters, "gauges": gauges}
+
+    def render_text(self):
+        snapshot = self.snapshot()
+        lines = []
+        for name, h in snapshot["histograms"].items():
+            metric = "kas_" + _metric_name(name)
+            lines.append(f"# TYPE {metric} summary")
+            for q in QUANTILES:
+                lines.append(f'{metric}{{quantile="{q}"}} {h[f"p{int(q * 100)}"]:.3f}')
+            lines.append(f"{metric}_sum {h['mean'] * h['count']:.3f}")
+            lines.append(f"{metric}_count {h['count']}")
+        for name, value in snapshot["counters"].items():
+            lines.append(f"# TYPE kas_{_metric_name(name)}_total counter")
+            lines.append(f"kas_{_metric_name(name)}_total {value}")
+        for name, value in snapshot["gauges"].items():
+            lines.append(f"# TYPE kas_{_metric_name(name)} gauge")
+            lines.append(f"kas_{_metric_name(name)} {value}")
+        return "\n".join(lines) + "\n"
+
+
+def _metric_name(name):
+    return "".join(c if c.isalnum() else "_" for c in name)
+
+
+# --- Sampling profiler ---
+def sample_stacks(seconds, interval_ms=METRICS_PROFILE_INTERVAL_MS):
+    """Sample every thread's Python stack for `seconds`; returns folded stacks "a;b;c count"."""
+    me = threading.get_ident()
+    names = {}
+    folded = {}
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        for thread in threading.enumerate():
+            names[thread.ident] = thread.name
+        for ident, frame in sys._current_frames().items():
+            if ident == me:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(f"{frame.f_code.co_name} ({frame.f_code.co_filename.rsplit('/', 1)[-1]}:{frame.f_lineno})")
+                frame = frame.f_back
+            key = ";".join([names.get(ident, str(ident))] + stack[::-1])
+            folded[key] = folded.get(key, 0) + 1
+        time.sleep(interval_ms / 1000)
+    return "\n".join(f"{stack} {count}" for stack, count in sorted(folded.items())) + "\n"
+
+
+# --- HTTP endpoint ---
+async def start_server(port, host=METRICS_HOST):
+    async def text(_):
+        return web.Response(text=metrics.render_text(), content_type="text/plain")
+
+    async def as_json(_):
+        return web.Response(text=json.dumps(metrics.snapshot(), indent=1), content_type="application/json")
+
+    async def profile(request):
+        seconds = min(float(request.query.get("seconds", "10")), 120)
+        # Sampled from a thread, so the event loop keeps running (and shows up in the samples)
+        stacks = await asyncio.get_event_loop().run_in_executor(None, sample_stacks, seconds)
+        return web.Response(text=stacks, content_type="text/plain")
+
+    app = web.Application()
+    app.router.add_get("/metrics", text)
+    app.router.add_get("/metrics.json", as_json)
+    if METRICS_PROFILER:
+        app.router.add_get("/profile", profile)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    print(f"[Metrics] Serving http://{host}:{port}/metrics")
+    return runner
+
+
+metrics = Metrics()
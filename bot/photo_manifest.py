@@ -0,0 +1,53 @@
+# bot/photo_manifest.py
+"""
+Photo manifest: every dog's photo filenames (and storage versions) in one JSON object
+stored next to the photos in the bucket.
+
+The catalog reads collage covers from it with one request instead of listing every dog's
+folder; profiles and galleries list the folder live (DogRepository.photos), since the
+manifest is only as fresh as its last write. It is written by the index build (bot/embeddings.py), which lists the whole bucket anyway,
+or on its own with:
+
+    python -m bot.photo_manifest
+"""
+import json
+import time
+
+MANIFEST_OBJECT = "photo_manifest.json"
+MANIFEST_VERSION = 1
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+
+
+def build_manifest(objects):
+    """{path: version} for the bucket -> {"dogs": {dog_id: [[filename, version], ...]}}, names sorted."""
+    dogs = {}
+    for path, version in objects.items():
+        parts = path.split("/")
+        if len(parts) != 2 or not parts[1].lower().endswith(IMAGE_EXTENSIONS):
+            continue
+        dogs.setdefault(parts[0], []).append([parts[1], version])
+    for photos in dogs.values():
+        photos.sort()  # same order as storage.list, so photos[0] stays the cover
+    return {"version": MANIFEST_VERSION, "generated_at": time.time(), "dogs": dogs}
+
+
+def photo_entries(manifest, dog_id):
+    """[[filename, version], ...] for `dog_id`, or None if the manifest does not know the dog."""
+    return manifest.get("dogs", {}).get(str(dog_id))
+
+
+def publish(client, bucket, objects):
+    manifest = build_manifest(objects)
+    client.storage.from_(bucket).upload(
+        MANIFEST_OBJECT, json.dumps(manifest).encode(),
+        {"content-type": "application/json", "x-upsert": "true", "cache-control": "60"},
+    )
+    print(f"[Photos] Published manifest for {len(manifest['dogs'])} dogs")
+    return manifest
+
+
+if __name__ == "__main__":
+    from bot.db import get_supabase
+    from bot.embeddings import BUCKET_NAME, list_all_objects
+
+    publish(get_supabase(), BUCKET_NAME, list_all_objects())
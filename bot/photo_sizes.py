@@ -0,0 +1,50 @@
+# bot/photo_sizes.py
+"""
+Which of the Telegram PhotoSize variants of a message photo to download for recognition.
+
+Telegram keeps each photo at several sizes (typically 90, 320, 800 and 1280 px on the long
+side). The encoder resizes everything to INPUT_SIZE, so the smallest variant that covers it
+on both sides gives the same input at a fraction of the download and decode cost. A bigger
+variant is only fetched again when the first result is not confident enough.
+"""
+from bot.encoder import INPUT_SIZE
+from kas_config import RECOGNITION_PHOTO_SIZE, RECOGNITION_MIN_PHOTO_SIDE, RECOGNITION_RETRY_DISTANCE
+from kas_config import RECOGNITION_RETRY_FRACTION, RECOGNITION_RETRY_EMPTY
+
+POLICIES = ("adequate", "largest")
+
+
+def pick_photo_size(sizes, policy=RECOGNITION_PHOTO_SIZE, min_side=RECOGNITION_MIN_PHOTO_SIDE):
+    """
+    "adequate": the smallest size at least `min_side` (default: the model input) on both
+    sides, or the largest if none is; "largest": always the largest.
+    """
+    if policy not in POLICIES:
+        raise ValueError(f"Unknown RECOGNITION_PHOTO_SIZE {policy!r}, expected one of {POLICIES}")
+    ordered = sorted(sizes, key=lambda size: size.width * size.height)
+    if policy == "adequate":
+        min_side = min_side or min(INPUT_SIZE)
+        for size in ordered:
+            if min(size.width, size.height) >= min_side:
+                return size
+    return ordered[-1]
+
+
+def largest_size(sizes):
+    return max(sizes, key=lambda size: size.width * size.height)
+
+
+def best_distance(candidates):
+    return candidates[0]["distance"] if candidates else float("inf")
+
+
+def retry_distance(match_threshold, distance=RECOGNITION_RETRY_DISTANCE, fraction=RECOGNITION_RETRY_FRACTION):
+    """RECOGNITION_RETRY_DISTANCE if set, else a fraction of the "no match" cutoff in use."""
+    return distance if distance is not None else fraction * match_threshold
+
+
+def needs_more_detail(candidates, retry_distance=None, retry_empty=RECOGNITION_RETRY_EMPTY):
+    """No candidate at all (if `retry_empty`), or the best one further than `retry_distance` (when given)."""
+    if not candidates:
+        return retry_empty
+    return retry_distance is not None and best_distance(candidates) > retry_distance
@@ -0,0 +1,171 @@
+# bot/query_cache.py
+"""
+Recent query photos and their match results, so a forwarded photo skips the model.
+
+Two keys lead to an entry: the Telegram file_unique_id (the same photo forwarded again,
+checked before anything is downloaded) and a 64-bit difference hash of the decoded image
+(the same picture re-uploaded or sent at another size, checked before the forward pass).
+Entries belong to one index generation; the first lookup or store against a newer
+generation empties the cache. Least recently used entries go past QUERY_CACHE_SIZE.
+"""
+import threading
+from collections import OrderedDict
+
+from PIL import Image
+
+from kas_config import QUERY_CACHE_SIZE, QUERY_CACHE_HASH_DISTANCE
+
+
+def dhash(img):
+    """Difference hash: one bit per horizontally adjacent pixel pair of a 9x8 grayscale thumbnail."""
+    pixels = list(img.convert("L").resize((9, 8), Image.BILINEAR).getdata())
+    bits = 0
+    for row in range(8):
+        for col in range(8):
+            bits = (bits << 1) | (pixels[row * 9 + col] < pixels[row * 9 + col + 1])
+    return bits
+
+
+class QueryPhoto:
+    """
+    A photo to recognize plus the Telegram id it came with, so the result can be cached under
+    it. `fresh` skips the lookup (e.g. a retry at a bigger size looking for a better match).
+    """
+
+    __slots__ = ("data", "file_unique_id", "fresh")
+
+    def __init__(self, data, file_unique_id=None, fresh=False):
+        self.data = data
+        self.file_unique_id = file_unique_id
+        self.fresh = fresh
+
+
+def _best_distance(candidates):
+    return candidates[0]["distance"] if candidates else float("inf")
+
+
+class _Entry:
+    __slots__ = ("candidates", "embedding", "file_ids")
+
+    def __init__(self, candidates, embedding):
+        self.candidates = candidates
+        self.embedding = embedding
+        self.file_ids = set()
+
+
+class QueryCache:
+    def __init__(self, max_entries=QUERY_CACHE_SIZE, hash_distance=QUERY_CACHE_HASH_DISTANCE):
+        self.max_entries = max_entries
+        self.hash_distance = hash_distance
+        self.generation = None
+        self.hits_file = 0
+        self.hits_hash = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # dhash -> _Entry, least recently used first
+        self._by_file = {}  # file_unique_id -> dhash
+        self._lock = threading.Lock()  # the event loop and recognition threads both use it
+
+    def _sync(self, generation):
+        if generation != self.generation:
+            if self._entries:
+                print(f"[QueryCache] Index generation {generation}, dropping {len(self._entries)} results")
+            self._entries.clear()
+            self._by_file.clear()
+            self.generation = generation
+
+    def get_file(self, file_unique_id, generation):
+        """Candidates cached for this exact Telegram file, or None."""
+        if not self.max_entries or not file_unique_id:
+            return None
+        with self._lock:
+            self._sync(generation)
+            key = self._by_file.get(file_unique_id)
+            if key is None:
+                return None
+            self._entries.move_to_end(key)
+            self.hits_file += 1
+            return self._entries[key].candidates
+
+    def get_hash(self, image_hash, generation, file_unique_id=None):
+        """
+        Candidates of the closest cached image within `hash_distance` bits, or None. On a hit
+        `file_unique_id` is linked to that entry, so the next forward of it skips the download.
+        """
+        if not self.max_entries:
+            return None
+        with self._lock:
+            self._sync(generation)
+            key = self._nearest(image_hash)
+            if key is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits_hash += 1
+            if file_unique_id:
+                self._link(file_unique_id, key)
+            return self._entries[key].candidates
+
+    def put(self, image_hash, candidates, embedding, generation, file_unique_id=None):
+        """
+        Store a result. An image within `hash_distance` bits of a cached one is the same picture
+        (e.g. another Telegram size of it): the entry is shared and keeps the closer result.
+        """
+        if not self.max_entries:
+            return
+        with self._lock:
+            self._sync(generation)
+            key = self._nearest(image_hash)
+            if key is None:
+                key = image_hash
+                self._entries[key] = _Entry(candidates, embedding)
+            elif _best_distance(candidates) < _best_distance(self._entries[key].candidates):
+                self._entries[key].candidates, self._entries[key].embedding = candidates, embedding
+            self._entries.move_to_end(key)
+            if file_unique_id:
+                self._link(file_unique_id, key)
+            while len(self._entries) > self.max_entries:
+                _, evicted = self._entries.popitem(last=False)
+                for file_id in evicted.file_ids:
+                    del self._by_file[file_id]
+
+    def link_file(self, file_unique_id, other_file_unique_id, generation):
+        """Point `file_unique_id` at the entry of `other_file_unique_id` (e.g. the size whose result was kept)."""
+        if not self.max_entries or not file_unique_id:
+            return
+        with self._lock:
+            self._sync(generation)
+            key = self._by_file.get(other_file_unique_id)
+            if key is not None:
+                self._link(file_unique_id, key)
+
+    def _nearest(self, image_hash):
+        """Key of the cached hash closest to `image_hash` within `hash_distance` bits, or None."""
+        if image_hash in self._entries:
+            return image_hash
+        key, best = None, self.hash_distance + 1
+        if self.hash_distance > 0:
+            for cached in self._entries:
+                distance = (cached ^ image_hash).bit_count()
+                if distance < best:
+                    key, best = cached, distance
+        return key
+
+    def _link(self, file_unique_id, key):
+        previous = self._by_file.get(file_unique_id)
+        if previous is not None and previous != key:
+            self._entries[previous].file_ids.discard(file_unique_id)
+        self._entries[key].file_ids.add(file_unique_id)
+        self._by_file[file_unique_id] = key
+
+    def stats(self):
+        lookups = self.hits_file + self.hits_hash + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits_file": self.hits_file,
+            "hits_hash": self.hits_hash,
+            "misses": self.misses,
+            "hit_rate": (self.hits_file + self.hits_hash) / lookups if lookups else 0.0,
+        }
+
+
+query_cache = QueryCache()
@@ -1,81 +1,205 @@
 # bot/recognition.py
 import os
-import faiss
+import time
 import numpy as np
-import torch
-import torchvision.models as models
-import torchvision.transforms as T
-from PIL import Image
-from torchvision.models import resnet18, ResNet18_Weights
+from bot.index_holder import IndexHolder
+from bot import index_factory
+from bot.encoder import load_image, preprocess, get_encoder, manifest_embedding, INPUT_SIZE
+from bot.metrics import metrics
+from bot.query_cache import query_cache, dhash, QueryPhoto
+from bot.albums import QueryAlbum
+from kas_config import MATCH_TOP_K, MATCH_AGGREGATION, MATCH_MAX_DISTANCE
 
 # --- Paths to index & metadata ---
 BASE_DIR = os.path.dirname(__file__)
-INDEX_PATH = os.path.join(BASE_DIR, "dog_index.faiss")
-METADATA_PATH = os.path.join(BASE_DIR, "dog_labels.npy")
+INDEX_PATH = index_factory.INDEX_PATH
+METADATA_PATH = index_factory.LABELS_PATH
 
-print(f"[Recognition] BASE_DIR = {BASE_DIR}")
-print(f"[Recognition] INDEX_PATH exists? {os.path.exists(INDEX_PATH)}")
-print(f"[Recognition] METADATA_PATH exists? {os.path.exists(METADATA_PATH)}")
+# --- "No match" cutoff: MATCH_MAX_DISTANCE, else the one calibrated when the index was built ---
+def match_threshold(manifest):
+    if MATCH_MAX_DISTANCE is not None:
+        return MATCH_MAX_DISTANCE
+    calibrated = (manifest.get("match") or {}).get("max_distance")
+    if calibrated is None:
+        # Without a cutoff every photo, dog or not, would be matched to its nearest dog
+        raise ValueError("Index has no calibrated match threshold: rebuild it, run "
+                         "`python -m bot.benchmarks.calibrate_threshold --write` or set MATCH_MAX_DISTANCE")
+    return calibrated
 
-if not os.path.exists(INDEX_PATH) or not os.path.exists(METADATA_PATH):
-    raise FileNotFoundError(f"Index or metadata not found: {INDEX_PATH}, {METADATA_PATH}")
+# --- Index & metadata: loaded on first use (or by warm_up), hot-reloadable ---
+index_holder = IndexHolder(INDEX_PATH, METADATA_PATH, check=match_threshold)
 
-# --- Load FAISS index & metadata ---
-index = faiss.read_index(INDEX_PATH)
-metadata = np.load(METADATA_PATH, allow_pickle=True).tolist()
+# --- Embedding model: always the one the current index was built with ---
+def encoder_for(manifest):
+    return get_encoder(manifest_embedding(manifest)["model"])
 
-# --- Device ---
-device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+def warm_up():
+    """Load the index and model and run one forward pass, so the first photo doesn't pay for it."""
+    start = time.perf_counter()
+    print(f"[Recognition] INDEX_PATH exists? {os.path.exists(INDEX_PATH)}")
+    print(f"[Recognition] METADATA_PATH exists? {os.path.exists(METADATA_PATH)}")
+    if not os.path.exists(INDEX_PATH) or not os.path.exists(METADATA_PATH):
+        raise FileNotFoundError(f"Index or metadata not found: {INDEX_PATH}, {METADATA_PATH}")
 
-# --- Load ResNet18 embedding model ---
-weights = ResNet18_Weights.DEFAULT
-resnet = resnet18(weights=weights)
-resnet.fc = torch.nn.Identity()  # Remove classification head
-resnet = resnet.to(device).eval()
+    encoder = encoder_for(index_holder.snapshot()[2])
+    encoder.embed_arrays(np.zeros((1, 3, *INPUT_SIZE), dtype="float32"))
+    print(f"[Recognition] Ready in {time.perf_counter() - start:.1f}s")
 
-# --- Image preprocessing ---
-transform = T.Compose([
-    T.Resize((224, 224)),
-    T.ToTensor(),
-    T.Normalize(mean=[0.485, 0.456, 0.406],
-                std=[0.229, 0.224, 0.225]),
-])
+# --- Helper: get embeddings for a batch of images in one forward pass ---
+def get_embeddings(images, manifest=None):
+    manifest = manifest or index_holder.snapshot()[2]
+    with metrics.span("recognition.transform"):
+        batch = np.stack([preprocess(img) for img in images])
+    with metrics.span("recognition.forward"):
+        return encoder_for(manifest).embed_arrays(batch)
 
 # --- Helper: get embedding ---
-def get_embedding(img_path: str):
-    try:
-        img = Image.open(img_path).convert("RGB")
-    except Exception as e:
-        print(f"[Recognition] Failed to open image {img_path}: {e}")
+def get_embedding(source):
+    img = load_image(source)
+    if img is None:
         return None
-    tensor = transform(img).unsqueeze(0).to(device)
-    with torch.no_grad():
-        emb = resnet(tensor).cpu().numpy()
-    return emb.astype("float32")
+    return get_embeddings([img])
 
-# --- Main recognition function ---
-def get_dog_by_photo(photo_path: str):
-    try:
-        query_emb = get_embedding(photo_path)
-        if query_emb is None:
-            print(f"[Recognition] Failed to get embedding for {photo_path}")
-            return None
+# --- Helper: collapse top-k image neighbours into ranked dogs ---
+def aggregate_neighbours(distances, ids, labels, mode="min", max_distance=None):
+    """
+    Group one query's k neighbours by dog id and rank the dogs, best first.
+    mode: "min" (closest photo), "mean" (average distance) or "vote" (most photos, then closest).
+    Neighbours further than `max_distance` are ignored, so an unknown dog yields no candidates.
+    """
+    keep = ids >= 0
+    if max_distance is not None:
+        keep &= distances <= max_distance
+    dists = distances[keep]
+    dogs = labels.ordinals[ids[keep]]
+
+    live = dogs >= 0  # ids freed by deleted images
+    dogs, dists = dogs[live], dists[live]
+    if not len(dogs):
+        return []
+
+    # Grouped by ordinal; only the dogs that made it into the ranking become strings
+    unique_dogs, inverse = np.unique(dogs, return_inverse=True)
+    votes = np.bincount(inverse, minlength=len(unique_dogs))
+    best = np.full(len(unique_dogs), np.inf, dtype="float32")
+    np.minimum.at(best, inverse, dists)
+    mean = np.bincount(inverse, weights=dists, minlength=len(unique_dogs)) / votes
+
+    if mode == "vote":
+        order = np.lexsort((best, -votes))
+    elif mode == "mean":
+        order = np.argsort(mean, kind="stable")
+    else:
+        order = np.argsort(best, kind="stable")
+
+    return [
+        {"id": str(labels.dogs[unique_dogs[i]]), "distance": float(best[i]), "mean_distance": float(mean[i]), "votes": int(votes[i])}
+        for i in order
+    ]
+
+# --- Helper: map FAISS results back to ranked candidate dogs ---
+def match_embeddings(query_embs, snapshot=None, k=MATCH_TOP_K, mode=MATCH_AGGREGATION, max_distance=None):
+    index, metadata, manifest = snapshot or index_holder.snapshot()
+    if max_distance is None:
+        max_distance = match_threshold(manifest)
+    with metrics.span("recognition.search"):
+        D, I = index_factory.search(index, manifest, query_embs, k=min(k, index.ntotal))
+    print(f"[Recognition] FAISS distances: {D[:, :3]}, indices: {I[:, :3]}")
 
-        D, I = index.search(query_emb, k=1)
-        print(f"[Recognition] FAISS distances: {D}, indices: {I}")
+    # Ids past the end of the labels can't be matched; treat them like missing neighbours
+    I = np.where(I < len(metadata), I, -1)
 
-        if len(I) == 0 or I[0][0] == -1:
-            print("[Recognition] FAISS returned no valid indices.")
-            return None
+    results = []
+    for distances, ids in zip(D, I):
+        candidates = aggregate_neighbours(distances, ids, metadata, mode=mode, max_distance=max_distance)
+        print(f"[Recognition] Candidates: {candidates[:3]}")
+        metrics.incr("recognition.matched" if candidates else "recognition.no_match")
+        results.append(candidates)
+    return results
 
-        if I[0][0] >= len(metadata):
-            print(f"[Recognition] FAISS index {I[0][0]} out of bounds for metadata length {len(metadata)}")
-            return None
+# --- Helper: one ranking for several photos of the same dog ---
+def fuse_candidates(per_photo):
+    """
+    Fuse the rankings of an album's photos. A dog's distance is its mean over the photos
+    that matched anything; where it wasn't among a photo's candidates, that photo's furthest
+    candidate stands in (it was at least that far). Dogs seen in more photos break ties.
+    """
+    rankings = [{c["id"]: c for c in candidates} for candidates in per_photo if candidates]
+    if not rankings:
+        return []
+    worst = [max(c["distance"] for c in ranking.values()) for ranking in rankings]
+    fused = []
+    for dog_id in {dog_id for ranking in rankings for dog_id in ranking}:
+        distances = [ranking[dog_id]["distance"] if dog_id in ranking else fallback
+                     for ranking, fallback in zip(rankings, worst)]
+        found = [ranking[dog_id] for ranking in rankings if dog_id in ranking]
+        fused.append({
+            "id": dog_id,
+            "distance": float(np.mean(distances)),
+            "mean_distance": float(np.mean([c["mean_distance"] for c in found])),
+            "votes": sum(c["votes"] for c in found),
+            "photos": len(found),
+        })
+    fused.sort(key=lambda c: (c["distance"], -c["photos"]))
+    return fused
 
-        match = metadata[I[0][0]]
-        print(f"[Recognition] Matched dog: {match}")
-        return match
+# --- Batched recognition (one forward + one search for many photos) ---
+def recognize_photos(photos, cache=query_cache):
+    """
+    Rank candidate dogs for several photos at once; each may be a path, bytes, BytesIO, PIL
+    image, QueryPhoto or QueryAlbum. Returns one list per item, best candidate first (empty
+    when nothing is close enough); an album's photos share the batch and get one fused list.
+    Near-duplicates of recent photos are answered from the query cache.
+    """
+    flat, parts = [], []
+    for item in photos:
+        members = item.photos if isinstance(item, QueryAlbum) else [item]
+        parts.append((len(flat), len(members), isinstance(item, QueryAlbum)))
+        flat.extend(members)
+    per_photo = _recognize_each(flat, cache)
+    return [fuse_candidates(per_photo[start:start + n]) if album else per_photo[start]
+            for start, n, album in parts]
+
+def _recognize_each(photos, cache):
+    results = [[] for _ in photos]
+    try:
+        queries = [p if isinstance(p, QueryPhoto) else QueryPhoto(p) for p in photos]
+        with metrics.span("recognition.decode"):
+            images = [load_image(query.data) for query in queries]
+        valid = [i for i, img in enumerate(images) if img is not None]
+        if not valid:
+            return results
+
+        # Embed and search against the same index generation, even if a reload lands in between.
+        # The generation is read first: a reload in between only makes these entries expire early.
+        generation = index_holder.generation
+        snapshot = index_holder.snapshot()
+        if not generation:
+            generation = index_holder.generation  # this call loaded the first index
+        hashes = {i: dhash(images[i]) for i in valid}
+        misses = []
+        for i in valid:
+            cached = None if queries[i].fresh else cache.get_hash(hashes[i], generation, queries[i].file_unique_id)
+            if cached is None:
+                misses.append(i)
+            else:
+                results[i] = cached
+        if not misses:
+            return results
+
+        query_embs = get_embeddings([images[i] for i in misses], snapshot[2])
+        for i, embedding, candidates in zip(misses, query_embs, match_embeddings(query_embs, snapshot)):
+            results[i] = candidates
+            cache.put(hashes[i], candidates, embedding, generation, queries[i].file_unique_id)
+        return results
 
     except Exception as e:
-        print(f"[Recognition] Exception in get_dog_by_photo: {e}")
-        return None
+        print(f"[Recognition] Exception in recognize_photos: {e}")
+        return results
+
+def get_dog_by_photos(photos):
+    return [candidates[0] if candidates else None for candidates in recognize_photos(photos)]
+
+# --- Main recognition function ---
+def get_dog_by_photo(photo):
+    return get_dog_by_photos([photo])[0]
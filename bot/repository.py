@@ -0,0 +1,267 @@
+# bot/repository.py
+import asyncio
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import aiohttp
+
+from bot import photo_manifest
+from bot.db import get_supabase
+from bot.metrics import metrics
+from bot.thumbnails import ThumbnailCache
+from kas_config import SUPABASE_WORKERS, HTTP_POOL_SIZE, HTTP_TIMEOUT, SUPABASE_SLOW_MS, PHOTO_MANIFEST_TTL
+from kas_config import THUMBNAIL_DIR, THUMBNAIL_DISK_MB, THUMBNAIL_MEMORY_MB
+
+BUCKET_NAME = "kas.dogs"
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+
+
+class CallStats:
+    """Count, total and worst latency per repository call, e.g. stats["dogs"]."""
+
+    def __init__(self, slow_ms=SUPABASE_SLOW_MS):
+        self.slow_ms = slow_ms
+        self.calls = {}
+
+    def add(self, name, ms, failed=False):
+        count, total, worst, errors = self.calls.get(name, (0, 0.0, 0.0, 0))
+        self.calls[name] = (count + 1, total + ms, max(worst, ms), errors + int(failed))
+        metrics.observe(f"supabase.{name}", ms, unit="ms")
+        if failed:
+            metrics.incr(f"supabase.{name}.errors")
+        if self.slow_ms and ms >= self.slow_ms:
+            print(f"[Repository] Slow call {name}: {ms:.0f}ms{' (failed)' if failed else ''}")
+
+    def __getitem__(self, name):
+        count, total, worst, errors = self.calls[name]
+        return {"count": count, "mean_ms": total / count, "max_ms": worst, "errors": errors}
+
+    def summary(self):
+        return {name: self[name] for name in sorted(self.calls)}
+
+
+class DogRepository:
+    """
+    Async access to the dogs table and photo bucket for the handlers.
+
+    The supabase client is synchronous, so every query runs in a dedicated thread pool
+    (the default executor is shared with warm-up and other blocking work), and photo
+    downloads share one pooled aiohttp session. Every call is timed in `stats`.
+    Photos are served as cached thumbnails (see bot/thumbnails.py), keyed by the storage
+    version from the photo manifest or folder listing.
+    """
+
+    def __init__(self, client=None, bucket=BUCKET_NAME, workers=SUPABASE_WORKERS,
+                 pool_size=HTTP_POOL_SIZE, timeout=HTTP_TIMEOUT):
+        self._client = client
+        self.bucket = bucket
+        self.workers = max(1, int(workers))
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.stats = CallStats()
+        self._executor = None
+        self._session = None
+        self._manifest = None
+        self._manifest_at = 0.0
+        self._versions = {}  # storage path -> etag, from the manifest and listings
+        self.thumbnail_cache = ThumbnailCache(
+            THUMBNAIL_DIR, THUMBNAIL_DISK_MB * 1024 * 1024, THUMBNAIL_MEMORY_MB * 1024 * 1024
+        )
+
+    # --- Plumbing ---
+    @property
+    def client(self):
+        """The Supabase client, created on the first query (offline code never needs it)."""
+        if self._client is None:
+            self._client = get_supabase()
+        return self._client
+
+    async def _call(self, name, fn, *args):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="supabase")
+        start = time.perf_counter()
+        try:
+            result = await asyncio.get_event_loop().run_in_executor(self._executor, fn, *args)
+        except Exception:
+            self.stats.add(name, (time.perf_counter() - start) * 1000, failed=True)
+            raise
+        self.stats.add(name, (time.perf_counter() - start) * 1000)
+        return result
+
+    def _http(self):
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.pool_size),
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+            )
+        return self._session
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    # --- Dogs table ---
+    async def all_dogs(self, columns="*", page_size=1000):
+        """Every row of the dogs table (paged, PostgREST caps a response at 1000 rows)."""
+        def query():
+            rows, offset = [], 0
+            while True:
+                page = self.client.table("dogs").select(columns) \
+                    .order("id").range(offset, offset + page_size - 1).execute().data or []
+                rows.extend(page)
+                if len(page) < page_size:
+                    return rows
+                offset += page_size
+
+        return await self._call("all_dogs", query)
+
+    async def dogs_changed_since(self, column, since=None, page_size=1000):
+        """Rows whose `column` (e.g. updated_at) is past `since`, oldest first; all rows if since is None."""
+        def query():
+            rows, offset = [], 0
+            while True:
+                request = self.client.table("dogs").select("*")
+                if since is not None:
+                    request = request.gt(column, since)
+                page = request.order(column).range(offset, offset + page_size - 1).execute().data or []
+                rows.extend(page)
+                if len(page) < page_size:
+                    return rows
+                offset += page_size
+
+        return await self._call("dogs_changed_since", query)
+
+    async def dog_ids(self):
+        return {str(row["id"]) for row in await self.all_dogs("id")}
+
+    async def dog(self, dog_id):
+        def query():
+            rows = self.client.table("dogs").select("*").eq("id", dog_id).limit(1).execute().data
+            return rows[0] if rows else None
+
+        try:
+            return await self._call("dog", query)
+        except Exception as e:
+            print(f"Error fetching dog by ID {dog_id}: {e}")
+            return None
+
+    # --- Photo bucket ---
+    async def photo_names(self, dog_id, limit=100):
+        """Image filenames in the dog's folder."""
+        def query():
+            return self.client.storage.from_(self.bucket).list(str(dog_id), {"limit": limit}) or []
+
+        files = await self._call("photo_names", query)
+        names = []
+        for f in files:
+            if f["name"].lower().endswith(IMAGE_EXTENSIONS):
+                meta = f.get("metadata") or {}
+                self._versions[f"{dog_id}/{f['name']}"] = str(meta.get("eTag") or f.get("updated_at") or "")
+                names.append(f["name"])
+        return names
+
+    def public_url(self, path):
+        # Built locally by the client, no request involved
+        res = self.client.storage.from_(self.bucket).get_public_url(path)
+        if isinstance(res, dict):
+            return res.get("publicURL")
+        return getattr(res, "public_url", res)
+
+    async def photo_manifest(self):
+        """The bucket's photo manifest (see bot/photo_manifest.py), refreshed every PHOTO_MANIFEST_TTL s."""
+        if time.monotonic() - self._manifest_at > PHOTO_MANIFEST_TTL:
+            self._manifest_at = time.monotonic()
+            try:
+                data = await self.download(self.public_url(photo_manifest.MANIFEST_OBJECT))
+                self._manifest = json.loads(data)
+            except Exception as e:
+                # Keep serving the last good copy; without one, folders are listed per dog
+                print(f"[Repository] Photo manifest unavailable: {e}")
+        return self._manifest or {}
+
+    async def photos(self, dog_id):
+        """
+        Current image filenames of one dog, for profiles and galleries. Listed live, so photos
+        uploaded since the last manifest show up and deleted ones aren't requested; the
+        manifest only answers when the listing fails.
+        """
+        try:
+            return await self.photo_names(dog_id)
+        except Exception as e:
+            print(f"[ERROR] Listing photos of {dog_id}, using the manifest: {e}")
+            return [name for name, _ in photo_manifest.photo_entries(await self.photo_manifest(), dog_id) or ()]
+
+    async def photo_lists(self, dog_ids):
+        """
+        {dog_id: image filenames} for many dogs at once, for collage covers: one manifest
+        lookup, and concurrent folder listings only for dogs the manifest does not know yet.
+        The manifest may be as old as the last index build, so a cover can be missing.
+        """
+        manifest = await self.photo_manifest()
+        photos = {}
+        for dog_id in dog_ids:
+            entries = photo_manifest.photo_entries(manifest, dog_id)
+            photos[dog_id] = None if entries is None else [name for name, _ in entries]
+            for name, version in entries or ():
+                self._versions[f"{dog_id}/{name}"] = version
+        missing = [dog_id for dog_id, names in photos.items() if names is None]
+
+        async def listing(dog_id):
+            try:
+                return await self.photo_names(dog_id)
+            except Exception as e:
+                print(f"[ERROR] Listing photos of {dog_id}: {e}")
+                return []
+
+        for dog_id, names in zip(missing, await asyncio.gather(*(listing(d) for d in missing))):
+            photos[dog_id] = names
+        return photos
+
+    async def download(self, url):
+        """Bytes at `url` over the shared connection pool; raises on HTTP errors."""
+        start = time.perf_counter()
+        try:
+            async with self._http().get(url) as resp:
+                resp.raise_for_status()
+                data = await resp.read()
+        except Exception:
+            self.stats.add("download", (time.perf_counter() - start) * 1000, failed=True)
+            raise
+        self.stats.add("download", (time.perf_counter() - start) * 1000)
+        return data
+
+    def photo_version(self, path):
+        """
+        Storage version (etag) of a photo seen in the manifest or a listing. Unknown versions
+        change every PHOTO_MANIFEST_TTL seconds, so caches keyed on them (thumbnails, Telegram
+        file_ids, collages) fetch a photo replaced at the same path again within that time.
+        """
+        return self._versions.get(path) or f"unknown-{int(time.time() // max(PHOTO_MANIFEST_TTL, 1))}"
+
+    # --- Thumbnails ---
+    async def thumbnail(self, path, variant):
+        """JPEG bytes of a stored photo resized to `variant`; Storage is only hit on a cache miss."""
+        return await self.thumbnail_cache.get(
+            path, self.photo_version(path), variant, lambda: self.download(self.public_url(path))
+        )
+
+    async def thumbnail_many(self, paths, variant):
+        """Thumbnails for each path (None where it failed), at most `pool_size` fetches at a time."""
+        slots = asyncio.Semaphore(self.pool_size)
+
+        async def fetch(path):
+            async with slots:
+                try:
+                    return await self.thumbnail(path, variant)
+                except Exception as e:
+                    print(f"[ERROR] Loading photo {path}: {e}")
+                    return None
+
+        return await asyncio.gather(*(fetch(path) for path in paths))
+
+repo = DogRepository()
@@ -0,0 +1,159 @@
+# bot/server.py
+"""
+Webhook mode: Telegram POSTs updates to an aiohttp server instead of the bot polling.
+
+    BOT_MODE=webhook WEBHOOK_URL=https://example.org/kas-bot WEBHOOK_WORKERS=4 python -m bot.main
+
+With WEBHOOK_WORKERS > 1 the process forks that many workers, all listening on the same
+port (SO_REUSEPORT), so the kernel spreads Telegram's connections and recognition runs on
+several cores. Worker 0 registers the webhook and runs the singleton background jobs.
+
+Each update is acknowledged as soon as it is parsed and handled in a task, so a slow
+recognition does not hold one of Telegram's connections. On SIGTERM/SIGINT a worker stops
+accepting connections, waits up to SHUTDOWN_TIMEOUT seconds for the updates it already
+accepted, then stops the services. The webhook stays registered while the bot is down, so
+Telegram keeps the updates that arrive in between and delivers them after the restart.
+"""
+import asyncio
+import multiprocessing
+import os
+import signal
+from urllib.parse import urlparse
+
+from aiogram import Bot, Dispatcher, types
+from aiohttp import web
+
+from bot.metrics import metrics
+from kas_config import WEBHOOK_URL, WEBHOOK_SECRET, WEBHOOK_MAX_CONNECTIONS, WEBHOOK_WORKERS
+from kas_config import WEBAPP_HOST, WEBAPP_PORT, SHUTDOWN_TIMEOUT, DROP_PENDING_UPDATES, SESSION_BACKEND
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+class UpdateTasks:
+    """Updates accepted by this worker and still being handled."""
+
+    def __init__(self, dp):
+        self.dp = dp
+        self.accepted = 0
+        self._tasks = set()
+
+    def start(self, update):
+        # Handlers look the bot and dispatcher up from the context, like in polling mode
+        Bot.set_current(self.dp.bot)
+        Dispatcher.set_current(self.dp)
+        task = asyncio.ensure_future(self._process(update))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        self.accepted += 1
+
+    async def _process(self, update):
+        try:
+            await self.dp.process_update(update)
+        except Exception as e:
+            print(f"[Webhook] Update {update.update_id} failed: {e}")
+
+    def __len__(self):
+        return len(self._tasks)
+
+    async def drain(self, timeout):
+        if self._tasks:
+            print(f"[Webhook] Waiting for {len(self._tasks)} updates in progress...")
+        deadline = asyncio.get_event_loop().time() + timeout
+        # Loop: a request that was already being read may still add a task
+        while self._tasks:
+            remaining = deadline - asyncio.get_event_loop().time()
+            if remaining <= 0:
+                print(f"[Webhook] {len(self._tasks)} updates still running after {timeout:.0f}s, cancelling")
+                pending = set(self._tasks)
+                for task in pending:
+                    task.cancel()
+                await asyncio.gather(*pending, return_exceptions=True)
+                return
+            await asyncio.wait(set(self._tasks), timeout=remaining)
+
+
+def make_app(dp, start_services, stop_services, worker=0):
+    """
+    aiohttp app for one worker. `start_services(primary)` and `stop_services()` are the
+    bot's own startup/shutdown coroutines; primary is True for worker 0 only.
+    """
+    tasks = UpdateTasks(dp)
+    app = web.Application()
+
+    async def handle_update(request):
+        if WEBHOOK_SECRET and request.headers.get(SECRET_HEADER) != WEBHOOK_SECRET:
+            return web.Response(status=401)
+        tasks.start(types.Update(**await request.json()))
+        metrics.incr("webhook.updates")
+        return web.Response()
+
+    async def on_startup(_):
+        if worker == 0:
+            await dp.bot.set_webhook(
+                WEBHOOK_URL,
+                max_connections=WEBHOOK_MAX_CONNECTIONS,
+                secret_token=WEBHOOK_SECRET or None,
+                drop_pending_updates=DROP_PENDING_UPDATES,
+            )
+            print(f"[Webhook] Registered {WEBHOOK_URL}")
+        await start_services(primary=worker == 0, worker=worker)
+        print(f"[Webhook] Worker {worker} (pid {os.getpid()}) listening on {WEBAPP_HOST}:{WEBAPP_PORT}")
+
+    async def on_shutdown(_):
+        # A second signal (e.g. forwarded by the parent) must not cut the drain short
+        loop = asyncio.get_event_loop()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(signum, lambda: None)
+        # The listening socket is already closed here; finish what was accepted
+        await tasks.drain(SHUTDOWN_TIMEOUT)
+        await stop_services()
+        await (await dp.bot.get_session()).close()
+        print(f"[Webhook] Worker {worker} stopped after {tasks.accepted} updates")
+
+    metrics.gauge("webhook.in_flight", lambda: len(tasks))
+    app.router.add_post(urlparse(WEBHOOK_URL).path or "/", handle_update)
+    app.on_startup.append(on_startup)
+    app.on_shutdown.append(on_shutdown)
+    app["update_tasks"] = tasks
+    return app
+
+
+def _run_worker(dp, start_services, stop_services, worker, reuse_port=False):
+    asyncio.set_event_loop(asyncio.new_event_loop())
+    web.run_app(
+        make_app(dp, start_services, stop_services, worker),
+        host=WEBAPP_HOST, port=WEBAPP_PORT, reuse_port=reuse_port,
+        shutdown_timeout=SHUTDOWN_TIMEOUT, print=None,
+    )
+
+
+def run_webhook(dp, start_services, stop_services, workers=WEBHOOK_WORKERS):
+    if not WEBHOOK_URL:
+        raise SystemExit("BOT_MODE=webhook needs WEBHOOK_URL (the public https URL Telegram posts to)")
+    if workers <= 1:
+        _run_worker(dp, start_services, stop_services, 0)
+        return
+
+    if SESSION_BACKEND == "memory":
+        print("[Webhook] SESSION_BACKEND=memory with several workers: a user's next click may land on "
+              "a worker that doesn't know their session, set SESSION_BACKEND=sqlite")
+
+    # Fork before any event loop, thread pool or connection exists in this process
+    context = multiprocessing.get_context("fork")
+    processes = [context.Process(target=_run_worker, args=(dp, start_services, stop_services, worker, True),
+                                 name=f"kas-worker-{worker}")
+                 for worker in range(workers)]
+    for process in processes:
+        process.start()
+
+    def stop(signum, _frame):
+        for process in processes:
+            if process.is_alive():
+                os.kill(process.pid, signal.SIGTERM)
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    for process in processes:
+        process.join()
+    print(f"[Webhook] All {workers} workers stopped")
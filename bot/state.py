@@ -1,4 +1,159 @@
-profile_cache = {}
-recognized_dog_photos = {}
-user_dog_profiles = {}
-user_dog_index = {}
+# bot/state.py
+"""
+Per-user session state (the dogs a user is browsing, the dog last recognized for them).
+
+Entries hold ids only; names, texts and photo paths are looked up again from the catalog
+snapshot and the photo manifest when needed. Every entry expires `SESSION_TTL` seconds
+after it was last read or written, and the least recently used entries are dropped once
+there are more than `SESSION_MAX_ENTRIES`.
+
+SESSION_BACKEND=memory keeps them in this process. SESSION_BACKEND=sqlite keeps them in
+one SQLite file (SESSION_DB) that several bot processes on the same host can share.
+"""
+import asyncio
+import json
+import os
+import sqlite3
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from kas_config import SESSION_BACKEND, SESSION_DB, SESSION_TTL, SESSION_MAX_ENTRIES
+
+BACKENDS = ("memory", "sqlite")
+
+# Session kinds
+BROWSE = "browse"          # {"dogs": [dog_id, ...]} from the last catalog filter
+RECOGNIZED = "recognized"  # {"dog": dog_id} from the last recognized photo
+
+
+class MemorySessions:
+    def __init__(self, ttl=SESSION_TTL, max_entries=SESSION_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.evicted = 0
+        self._entries = OrderedDict()  # key -> (expires_at, value), least recently used first
+
+    async def get(self, user_id, kind):
+        key = (kind, user_id)
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries[key] = (time.monotonic() + self.ttl, entry[1])
+        self._entries.move_to_end(key)
+        return entry[1]
+
+    async def set(self, user_id, kind, value):
+        key = (kind, user_id)
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evicted += 1
+
+    async def delete(self, user_id, kind):
+        self._entries.pop((kind, user_id), None)
+
+    def stats(self):
+        return {"entries": len(self._entries), "evicted": self.evicted}
+
+
+class SQLiteSessions:
+    """
+    Same contract as MemorySessions, stored as JSON rows in SQLite. Every process opens
+    its own connection; WAL lets them read while another one writes.
+    """
+
+    # Expired and over-budget rows are purged every this many writes, not on each one
+    PURGE_EVERY = 100
+
+    def __init__(self, path=SESSION_DB, ttl=SESSION_TTL, max_entries=SESSION_MAX_ENTRIES):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.evicted = 0
+        self._writes = 0
+        self._conn = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sessions")
+
+    def _db(self):
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._conn = sqlite3.connect(self.path, timeout=5)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS sessions ("
+                "kind TEXT NOT NULL, user_id INTEGER NOT NULL, value TEXT NOT NULL, "
+                "expires_at REAL NOT NULL, PRIMARY KEY (kind, user_id))"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_sessions_expires ON sessions (expires_at)")
+            self._conn.commit()
+        return self._conn
+
+    async def _run(self, fn):
+        return await asyncio.get_event_loop().run_in_executor(self._executor, fn)
+
+    async def get(self, user_id, kind):
+        def query():
+            conn = self._db()
+            now = time.time()
+            row = conn.execute(
+                "SELECT value FROM sessions WHERE kind = ? AND user_id = ? AND expires_at >= ?",
+                (kind, user_id, now),
+            ).fetchone()
+            if row is None:
+                return None
+            # Sliding expiry; expires_at doubles as the LRU order
+            with conn:
+                conn.execute("UPDATE sessions SET expires_at = ? WHERE kind = ? AND user_id = ?",
+                             (now + self.ttl, kind, user_id))
+            return json.loads(row[0])
+
+        return await self._run(query)
+
+    async def set(self, user_id, kind, value):
+        def write():
+            conn = self._db()
+            now = time.time()
+            with conn:
+                conn.execute("INSERT OR REPLACE INTO sessions VALUES (?, ?, ?, ?)",
+                             (kind, user_id, json.dumps(value), now + self.ttl))
+                self._writes += 1
+                if self._writes % self.PURGE_EVERY == 0:
+                    self._purge(conn, now)
+
+        await self._run(write)
+
+    def _purge(self, conn, now):
+        conn.execute("DELETE FROM sessions WHERE expires_at < ?", (now,))
+        count = conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+        if count > self.max_entries:
+            conn.execute(
+                "DELETE FROM sessions WHERE rowid IN "
+                "(SELECT rowid FROM sessions ORDER BY expires_at LIMIT ?)",
+                (count - self.max_entries,),
+            )
+            self.evicted += count - self.max_entries
+
+    async def delete(self, user_id, kind):
+        def write():
+            with self._db() as conn:
+                conn.execute("DELETE FROM sessions WHERE kind = ? AND user_id = ?", (kind, user_id))
+
+        await self._run(write)
+
+    def stats(self):
+        return {"evicted": self.evicted}
+
+
+def make_sessions(kind=SESSION_BACKEND):
+    if kind not in BACKENDS:
+        raise ValueError(f"Unknown SESSION_BACKEND {kind!r}, expected one of {BACKENDS}")
+    return SQLiteSessions() if kind == "sqlite" else MemorySessions()
+
+
+sessions = make_sessions()
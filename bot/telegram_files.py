@@ -0,0 +1,148 @@
+# bot/telegram_files.py
+"""
+Telegram file_ids for photos the bot has already uploaded.
+
+Once Telegram has a photo it returns a file_id that can be sent again without uploading
+(or even loading) the bytes. Ids are stored per (storage path, variant) together with the
+storage version they were uploaded from; a changed photo or an id Telegram rejects falls
+back to a normal upload, which records the new id.
+"""
+import asyncio
+import os
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from aiogram.types import InputMediaPhoto
+from aiogram.utils.exceptions import BadRequest
+
+from bot.loader import bot
+from kas_config import TELEGRAM_FILE_DB
+
+
+class FileIdStore:
+    """
+    Ids are answered from memory; SQLite is only read once, on first use, and written on
+    each new id. Both run on one dedicated thread, never on the event loop.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self._conn = None
+        self._ids = None  # (path, variant) -> (version, file_id), loaded on first use
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="telegram-files")
+
+    def _db(self):
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._conn = sqlite3.connect(self.path)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS telegram_files ("
+                "path TEXT NOT NULL, variant TEXT NOT NULL, version TEXT NOT NULL, "
+                "file_id TEXT NOT NULL, updated_at REAL NOT NULL, PRIMARY KEY (path, variant))"
+            )
+        return self._conn
+
+    async def _run(self, fn, *args):
+        return await asyncio.get_event_loop().run_in_executor(self._executor, fn, *args)
+
+    def _load(self):
+        rows = self._db().execute("SELECT path, variant, version, file_id FROM telegram_files")
+        return {(path, variant): (version, file_id) for path, variant, version, file_id in rows}
+
+    async def get(self, path, version, variant):
+        if self._ids is None:
+            ids = await self._run(self._load)
+            if self._ids is None:
+                self._ids = ids
+        stored = self._ids.get((path, variant))
+        if stored and stored[0] == version:
+            self.hits += 1
+            return stored[1]
+        self.misses += 1
+        return None
+
+    def _write(self, sql, params):
+        with self._db() as conn:
+            conn.execute(sql, params)
+
+    async def put(self, path, version, variant, file_id):
+        if self._ids is not None:
+            self._ids[(path, variant)] = (version, file_id)
+        await self._run(self._write, "INSERT OR REPLACE INTO telegram_files VALUES (?, ?, ?, ?, ?)",
+                        (path, variant, version, file_id, time.time()))
+
+    async def forget(self, path, variant):
+        self.stale += 1
+        if self._ids is not None:
+            self._ids.pop((path, variant), None)
+        await self._run(self._write, "DELETE FROM telegram_files WHERE path = ? AND variant = ?", (path, variant))
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "stale": self.stale, "stored": len(self._ids or ())}
+
+
+file_ids = FileIdStore(TELEGRAM_FILE_DB)
+
+
+async def send_stored_photo(chat_id, path, version, variant, load, **kwargs):
+    """
+    Send a stored photo by file_id if Telegram already has it, else upload the bytes from
+    `load()` (a coroutine function) and remember the id Telegram assigns.
+    """
+    file_id = await file_ids.get(path, version, variant)
+    if file_id:
+        try:
+            return await bot.send_photo(chat_id, photo=file_id, **kwargs)
+        except BadRequest as e:
+            print(f"[Telegram] Stored file_id for {path} ({variant}) rejected, uploading again: {e}")
+            await file_ids.forget(path, variant)
+
+    message = await bot.send_photo(chat_id, photo=BytesIO(await load()), **kwargs)
+    await file_ids.put(path, version, variant, message.photo[-1].file_id)
+    return message
+
+
+async def send_stored_media_group(chat_id, photos, variant, load_many):
+    """
+    Send [(path, version), ...] as one album. Photos Telegram already has go by file_id,
+    the rest are loaded with `load_many(paths)` (bytes or None each) and uploaded.
+    """
+    known = {path: await file_ids.get(path, version, variant) for path, version in photos}
+    missing = [path for path, _ in photos if not known[path]]
+    loaded = dict(zip(missing, await load_many(missing))) if missing else {}
+
+    media, sent = [], []
+    for path, version in photos:
+        if known[path]:
+            media.append(InputMediaPhoto(media=known[path]))
+        elif loaded.get(path):
+            media.append(InputMediaPhoto(media=BytesIO(loaded[path])))
+        else:
+            continue
+        sent.append((path, version))
+    if not media:
+        return []
+
+    try:
+        messages = await bot.send_media_group(chat_id, media=media)
+    except BadRequest as e:
+        if not any(known.values()):
+            raise
+        # Some stored id went stale and Telegram doesn't say which: drop them all and upload
+        print(f"[Telegram] Stored file_ids rejected in album, uploading again: {e}")
+        for path, file_id in known.items():
+            if file_id:
+                await file_ids.forget(path, variant)
+        return await send_stored_media_group(chat_id, photos, variant, load_many)
+
+    for (path, version), message in zip(sent, messages):
+        if not known[path] and message.photo:
+            await file_ids.put(path, version, variant, message.photo[-1].file_id)
+    return messages
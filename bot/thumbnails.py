@@ -0,0 +1,186 @@
+# bot/thumbnails.py
+import asyncio
+import hashlib
+import io
+import os
+import threading
+from collections import OrderedDict
+
+from PIL import Image
+
+# name: bounding box; every photo the bot sends is one of these, never the original
+VARIANTS = {
+    "cell": (350, 300),       # catalog collage cell
+    "gallery": (400, 400),    # "more photos" media group
+    "profile": (1280, 1280),  # profile card (Telegram's own photo limit)
+}
+JPEG_QUALITY = 85
+
+
+def make_variant(data: bytes, variant: str) -> bytes:
+    """Downscale original image bytes into a JPEG that fits the variant's box."""
+    size = VARIANTS[variant]
+    img = Image.open(io.BytesIO(data))
+    img.draft("RGB", size)  # decode JPEGs at reduced scale straight away
+    img = img.convert("RGB")
+    img.thumbnail(size, Image.LANCZOS)
+    buf = io.BytesIO()
+    img.save(buf, format="JPEG", quality=JPEG_QUALITY)
+    return buf.getvalue()
+
+
+class ThumbnailCache:
+    """
+    Resized photos (and collages) keyed by (storage path, version, variant): a small in-memory
+    LRU in front of an on-disk LRU, each with its own byte budget. A new version of a photo
+    gets a new key, so stale thumbnails are never served and simply age out.
+    """
+
+    def __init__(self, directory, max_bytes, memory_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.memory_bytes = memory_bytes
+        self.hits_memory = 0
+        self.hits_disk = 0
+        self.misses = 0
+        self.evictions = 0
+        self._memory = OrderedDict()
+        self._memory_size = 0
+        self._disk = None  # filename -> size, least recently used first
+        self._disk_size = 0
+        self._disk_lock = threading.Lock()
+        self._inflight = {}
+
+    @staticmethod
+    def key(path, version, variant):
+        return hashlib.sha1(f"{path}\0{version}\0{variant}".encode()).hexdigest() + ".jpg"
+
+    def stats(self):
+        lookups = self.hits_memory + self.hits_disk + self.misses
+        return {
+            "hits_memory": self.hits_memory,
+            "hits_disk": self.hits_disk,
+            "misses": self.misses,
+            "hit_rate": (self.hits_memory + self.hits_disk) / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "memory_bytes": self._memory_size,
+            "disk_bytes": self._disk_size,
+            "disk_files": len(self._disk or ()),
+        }
+
+    # --- Memory tier ---
+    def _remember(self, key, data):
+        if len(data) > self.memory_bytes:
+            return
+        if key in self._memory:
+            self._memory_size -= len(self._memory.pop(key))
+        self._memory[key] = data
+        self._memory_size += len(data)
+        while self._memory_size > self.memory_bytes:
+            _, old = self._memory.popitem(last=False)
+            self._memory_size -= len(old)
+
+    # --- Disk tier (runs in a thread) ---
+    def _scan(self):
+        if self._disk is not None:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith(".jpg"):
+                st = os.stat(os.path.join(self.directory, name))
+                entries.append((st.st_mtime, name, st.st_size))
+        self._disk = OrderedDict((name, size) for _, name, size in sorted(entries))
+        self._disk_size = sum(self._disk.values())
+
+    def _read_disk(self, key):
+        with self._disk_lock:
+            return self._read_disk_locked(key)
+
+    def _write_disk(self, key, data):
+        with self._disk_lock:
+            self._write_disk_locked(key, data)
+
+    def _read_disk_locked(self, key):
+        self._scan()
+        if key not in self._disk:
+            return None
+        file_path = os.path.join(self.directory, key)
+        try:
+            with open(file_path, "rb") as f:
+                data = f.read()
+            os.utime(file_path)  # mtime is the LRU order across restarts
+        except OSError:
+            self._disk_size -= self._disk.pop(key)
+            return None
+        self._disk.move_to_end(key)
+        return data
+
+    def _write_disk_locked(self, key, data):
+        self._scan()
+        file_path = os.path.join(self.directory, key)
+        with open(file_path + ".tmp", "wb") as f:
+            f.write(data)
+        os.replace(file_path + ".tmp", file_path)
+        self._disk_size += len(data) - self._disk.pop(key, 0)
+        self._disk[key] = len(data)
+        while self._disk_size > self.max_bytes and len(self._disk) > 1:
+            old, size = self._disk.popitem(last=False)
+            self._disk_size -= size
+            self.evictions += 1
+            try:
+                os.remove(os.path.join(self.directory, old))
+            except OSError:
+                pass
+
+    # --- Lookup ---
+    async def get(self, path, version, variant, fetch):
+        """
+        Thumbnail bytes for a storage object; `fetch` is a coroutine function returning the
+        original bytes, only awaited on a miss.
+        """
+        async def render():
+            return await asyncio.get_event_loop().run_in_executor(None, make_variant, await fetch(), variant)
+
+        return await self.get_rendered(path, version, variant, render)
+
+    async def get_rendered(self, path, version, variant, render):
+        """
+        Cached bytes for any image derived from `path` at `version` (e.g. a collage);
+        `render` is a coroutine function producing them on a miss. If it raises, nothing is
+        stored. Concurrent misses for one key share a single render.
+        """
+        key = self.key(path, version, variant)
+        if key in self._memory:
+            self._memory.move_to_end(key)
+            self.hits_memory += 1
+            return self._memory[key]
+        if key in self._inflight:
+            return await asyncio.shield(self._inflight[key])
+
+        future = asyncio.get_event_loop().create_future()
+        self._inflight[key] = future
+        try:
+            data = await self._load(key, render)
+            future.set_result(data)
+            return data
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # retrieved here so failures nobody waited on are not logged
+            raise
+        finally:
+            if not future.done():
+                future.cancel()
+            del self._inflight[key]
+
+    async def _load(self, key, render):
+        loop = asyncio.get_event_loop()
+        data = await loop.run_in_executor(None, self._read_disk, key)
+        if data is not None:
+            self.hits_disk += 1
+        else:
+            self.misses += 1
+            data = await render()
+            await loop.run_in_executor(None, self._write_disk, key, data)
+        self._remember(key, data)
+        return data
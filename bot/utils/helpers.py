@@ -1,6 +1,7 @@
 import re
 import os
 import tempfile
+from io import BytesIO
 from PIL import Image, ImageDraw, ImageFont
 
 def escape_md(text: str) -> str:
@@ -17,26 +18,44 @@ def escape_md(text: str) -> str:
         return ""
     return re.sub(r'([_*[\]()~`>#+-=|{}.!])', r'\\\1', text)
 
-def create_collage(dog_data, collage_name="Dogs Collage", cell_size=(350, 300), cols=4):
-    if not dog_data:
-        return None
+_fonts = {}
 
-    images = []
-    for path, name in dog_data:
+def _load_font(size):
+    if size not in _fonts:
         try:
-            img = Image.open(path).convert("RGB")
-            images.append((img, name))
-        except Exception as e:
-            print(f"[ERROR] Opening image {path}: {e}")
+            _fonts[size] = ImageFont.truetype("arial.ttf", size)
+        except:
+            _fonts[size] = ImageFont.load_default()
+    return _fonts[size]
+
+def open_image(source, size=None):
+    """
+    PIL image from bytes, a file path, a file-like object or a PIL image. With `size`, JPEGs
+    are decoded at the smallest scale (1/2, 1/4, 1/8) that still covers it (draft mode).
+    """
+    if isinstance(source, Image.Image):
+        return source.convert("RGB")
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        source = BytesIO(source)
+    img = Image.open(source)
+    if size:
+        img.draft("RGB", size)
+    return img.convert("RGB")
+
+def build_collage(items, cell_size=(350, 300), cols=4, quality=75, draft=True):
+    """
+    Render [(image source or None, name), ...] into a JPEG collage and return its bytes.
+    Sources are anything `open_image` takes; None (or an image that fails to open) gets a
+    "No photo" placeholder. Images are decoded one at a time and pasted straight away, so
+    memory stays at the collage plus one photo however many dogs there are.
+    """
+    if not items:
+        return None
 
-    rows = (len(images) + cols - 1) // cols
+    rows = (len(items) + cols - 1) // cols
     cell_width, cell_height = cell_size
     font_size = 24
-
-    try:
-        font = ImageFont.truetype("arial.ttf", font_size)
-    except:
-        font = ImageFont.load_default()
+    font = _load_font(font_size)
 
     # Extra space at the top for the caption/empty line
     top_margin = font_size + 20  # adjust space height here
@@ -47,7 +66,15 @@ def create_collage(dog_data, collage_name="Dogs Collage", cell_size=(350, 300),
     collage = Image.new("RGB", (collage_width, collage_height), color="white")
     draw = ImageDraw.Draw(collage)
 
-    for idx, (img, name) in enumerate(images):
+    for idx, (source, name) in enumerate(items):
+        img = None
+        if source is not None:
+            try:
+                img = open_image(source, cell_size if draft else None)
+            except Exception as e:
+                print(f"[ERROR] Opening image for {name}: {e}")
+        if img is None:
+            img = placeholder_image(name, cell_size)
         img.thumbnail(cell_size, Image.LANCZOS)
 
         x = (idx % cols) * cell_width + (cell_width - img.width) // 2
@@ -60,19 +87,27 @@ def create_collage(dog_data, collage_name="Dogs Collage", cell_size=(350, 300),
         text_y = y + img.height + 5
         draw.text((text_x, text_y), name, fill="black", font=font)
 
+    out = BytesIO()
+    collage.save(out, format="JPEG", quality=quality)
+    return out.getvalue()
+
+def create_collage(dog_data, collage_name="Dogs Collage", cell_size=(350, 300), cols=4):
+    """File-path version of build_collage: [(path, name), ...] in, path of a temp JPEG out."""
+    data = build_collage(dog_data, cell_size=cell_size, cols=cols)
+    if data is None:
+        return None
+
+    # Unique file per call: concurrent users must not overwrite each other's collage
     temp_dir = os.getenv("TEMP") or "/tmp"
-    out_path = os.path.join(temp_dir, f"{collage_name.replace(' ', '_')}.jpg")
-    collage.save(out_path, format="JPEG")
+    fd, out_path = tempfile.mkstemp(prefix=f"{collage_name.replace(' ', '_')}_", suffix=".jpg", dir=temp_dir)
+    with os.fdopen(fd, "wb") as f:
+        f.write(data)
     return out_path
 
-def create_placeholder_image(text, size=(350, 300)):
+def placeholder_image(text, size=(350, 300)):
     img = Image.new("RGB", size, color="white")
     draw = ImageDraw.Draw(img)
-    font_size = 30
-    try:
-        font = ImageFont.truetype("arial.ttf", font_size)
-    except:
-        font = ImageFont.load_default()
+    font = _load_font(30)
 
     no_photo_text = "No photo"
     bbox = draw.textbbox((0, 0), no_photo_text, font=font)
@@ -84,7 +119,9 @@ def create_placeholder_image(text, size=(350, 300)):
     w = bbox[2] - bbox[0]
     h = bbox[3] - bbox[1]
     draw.text(((size[0] - w) / 2, size[1] * 3 // 4 - h // 2), text, fill="black", font=font)
+    return img
 
+def create_placeholder_image(text, size=(350, 300)):
     temp_path = os.path.join(tempfile.gettempdir(), f"placeholder_{text.replace(' ', '_')}.jpg")
-    img.save(temp_path)
+    placeholder_image(text, size).save(temp_path)
     return temp_path
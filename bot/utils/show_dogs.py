@@ -1,124 +1,114 @@
-import os
-import requests
-import tempfile
+import json
+import asyncio
+import hashlib
+from io import BytesIO
 from aiogram import types
 from bot.loader import bot, dp
-from bot.utils.helpers import escape_md, clean_text, create_collage
-from PIL import Image
-from bot.db import supabase
-from bot.state import user_dog_profiles, user_dog_index
+from bot.utils.helpers import clean_text, build_collage
+from bot.repository import repo
+from bot.catalog_snapshot import catalog
+from bot.dog_store import store
+from bot.telegram_files import send_stored_photo
+from bot.state import sessions, BROWSE
+from bot.metrics import metrics
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
-from PIL import Image, ImageDraw, ImageFont
 
 
-def create_placeholder_image(text, size=(350, 300)):
-    # Create a blank white image
-    img = Image.new("RGB", size, color="white")
-    draw = ImageDraw.Draw(img)
-    font_size = 30
-    try:
-        font = ImageFont.truetype("arial.ttf", font_size)
-    except:
-        font = ImageFont.load_default()
-
-    # Draw "No photo" text centered near the top
-    no_photo_text = "No photo"
-    bbox = draw.textbbox((0, 0), no_photo_text, font=font)
-    w, h = bbox[2] - bbox[0], bbox[3] - bbox[1]
-    draw.text(((size[0] - w) / 2, size[1] // 4 - h // 2), no_photo_text, fill="gray", font=font)
-
-    # Save to temp file and return path
-    temp_path = os.path.join(tempfile.gettempdir(), f"placeholder_{text.replace(' ', '_')}.jpg")
-    img.save(temp_path)
-    return temp_path
 async def get_dog_by_id(dog_id):
     try:
-        response = supabase.table("dogs").select("*").eq("id", dog_id).single().execute()
-        if response:
-            return response.data
-        else:
-            return None
+        dog = (await catalog.get()).dog(dog_id)
     except Exception as e:
-        print(f"Error fetching dog by ID {dog_id}: {e}")
-        return None
+        print(f"[Catalog] Unavailable, querying dog {dog_id} directly: {e}")
+        dog = None
+    # Dogs added since the last refresh are not in the snapshot yet
+    return dog or await store.dog(dog_id)
+
+# --- Collages (cached per filter; the key changes whenever its dogs or their covers do) ---
+COLLAGE_CELL = (350, 300)
+COLLAGE_COLS = 2
+
+class CollageIncomplete(Exception):
+    """Some covers could not be loaded; the collage is sent but not cached."""
+
+    def __init__(self, data):
+        super().__init__("collage rendered with missing covers")
+        self.data = data
+
+def collage_members(rows, photo_lists):
+    """(name, cover path or None) per dog, in display order."""
+    return [
+        (dog['name'].replace('\n', ' '), f"{dog['id']}/{photo_lists[dog['id']][0]}" if photo_lists[dog['id']] else None)
+        for dog in rows
+    ]
+
+def collage_version(members):
+    """Content hash of what the collage shows: names, covers and cover versions."""
+    content = [(name, path, repo.photo_version(path) if path else "") for name, path in members]
+    return hashlib.sha1(json.dumps(content).encode()).hexdigest()
+
+def collage_path(category=None, sector=None, pen=None):
+    return f"collages/{category or ''}/{sector or ''}/{pen or ''}"
+
+@metrics.timed("collage.render")
+async def render_collage(members):
+    with metrics.span("collage.covers"):
+        covers = iter(await repo.thumbnail_many([path for _, path in members if path], "cell"))
+    collage_input = []
+    complete = True
+    for name, path in members:
+        data = next(covers) if path else None
+        if path and not data:
+            complete = False  # dog left out, as before; not cached so it shows up next time
+            continue
+        collage_input.append((data, name))  # no photos at all: placeholder with the name
+
+    # Rendered from the in-memory thumbnails, off the event loop
+    with metrics.span("collage.build"):
+        data = await asyncio.get_event_loop().run_in_executor(
+            None, build_collage, collage_input, COLLAGE_CELL, COLLAGE_COLS
+        )
+    if data is None:
+        raise ValueError("no images for the collage")
+    if not complete:
+        raise CollageIncomplete(data)
+    return data
+
+async def cached_collage(path, version, members):
+    return await repo.thumbnail_cache.get_rendered(path, version, "collage", lambda: render_collage(members))
+
+async def send_collage(chat_id, rows, photo_lists, category=None, sector=None, pen=None):
+    """Sent by file_id if this exact collage went out before, else from the cache or rendered."""
+    members = collage_members(rows, photo_lists)
+    path, version = collage_path(category, sector, pen), collage_version(members)
+    try:
+        await send_stored_photo(chat_id, path, version, "collage", lambda: cached_collage(path, version, members))
+    except CollageIncomplete as e:
+        await bot.send_photo(chat_id, photo=BytesIO(e.data))
 
+@metrics.timed("catalog.total")
 async def show_dogs_by_filters(callback_query, category=None, sector=None, pen=None):
     wait_msg = await bot.send_message(callback_query.from_user.id, "⏳ Please wait...")
 
-    response = supabase.table("dogs").select(
-        "id, name, pen, sector, status, description"
-    ).eq("category", category)
-
-    if sector:
-        response = response.eq("sector", sector)
-    if pen:
-        response = response.eq("pen", pen)
-
-    data = response.execute()
+    try:
+        with metrics.span("catalog.rows"):
+            rows = (await catalog.get()).dogs(category=category, sector=sector, pen=pen)
+    except Exception as e:
+        print(f"Error fetching dogs ({category}, {sector}, {pen}): {e}")
+        rows = None
 
-    if (hasattr(data, 'error') and data.error) or data.data is None:
+    if rows is None:
         await bot.send_message(callback_query.from_user.id, "❌ Error fetching dogs data.")
         await wait_msg.delete()
         return
 
-    rows = data.data
     if not rows:
         await bot.send_message(callback_query.from_user.id, "📕 No dogs found.")
         await wait_msg.delete()
         return
 
-    profiles = []
-    collage_input = []
-
-    for dog in rows:
-        dog_id = dog['id']
-        name = dog['name']
-        pen_ = dog.get('pen')
-        sector_ = dog.get('sector')
-        status = dog.get('status')
-        desc = dog.get('description')
-
-        photos_response = supabase.storage.from_('kas.dogs').list(str(dog_id), {"limit": 100})
-        photo_list = []
-        if photos_response:
-            photo_filenames = [
-                file['name'] for file in photos_response
-                if file['name'].lower().endswith(('.jpg', '.jpeg', '.png'))
-            ]
-            if photo_filenames:
-                photo_list = photo_filenames
-
-        if photo_list:
-            # Download the first photo
-            filename = photo_list[0]
-            res = supabase.storage.from_('kas.dogs').get_public_url(f"{dog_id}/{filename}")
-            url = res.get("publicURL") if isinstance(res, dict) else res
-            if url:
-                try:
-                    img_data = requests.get(url).content
-                    temp_img_path = os.path.join(tempfile.gettempdir(), f"{dog_id}_{filename}")
-                    with open(temp_img_path, "wb") as f:
-                        f.write(img_data)
-                    clean_name = name.replace('\n', ' ')  # remove newlines
-                    collage_input.append((temp_img_path, clean_name))
-
-                except Exception as e:
-                    print(f"[ERROR] Downloading image {filename}: {e}")
-
-        else:
-            # No photos found - create placeholder image with dog name
-            placeholder_path = create_placeholder_image(name)
-            collage_input.append((placeholder_path, name.replace('\n', ' ')))
-
-        # Save profile info for future use (pagination etc.)
-        text = (
-            f"🐶 *{escape_md(name)}*\n"
-            f"📂 {escape_md(category or 'N/A')}\n"
-            f"📍 {escape_md(str(pen_ or sector_ or 'N/A'))}\n"
-            f"📋 Status: {escape_md(status or 'N/A')}\n"
-            f"📜 {escape_md(desc or 'No description yet')}"
-        )
-        profiles.append((text, dog_id, photo_list, f"{sector or ''}_{pen or ''}".strip("_")))
+    # Bulk path: photo lists from the manifest; covers are only loaded if the collage isn't cached
+    with metrics.span("catalog.photo_lists"):
+        photo_lists = await repo.photo_lists([dog['id'] for dog in rows])
 
     # Send number of dogs and filter info before the collage
     filter_text = []
@@ -135,23 +125,15 @@ async def show_dogs_by_filters(callback_query, category=None, sector=None, pen=N
         f"🐾 {len(rows)} dog{'s' if len(rows) != 1 else ''} filtered by {filter_summary}."
     )
 
-    if collage_input:
-        collage_path = create_collage(collage_input, collage_name="Filtered_Dogs", cell_size=(350, 300), cols=2)
-        if collage_path:
-            with open(collage_path, "rb") as file:
-                await bot.send_photo(callback_query.from_user.id, photo=file, )
-            os.remove(collage_path)
-
-        # Cleanup temp images
-        for path, _ in collage_input:
-            if os.path.exists(path):
-                os.remove(path)
-    else:
+    try:
+        with metrics.span("catalog.collage"):
+            await send_collage(callback_query.from_user.id, rows, photo_lists, category, sector, pen)
+    except Exception as e:
+        print(f"[ERROR] Collage for {collage_path(category, sector, pen)}: {e}")
         await bot.send_message(callback_query.from_user.id, "❌ No valid dog photos or placeholders found.")
 
-    # Store for navigation
-    user_dog_profiles[callback_query.from_user.id] = profiles
-    user_dog_index[callback_query.from_user.id] = 0
+    # Store for navigation (ids only, the profile list is rebuilt from the catalog)
+    await sessions.set(callback_query.from_user.id, BROWSE, {"dogs": [dog['id'] for dog in rows]})
 
     keyboard = InlineKeyboardMarkup()
     keyboard.add(InlineKeyboardButton("📋 View Dog Profiles", callback_data="show_profile_"))
@@ -159,3 +141,39 @@ async def show_dogs_by_filters(callback_query, category=None, sector=None, pen=N
     await bot.send_message(callback_query.from_user.id, "✅ Dogs shown in collage. What next?", reply_markup=keyboard)
 
     await wait_msg.delete()
+
+# --- Background pre-render of every catalog collage ---
+_prerender_lock = asyncio.Lock()
+
+async def prerender_collages():
+    """Render every catalog collage into the cache, so the first user to open a pen doesn't wait."""
+    async with _prerender_lock:  # passes queue up; a later one finds the earlier renders cached
+        await _prerender_collages()
+
+def prerender_on_change(_catalog):
+    """Catalog listener: render the collages of each new catalog generation in the background."""
+    asyncio.ensure_future(prerender_collages())
+
+async def _prerender_collages():
+    rendered = 0
+    snapshot = await catalog.get()
+    for category, sector, pen in snapshot.filters():
+        rows = snapshot.dogs(category=category, sector=sector, pen=pen)
+        if not rows:
+            continue
+        photo_lists = await repo.photo_lists([dog['id'] for dog in rows])
+        members = collage_members(rows, photo_lists)
+        try:
+            await cached_collage(collage_path(category, sector, pen), collage_version(members), members)
+            rendered += 1
+        except Exception as e:
+            print(f"[Collage] Pre-render of {collage_path(category, sector, pen)} failed: {e}")
+    print(f"[Collage] {rendered} collages cached")
+
+async def prerender_collages_forever(interval):
+    while True:
+        try:
+            await prerender_collages()
+        except Exception as e:
+            print(f"[Collage] Pre-render pass failed: {e}")
+        await asyncio.sleep(interval)
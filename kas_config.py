@@ -4,3 +4,99 @@ import os
 load_dotenv()
 
 BOT_TOKEN = os.getenv("BOT_TOKEN")
+
+# --- Serving mode (bot/server.py) ---
+BOT_MODE = os.getenv("BOT_MODE", "polling")  # polling | webhook
+DROP_PENDING_UPDATES = os.getenv("DROP_PENDING_UPDATES", "0") == "1"  # discard updates sent while the bot was down
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")  # public https URL Telegram posts to; its path is served
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")  # checked against Telegram's secret token header
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv("WEBHOOK_MAX_CONNECTIONS", "40"))
+WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS", "1"))  # processes sharing the port
+WEBAPP_HOST = os.getenv("WEBAPP_HOST", "0.0.0.0")
+WEBAPP_PORT = int(os.getenv("WEBAPP_PORT", "8080"))
+SHUTDOWN_TIMEOUT = float(os.getenv("SHUTDOWN_TIMEOUT", "30"))  # seconds to finish accepted updates on stop
+
+# --- Metrics (bot/metrics.py) ---
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))  # 0 = no endpoint; webhook worker N uses METRICS_PORT + N
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PROFILER = os.getenv("METRICS_PROFILER", "0") == "1"  # enables GET /profile?seconds=N
+METRICS_PROFILE_INTERVAL_MS = float(os.getenv("METRICS_PROFILE_INTERVAL_MS", "10"))
+
+# --- Recognition worker ---
+RECOGNITION_MAX_BATCH = int(os.getenv("RECOGNITION_MAX_BATCH", "8"))
+RECOGNITION_MAX_WAIT_MS = float(os.getenv("RECOGNITION_MAX_WAIT_MS", "20"))
+RECOGNITION_WORKERS = int(os.getenv("RECOGNITION_WORKERS", "1"))
+RECOGNITION_WARMUP = os.getenv("RECOGNITION_WARMUP", "1") == "1"  # load model/index in the background after startup
+
+# --- Query photo size (bot/photo_sizes.py) ---
+RECOGNITION_PHOTO_SIZE = os.getenv("RECOGNITION_PHOTO_SIZE", "adequate")  # adequate | largest
+RECOGNITION_MIN_PHOTO_SIDE = int(os.getenv("RECOGNITION_MIN_PHOTO_SIDE", "0"))  # 0 = model input size (224)
+# Retry with the largest size when the best match is further than this;
+# unset = RECOGNITION_RETRY_FRACTION of the index's match threshold, i.e. a match close to the cutoff
+RECOGNITION_RETRY_DISTANCE = float(os.getenv("RECOGNITION_RETRY_DISTANCE")) if os.getenv("RECOGNITION_RETRY_DISTANCE") else None
+RECOGNITION_RETRY_FRACTION = float(os.getenv("RECOGNITION_RETRY_FRACTION", "0.8"))
+RECOGNITION_RETRY_EMPTY = os.getenv("RECOGNITION_RETRY_EMPTY", "1") == "1"  # also retry when nothing matched (0 = don't)
+
+# --- Albums (bot/albums.py) ---
+ALBUM_WAIT_MS = float(os.getenv("ALBUM_WAIT_MS", "600"))  # quiet time that ends an album
+
+# --- Query cache (bot/query_cache.py) ---
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", "1000"))  # recent query photos kept, 0 disables
+QUERY_CACHE_HASH_DISTANCE = int(os.getenv("QUERY_CACHE_HASH_DISTANCE", "4"))  # differing dHash bits still a repeat
+
+# --- Supabase access (bot/repository.py) ---
+SUPABASE_WORKERS = int(os.getenv("SUPABASE_WORKERS", "8"))  # threads for blocking supabase calls
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "20"))  # max open connections for photo downloads
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "15"))  # seconds
+SUPABASE_SLOW_MS = float(os.getenv("SUPABASE_SLOW_MS", "500"))  # log calls slower than this, 0 disables
+PHOTO_MANIFEST_TTL = float(os.getenv("PHOTO_MANIFEST_TTL", "300"))  # seconds between photo manifest refreshes
+
+# --- Dogs table source (bot/dog_store.py) ---
+DOG_STORE = os.getenv("DOG_STORE", "supabase")  # supabase | sqlite (local replica, synced from Supabase)
+DOG_DB_PATH = os.getenv("DOG_DB_PATH", os.path.join(os.path.dirname(__file__), "cache", "dogs.db"))
+DOG_SYNC_INTERVAL = float(os.getenv("DOG_SYNC_INTERVAL", "300"))  # seconds between replica syncs, 0 disables
+DOG_SYNC_CURSOR = os.getenv("DOG_SYNC_CURSOR", "")  # e.g. updated_at; empty = fetch all rows and diff
+
+# --- Catalog snapshot (bot/catalog_snapshot.py) ---
+CATALOG_TTL = float(os.getenv("CATALOG_TTL", "300"))  # seconds before the in-memory dogs table is refreshed
+
+# --- Thumbnail cache (bot/thumbnails.py) ---
+THUMBNAIL_DIR = os.getenv("THUMBNAIL_DIR", os.path.join(os.path.dirname(__file__), "cache", "thumbnails"))
+THUMBNAIL_DISK_MB = float(os.getenv("THUMBNAIL_DISK_MB", "500"))
+THUMBNAIL_MEMORY_MB = float(os.getenv("THUMBNAIL_MEMORY_MB", "32"))
+# Telegram file_ids of uploaded photos, reused instead of uploading again
+TELEGRAM_FILE_DB = os.getenv("TELEGRAM_FILE_DB", os.path.join(os.path.dirname(__file__), "cache", "telegram_files.db"))
+# Render every catalog collage into the cache whenever the catalog changes (startup, sync, /reload_catalog)
+COLLAGE_PRERENDER = os.getenv("COLLAGE_PRERENDER", "1") == "1"
+# Also re-render on a timer (seconds), for cover photos that changed without a catalog change; 0 = off
+COLLAGE_PRERENDER_INTERVAL = float(os.getenv("COLLAGE_PRERENDER_INTERVAL", "0"))
+
+# --- User sessions (bot/state.py) ---
+SESSION_BACKEND = os.getenv("SESSION_BACKEND", "memory")  # memory | sqlite (shared by processes on one host)
+SESSION_DB = os.getenv("SESSION_DB", os.path.join(os.path.dirname(__file__), "cache", "sessions.db"))
+SESSION_TTL = float(os.getenv("SESSION_TTL", "3600"))  # seconds since last use
+SESSION_MAX_ENTRIES = int(os.getenv("SESSION_MAX_ENTRIES", "10000"))
+
+# --- Index hot reload ---
+INDEX_WATCH_INTERVAL = float(os.getenv("INDEX_WATCH_INTERVAL", "30"))  # seconds, 0 disables the watcher
+ADMIN_IDS = {int(x) for x in os.getenv("ADMIN_IDS", "").split(",") if x.strip()}
+
+# --- Matching ---
+MATCH_TOP_K = int(os.getenv("MATCH_TOP_K", "10"))
+MATCH_AGGREGATION = os.getenv("MATCH_AGGREGATION", "min")  # min | mean | vote
+# Neighbours further than this are ignored; unset = the threshold calibrated when the index was built
+# (equal error rate by default, see bot/index_factory.py)
+MATCH_MAX_DISTANCE = float(os.getenv("MATCH_MAX_DISTANCE")) if os.getenv("MATCH_MAX_DISTANCE") else None
+
+# --- Index build ---
+INDEX_TYPE = os.getenv("INDEX_TYPE", "flat")  # flat | ivf | hnsw | pq | ivfpq
+INDEX_METRIC = os.getenv("INDEX_METRIC", "l2")  # l2 | cosine
+# Map the index and labels read-only from disk, so processes on one host share their pages
+INDEX_MMAP = os.getenv("INDEX_MMAP", "1") == "1"
+
+# --- Embeddings ---
+# Model used for new index builds; queries always use the model recorded in the index
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "resnet50")  # resnet18 | resnet50
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")  # torch | torchscript | onnx | onnx-int8
+EMBEDDING_THREADS = int(os.getenv("EMBEDDING_THREADS", "0"))  # 0 = runtime default
+EMBEDDING_PARITY_MIN_COSINE = float(os.getenv("EMBEDDING_PARITY_MIN_COSINE", "0.99"))
@@ -0,0 +1,4 @@
+import os
+
+# Modules that create the aiogram Bot need a well-formed token; tests never talk to Telegram
+os.environ.setdefault("BOT_TOKEN", "123456:offline-tests")
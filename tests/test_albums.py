@@ -0,0 +1,56 @@
+import asyncio
+from types import SimpleNamespace
+
+from bot.albums import AlbumCollector
+
+
+def part(group, message_id):
+    return SimpleNamespace(media_group_id=group, message_id=message_id)
+
+
+async def deliver(collector, arrivals):
+    """Hand [(delay_s, message), ...] to the collector as Telegram would, one handler each."""
+    async def handle(delay, message):
+        await asyncio.sleep(delay)
+        return await collector.collect(message)
+
+    return await asyncio.gather(*(handle(delay, message) for delay, message in arrivals))
+
+
+def test_first_part_gets_the_whole_album_in_order():
+    collector = AlbumCollector(wait_ms=100)
+    arrivals = [(0.0, part("g", 11)), (0.01, part("g", 13)), (0.02, part("g", 12))]
+    results = asyncio.run(deliver(collector, arrivals))
+    assert [m.message_id for m in results[0]] == [11, 12, 13]
+    assert results[1:] == [None, None]
+
+
+def test_each_new_part_extends_the_wait():
+    collector = AlbumCollector(wait_ms=100)
+    # Parts 60 ms apart, 300 ms in all: each lands before the wait runs out, so all belong to one album
+    arrivals = [(0.06 * i, part("g", i)) for i in range(5)]
+    results = asyncio.run(deliver(collector, arrivals))
+    assert [m.message_id for m in results[0]] == [0, 1, 2, 3, 4]
+    assert results[1:] == [None] * 4
+
+
+def test_albums_are_grouped_by_media_group_id():
+    collector = AlbumCollector(wait_ms=100)
+    arrivals = [(0.0, part("a", 1)), (0.0, part("b", 2)), (0.01, part("a", 3)), (0.01, part("b", 4))]
+    results = asyncio.run(deliver(collector, arrivals))
+    assert [m.message_id for m in results[0]] == [1, 3]
+    assert [m.message_id for m in results[1]] == [2, 4]
+    assert results[2:] == [None, None]
+
+
+def test_a_group_seen_again_later_starts_a_new_album():
+    collector = AlbumCollector(wait_ms=20)
+
+    async def main():
+        first = await deliver(collector, [(0.0, part("g", 1))])
+        second = await deliver(collector, [(0.0, part("g", 2))])
+        return first, second
+
+    first, second = asyncio.run(main())
+    assert [m.message_id for m in first[0]] == [1]
+    assert [m.message_id for m in second[0]] == [2]
@@ -0,0 +1,115 @@
+import asyncio
+from io import BytesIO
+
+import pytest
+from PIL import Image
+
+from bot.thumbnails import ThumbnailCache
+from bot.utils import show_dogs
+from bot.utils.show_dogs import CollageIncomplete, collage_members, collage_version
+
+
+def jpeg(color):
+    buf = BytesIO()
+    Image.new("RGB", (80, 60), color).save(buf, format="JPEG")
+    return buf.getvalue()
+
+
+class FakeRepo:
+    """Storage versions and cover bytes by path; counts cover fetches."""
+
+    def __init__(self, tmp_path):
+        self.versions = {}
+        self.covers = {}
+        self.fetches = 0
+        self.thumbnail_cache = ThumbnailCache(str(tmp_path / "thumbs"), 10 * 1024 * 1024, 10 * 1024 * 1024)
+
+    def photo_version(self, path):
+        return self.versions.get(path, "v1")
+
+    async def thumbnail_many(self, paths, variant):
+        self.fetches += len(paths)
+        return [self.covers.get(path) for path in paths]
+
+
+class FakeBot:
+    def __init__(self):
+        self.sent = []
+
+    async def send_photo(self, chat_id, photo):
+        self.sent.append(photo.getvalue())
+
+
+@pytest.fixture
+def repo(monkeypatch, tmp_path):
+    repo = FakeRepo(tmp_path)
+    monkeypatch.setattr(show_dogs, "repo", repo)
+    return repo
+
+
+@pytest.fixture
+def sent(monkeypatch):
+    """Stands in for send_stored_photo: no file_id stored, always loads the collage."""
+    bot, loaded = FakeBot(), []
+
+    async def send_stored_photo(chat_id, path, version, variant, load, **kwargs):
+        loaded.append(await load())
+
+    monkeypatch.setattr(show_dogs, "bot", bot)
+    monkeypatch.setattr(show_dogs, "send_stored_photo", send_stored_photo)
+    return loaded, bot.sent
+
+
+ROWS = [{"id": "1", "name": "Rex"}, {"id": "2", "name": "Bo\nII"}, {"id": "3", "name": "Max"}]
+PHOTOS = {"1": ["a.jpg", "b.jpg"], "2": ["c.jpg"], "3": []}
+
+
+def test_members_use_each_dogs_first_photo():
+    assert collage_members(ROWS, PHOTOS) == [("Rex", "1/a.jpg"), ("Bo II", "2/c.jpg"), ("Max", None)]
+
+
+def test_collage_key_follows_names_covers_and_cover_versions(repo):
+    members = collage_members(ROWS, PHOTOS)
+    version = collage_version(members)
+    assert collage_version(collage_members(ROWS, PHOTOS)) == version
+    assert collage_version(collage_members(ROWS, dict(PHOTOS, **{"1": ["b.jpg"]}))) != version
+    assert collage_version(collage_members([dict(ROWS[0], name="Rexy")] + ROWS[1:], PHOTOS)) != version
+    assert collage_version(members[:2]) != version
+    repo.versions["2/c.jpg"] = "v2"  # cover replaced at the same path
+    assert collage_version(members) != version
+
+
+def test_complete_collage_is_rendered_once(repo, sent):
+    repo.covers = {"1/a.jpg": jpeg("red"), "2/c.jpg": jpeg("blue")}
+    loaded, _ = sent
+
+    async def main():
+        for _ in range(2):
+            await show_dogs.send_collage(1, ROWS, PHOTOS, "shelter", 1, "2")
+
+    asyncio.run(main())
+    assert repo.fetches == 2  # the second send comes from the cache
+    assert loaded[0] == loaded[1]
+    assert Image.open(BytesIO(loaded[0])).format == "JPEG"
+
+
+def test_collage_with_missing_covers_is_sent_but_not_cached(repo, sent):
+    repo.covers = {"1/a.jpg": jpeg("red")}  # 2/c.jpg fails to load
+    loaded, direct = sent
+
+    async def main():
+        await show_dogs.send_collage(1, ROWS, PHOTOS, "home")
+        repo.covers["2/c.jpg"] = jpeg("blue")
+        await show_dogs.send_collage(1, ROWS, PHOTOS, "home")
+
+    asyncio.run(main())
+    assert len(direct) == 1  # the partial collage went out directly
+    assert repo.fetches == 4  # nothing was cached, so the second send rendered again
+    assert len(loaded) == 1  # complete this time, through the cache
+
+
+def test_render_raises_incomplete_with_the_partial_collage(repo):
+    repo.covers = {"1/a.jpg": jpeg("red")}
+    with pytest.raises(CollageIncomplete) as raised:
+        asyncio.run(show_dogs.render_collage(collage_members(ROWS, PHOTOS)))
+    assert Image.open(BytesIO(raised.value.data)).format == "JPEG"
@@ -0,0 +1,159 @@
+import asyncio
+
+import pytest
+
+from bot.catalog_snapshot import Catalog, CatalogSnapshot
+from bot.dog_store import SQLiteDogStore, sync_replica
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+class FakeRemote:
+    """Stands in for the Supabase repository: serves a list of rows."""
+
+    def __init__(self, rows):
+        self.rows = rows
+
+    async def all_dogs(self, columns="*"):
+        return [dict(row) for row in self.rows]
+
+    async def dogs_changed_since(self, column, since):
+        return [dict(row) for row in self.rows if since is None or str(row[column]) > since]
+
+    async def dog_ids(self):
+        return {str(row["id"]) for row in self.rows}
+
+
+ROWS = [
+    {"id": 1, "name": "Rex", "category": "shelter", "sector": 2, "pen": "3", "status": None, "extra": {"a": 1}},
+    {"id": 2, "name": "Bo", "category": "home", "sector": None, "pen": None, "status": "adopted"},
+]
+
+
+@pytest.fixture
+def replica(tmp_path):
+    return SQLiteDogStore(str(tmp_path / "cache" / "dogs.db"))
+
+
+def test_empty_replica_reads_missing_columns_as_null(replica):
+    assert run(replica.all_dogs("id, name, category")) == []
+    assert run(replica.dog(1)) is None
+
+
+def test_apply_creates_columns_from_the_remote_rows(replica):
+    async def main():
+        assert await replica.apply(ROWS, [], {"last_sync_at": 1}) == (2, 0)
+        return await replica.dog(1), await replica.all_dogs("id, category, sector, pen"), await replica.sync_state("last_sync_at")
+
+    dog, rows, synced_at = run(main())
+    assert dog == {"id": "1", "name": "Rex", "category": "shelter", "sector": 2, "pen": "3",
+                   "status": None, "extra": '{"a": 1}'}
+    assert rows[1] == {"id": "2", "category": "home", "sector": None, "pen": None}
+    assert synced_at == "1"
+
+
+def test_apply_skips_unchanged_rows_and_updates_changed_ones(replica):
+    async def main():
+        await replica.apply(ROWS, [], {})
+        changed = [dict(ROWS[0], name="Rex II"), ROWS[1]]
+        assert await replica.apply(changed, [], {}) == (1, 0)
+        return await replica.dog(1)
+
+    assert run(main())["name"] == "Rex II"
+
+
+def test_apply_adds_columns_that_appear_later(replica):
+    async def main():
+        await replica.apply(ROWS, [], {})
+        await replica.apply([dict(ROWS[1], breed="mix")], [], {})
+        return await replica.dog(2), await replica.dog(1)
+
+    bo, rex = run(main())
+    assert bo["breed"] == "mix"
+    assert rex["breed"] is None
+
+
+def test_sync_replica_deletes_dogs_gone_from_the_remote(replica):
+    remote = FakeRemote(ROWS)
+
+    async def main():
+        assert await sync_replica(replica, remote, cursor_column="") == (2, 0)
+        remote.rows = ROWS[:1]
+        assert await sync_replica(replica, remote, cursor_column="") == (0, 1)
+        return await replica.ids()
+
+    assert run(main()) == {"1"}
+
+
+def test_sync_replica_with_a_cursor_fetches_changes_and_spots_deletions(replica):
+    rows = [dict(row, updated_at=f"2026-01-0{i + 1}") for i, row in enumerate(ROWS)]
+    remote = FakeRemote(rows)
+
+    async def main():
+        await sync_replica(replica, remote, cursor_column="updated_at")
+        cursor = await replica.sync_state("cursor")
+        remote.rows = [dict(rows[0], name="Rex II", updated_at="2026-01-05")]
+        result = await sync_replica(replica, remote, cursor_column="updated_at")
+        return cursor, result, await replica.dog(1), await replica.ids()
+
+    cursor, result, rex, ids = run(main())
+    assert cursor == "2026-01-02"
+    assert result == (1, 1)
+    assert rex["name"] == "Rex II"
+    assert ids == {"1"}
+
+
+CATALOG_ROWS = [
+    {"id": "1", "name": "A", "category": "shelter", "sector": 1, "pen": "10"},
+    {"id": "2", "name": "B", "category": "shelter", "sector": 1, "pen": "2"},
+    {"id": "3", "name": "C", "category": "shelter", "sector": 2, "pen": None},
+    {"id": "4", "name": "D", "category": "home", "sector": None, "pen": None},
+]
+
+
+def test_catalog_dogs_filters_by_category_sector_and_pen():
+    catalog = Catalog(CATALOG_ROWS, generation=1)
+    assert [row["id"] for row in catalog.dogs("shelter")] == ["1", "2", "3"]
+    assert [row["id"] for row in catalog.dogs("shelter", "1")] == ["1", "2"]
+    assert [row["id"] for row in catalog.dogs("shelter", 1, "2")] == ["2"]
+    assert [row["id"] for row in catalog.dogs("home")] == ["4"]
+    assert catalog.dogs("shelter", "9") == []
+
+
+def test_catalog_menus():
+    catalog = Catalog(CATALOG_ROWS, generation=1)
+    assert catalog.categories == ["home", "shelter"]
+    assert catalog.sectors("shelter") == [1, 2]
+    assert catalog.pens("shelter", "1") == ["2", "10"]  # natural order
+    assert catalog.filters() == [("home", None, None), ("shelter", 1, "2"), ("shelter", 1, "10"), ("shelter", 2, None)]
+
+
+def test_catalog_snapshot_serves_a_replica_without_network(replica):
+    async def main():
+        await replica.apply(CATALOG_ROWS, [], {})
+        snapshot = CatalogSnapshot(replica, ttl=60)
+        first = await snapshot.get()
+        again = await snapshot.refresh()  # same rows: same copy, same generation
+        return first, again
+
+    first, again = run(main())
+    assert [row["name"] for row in first.dogs("shelter", 1)] == ["A", "B"]
+    assert again is first and first.generation == 1
+
+
+def test_catalog_snapshot_notifies_new_generations_only(replica):
+    seen = []
+
+    async def main():
+        await replica.apply(CATALOG_ROWS, [], {})
+        snapshot = CatalogSnapshot(replica, ttl=60)
+        snapshot.on_change(lambda catalog: seen.append(catalog.generation))
+        await snapshot.refresh()
+        await snapshot.refresh()  # same rows
+        await replica.apply([dict(CATALOG_ROWS[0], name="Renamed")], [], {})
+        await snapshot.refresh()
+
+    run(main())
+    assert seen == [1, 2]
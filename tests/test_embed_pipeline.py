@@ -0,0 +1,51 @@
+from io import BytesIO
+
+from PIL import Image
+
+from bot.embed_pipeline import embed_files
+
+
+def jpeg(shade):
+    buf = BytesIO()
+    Image.new("RGB", (64, 48), (shade, shade, shade)).save(buf, format="JPEG")
+    return buf.getvalue()
+
+
+FILES = {f"dog/{i}.jpg": jpeg(i * 20) for i in range(7)}
+
+
+def download(path):
+    if path == "dog/broken.jpg":
+        return b"not an image"
+    if path == "dog/missing.jpg":
+        raise FileNotFoundError(path)
+    return FILES[path]
+
+
+def mean_pixel(batch):
+    # One number per image that tells the inputs apart, so results can be matched to paths
+    return batch.reshape(len(batch), -1).mean(axis=1, keepdims=True)
+
+
+def test_results_keep_the_input_order_and_report_failures(capsys):
+    paths = ["dog/0.jpg", "dog/broken.jpg", "dog/1.jpg", "dog/2.jpg", "dog/missing.jpg", "dog/3.jpg", "dog/4.jpg"]
+    batches = []
+
+    def embed(batch):
+        batches.append(len(batch))
+        return mean_pixel(batch)
+
+    results = list(embed_files(paths, download, embed, batch_size=2, download_workers=3, decode_workers=1,
+                               max_in_flight=3))
+    assert [path for path, _ in results] == paths
+    failed = [path for path, emb in results if emb is None]
+    assert failed == ["dog/broken.jpg", "dog/missing.jpg"]
+
+    embedded = [emb[0] for _, emb in results if emb is not None]
+    assert embedded == sorted(embedded)  # shades increase with the file number
+    assert sum(batches) == 5 and max(batches) <= 2
+    assert "5 embedded, 2 failed" in capsys.readouterr().out
+
+
+def test_no_paths_yield_nothing():
+    assert list(embed_files([], download, mean_pixel, decode_workers=1)) == []
@@ -0,0 +1,109 @@
+import zlib
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from bot import embeddings, index_factory
+
+DIM = 8
+
+
+def vector(path, version):
+    # Same object version -> same embedding; dogs are far apart so calibration has impostors
+    rng = np.random.default_rng(zlib.crc32(f"{path}@{version}".encode()))
+    centre = np.full(DIM, 10.0 * int(path.split("/")[0]), dtype="float32")
+    return centre + rng.standard_normal(DIM).astype("float32")
+
+
+class FakeBucket:
+    """Stands in for Storage and the model: objects are {path: version}, embeddings derive from both."""
+
+    def __init__(self, monkeypatch, tmp_path):
+        self.objects = {}
+        self.embedded = []
+        index_path = str(tmp_path / "dog_index.faiss")
+        for name, value in {
+            "INDEX_PATH": index_path,
+            "LABELS_PATH": str(tmp_path / "dog_labels.npy"),
+            "MANIFEST_PATH": index_factory.manifest_path(index_path),
+            "CACHE_PATH": str(tmp_path / "dog_embeddings.npz"),
+        }.items():
+            monkeypatch.setattr(embeddings, name, value)
+        monkeypatch.setattr(embeddings, "list_all_objects", lambda: dict(self.objects))
+        monkeypatch.setattr(embeddings, "get_supabase", lambda: None)
+        monkeypatch.setattr(embeddings.photo_manifest, "publish", lambda *args: None)
+        monkeypatch.setattr(embeddings, "get_encoder", lambda model_name: SimpleNamespace(embed_arrays=None))
+        monkeypatch.setattr(embeddings, "embed_files", self.embed_files)
+
+    def embed_files(self, paths, download, embed_batch, **kwargs):
+        for path in paths:
+            self.embedded.append(path)
+            yield path, None if "broken" in path else vector(path, self.objects[path])
+
+    def build(self, **kwargs):
+        self.embedded = []
+        return embeddings.build_index_from_supabase(spec=index_factory.make_spec("flat", "l2"), **kwargs)
+
+
+def stored(index):
+    ids, vectors = index_factory.index_vectors(index)
+    return {int(i): v for i, v in zip(ids, vectors)}
+
+
+@pytest.fixture
+def bucket(monkeypatch, tmp_path):
+    return FakeBucket(monkeypatch, tmp_path)
+
+
+def test_incremental_build_adds_changes_and_removes(bucket):
+    bucket.objects = {"1/a.jpg": "v1", "1/b.jpg": "v1", "2/a.jpg": "v1", "3/a.jpg": "v1"}
+    index, labels = bucket.build()
+    assert sorted(bucket.embedded) == sorted(bucket.objects)
+    ids = {path: idx for path, (idx, _, _) in embeddings.load_embedding_cache(embeddings.CACHE_PATH).items()}
+    assert sorted(ids.values()) == [0, 1, 2, 3]
+
+    # 1/b deleted, 2/a replaced in place, 4/a new
+    bucket.objects = {"1/a.jpg": "v1", "2/a.jpg": "v2", "3/a.jpg": "v1", "4/a.jpg": "v1"}
+    index, labels = bucket.build()
+    assert sorted(bucket.embedded) == ["2/a.jpg", "4/a.jpg"]
+
+    cache = embeddings.load_embedding_cache(embeddings.CACHE_PATH)
+    assert cache["2/a.jpg"][0] == ids["2/a.jpg"]  # a changed image keeps its id
+    assert cache["4/a.jpg"][0] == 4  # a new one never takes a freed id
+    assert labels[ids["1/b.jpg"]] == ""  # the deleted image's id is freed
+    vectors = stored(index)
+    assert ids["1/b.jpg"] not in vectors
+    assert index.ntotal == 4
+    np.testing.assert_allclose(vectors[ids["2/a.jpg"]], vector("2/a.jpg", "v2"), rtol=1e-5)
+    np.testing.assert_allclose(vectors[4], vector("4/a.jpg", "v1"), rtol=1e-5)
+
+    # What the bot loads matches what was built
+    manifest = index_factory.read_manifest(embeddings.MANIFEST_PATH)
+    assert manifest["ntotal"] == 4
+    read = index_factory.read_labels(embeddings.LABELS_PATH, manifest, mmap=False)
+    assert list(read[np.arange(5)]) == ["1", "", "2", "3", "4"]
+
+
+def test_unchanged_bucket_embeds_nothing(bucket):
+    bucket.objects = {"1/a.jpg": "v1", "2/a.jpg": "v1"}
+    bucket.build()
+    index, _ = bucket.build()
+    assert bucket.embedded == []
+    assert index.ntotal == 2
+
+
+def test_full_build_re_embeds_everything(bucket):
+    bucket.objects = {"1/a.jpg": "v1", "2/a.jpg": "v1"}
+    bucket.build()
+    bucket.build(incremental=False)
+    assert sorted(bucket.embedded) == ["1/a.jpg", "2/a.jpg"]
+
+
+def test_failed_images_are_left_out_and_retried(bucket):
+    bucket.objects = {"1/a.jpg": "v1", "1/broken.jpg": "v1", "2/a.jpg": "v1"}
+    index, labels = bucket.build()
+    assert index.ntotal == 2
+    assert "1/broken.jpg" not in embeddings.load_embedding_cache(embeddings.CACHE_PATH)
+    bucket.build()
+    assert bucket.embedded == ["1/broken.jpg"]  # not in the store, so tried again next build
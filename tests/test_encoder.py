@@ -0,0 +1,29 @@
+import pytest
+
+from bot.encoder import check_manifest, embedding_info, manifest_embedding
+
+
+def test_manifest_without_embedding_info_is_legacy():
+    info = manifest_embedding({"dim": 2048})
+    assert info["model"] == "resnet50"
+    assert info["legacy"] and info["version"] == 0
+
+
+def test_legacy_index_is_served_with_a_warning(capsys):
+    assert check_manifest({"dim": 512}, 512)["legacy"]
+    assert "Legacy index" in capsys.readouterr().out
+
+
+def test_legacy_index_with_the_wrong_dim_is_rejected():
+    with pytest.raises(ValueError, match="dim"):
+        check_manifest({"embedding": manifest_embedding({"dim": 512})}, 2048)
+
+
+def test_current_embedding_is_accepted():
+    assert check_manifest({"embedding": embedding_info("resnet18")}, 512)["model"] == "resnet18"
+
+
+def test_other_embedding_version_is_rejected():
+    info = dict(embedding_info("resnet18"), version=99)
+    with pytest.raises(ValueError, match="rebuild"):
+        check_manifest({"embedding": info}, 512)
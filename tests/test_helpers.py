@@ -0,0 +1,40 @@
+from io import BytesIO
+
+from PIL import Image
+
+from bot.utils.helpers import build_collage, open_image
+
+CELL = (350, 300)
+
+
+def jpeg(size, color):
+    buf = BytesIO()
+    Image.new("RGB", size, color).save(buf, format="JPEG", quality=95)
+    return buf.getvalue()
+
+
+def test_draft_decodes_large_jpegs_at_a_reduced_scale():
+    img = open_image(jpeg((2000, 1600), "red"), CELL)
+    assert img.size == (500, 400)  # 1/4 still covers the cell, 1/8 would not
+    assert open_image(jpeg((2000, 1600), "red")).size == (2000, 1600)
+
+
+def test_draft_leaves_small_images_alone():
+    assert open_image(jpeg((300, 200), "red"), CELL).size == (300, 200)
+
+
+def test_collage_from_bytes_in_display_order():
+    items = [(jpeg((1200, 900), (255, 0, 0)), "Rex"), (None, "Bo"), (b"not a jpeg", "Max")]
+    collage = Image.open(BytesIO(build_collage(items, CELL, cols=2)))
+    font_size, top_margin = 24, 44
+    assert collage.size == (2 * CELL[0], 2 * (CELL[1] + font_size + 10) + top_margin)
+
+    # Cell 1 holds the red photo; the dog without a photo and the broken one get placeholders
+    red = collage.getpixel((CELL[0] // 2, top_margin + CELL[1] // 2))
+    assert red[0] > 200 and red[1] < 60 and red[2] < 60
+    for x, y in ((CELL[0] + 5, top_margin + 5), (5, top_margin + CELL[1] + font_size + 15)):
+        assert min(collage.getpixel((x, y))) > 230  # white placeholder background
+
+
+def test_empty_collage_is_none():
+    assert build_collage([], CELL) is None
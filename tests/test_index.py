@@ -0,0 +1,176 @@
+import os
+
+import faiss
+import numpy as np
+import pytest
+
+from bot import index_factory
+from bot.index_factory import Labels, read_labels, write_index_files
+from bot.index_holder import IndexHolder
+
+
+def test_calibrated_threshold_separates_dogs():
+    rng = np.random.default_rng(0)
+    centres = rng.standard_normal((10, 16)).astype("float32") * 10
+    owner = np.repeat(np.arange(10), 5)
+    vectors = centres[owner] + rng.standard_normal((50, 16)).astype("float32")
+    labels = np.array([f"{dog:04d}" for dog in owner])
+    spec = index_factory.make_spec("flat", "l2")
+    index = index_factory.build_index(spec, vectors, np.arange(50))
+    match = index_factory.calibrate_threshold(index, labels, spec, false_accept=0.05)
+    genuine, impostor = index_factory.nearest_by_kind(index, labels, spec)
+    assert genuine.max() < match["max_distance"]
+    assert np.mean(impostor < match["max_distance"]) <= 0.1  # 5% of 50, interpolated
+    assert match["genuine_kept"] == 1.0
+    assert match["operating_point"] == "false_accept"
+
+
+def test_default_threshold_balances_the_error_rates():
+    rng = np.random.default_rng(1)
+    # Overlapping dogs: no threshold separates them, the default loses as many genuine
+    # pairs as it accepts impostors
+    centres = rng.standard_normal((20, 16)).astype("float32") * 1.5
+    owner = np.repeat(np.arange(20), 4)
+    vectors = centres[owner] + rng.standard_normal((80, 16)).astype("float32")
+    labels = np.array([f"{dog:04d}" for dog in owner])
+    spec = index_factory.make_spec("flat", "l2")
+    index = index_factory.build_index(spec, vectors, np.arange(80))
+    match = index_factory.calibrate_threshold(index, labels, spec)
+    assert match["operating_point"] == "eer"
+    assert 0 < match["false_accept"] < 1
+    assert abs(match["false_accept"] - (1 - match["genuine_kept"])) <= 0.05
+    strict = index_factory.calibrate_threshold(index, labels, spec, false_accept=0.01)
+    assert strict["max_distance"] < match["max_distance"]
+
+
+def test_no_threshold_with_a_single_dog():
+    spec = index_factory.make_spec("flat", "l2")
+    index = index_factory.build_index(spec, np.eye(4, dtype="float32"), np.arange(4))
+    assert index_factory.calibrate_threshold(index, np.array(["a"] * 4), spec) is None
+
+
+def test_labels_from_strings_maps_freed_ids_to_minus_one():
+    labels = Labels.from_strings(np.array(["0002", "", "0001", "0002"]))
+    assert labels.ordinals.dtype == np.int32
+    assert list(labels.dogs) == ["0001", "0002"]
+    assert list(labels.ordinals) == [1, -1, 0, 1]
+    assert labels.live == 3
+    assert len(labels) == 4
+    assert list(labels[np.array([0, 1, 2])]) == ["0002", "", "0001"]
+
+
+def test_labels_from_strings_without_freed_ids():
+    labels = Labels.from_strings(np.array(["b", "a"]))
+    assert list(labels.dogs) == ["a", "b"]
+    assert list(labels.ordinals) == [1, 0]
+
+
+def build(tmp_path, labels):
+    vectors = np.random.default_rng(0).standard_normal((len(labels), 8)).astype("float32")
+    ids = np.array([i for i, label in enumerate(labels) if label])
+    spec = index_factory.make_spec("flat", "l2")
+    index = index_factory.build_index(spec, vectors[ids], ids)
+    paths = str(tmp_path / "i.faiss"), str(tmp_path / "l.npy")
+    write_index_files(index, np.array(labels), index_factory.manifest_for(spec, index), *paths)
+    return index, paths
+
+
+@pytest.mark.parametrize("mmap", [True, False])
+def test_written_labels_round_trip(tmp_path, mmap):
+    _, (index_path, labels_path) = build(tmp_path, ["0001", "", "0002", "0001"])
+    manifest = index_factory.read_manifest(index_factory.manifest_path(index_path))
+    labels = read_labels(labels_path, manifest, mmap=mmap)
+    assert np.load(labels_path).dtype == np.int32
+    assert list(labels[np.arange(4)]) == ["0001", "", "0002", "0001"]
+
+
+def test_read_labels_rejects_labels_from_another_build(tmp_path):
+    _, (index_path, labels_path) = build(tmp_path, ["0001", "0002", "0001"])
+    manifest = index_factory.read_manifest(index_factory.manifest_path(index_path))
+    np.save(labels_path, np.array([1, 0, 1], dtype="int32"))
+    with pytest.raises(ValueError, match="different builds"):
+        read_labels(labels_path, manifest)
+
+
+def test_read_labels_needs_the_dog_table(tmp_path):
+    path = str(tmp_path / "l.npy")
+    np.save(path, np.array([0, 1], dtype="int32"))
+    with pytest.raises(ValueError, match="dog table"):
+        read_labels(path, {})
+
+
+def test_read_labels_accepts_legacy_string_arrays(tmp_path):
+    path = str(tmp_path / "l.npy")
+    np.save(path, np.array(["0001", "0002"]))
+    assert list(read_labels(path, {})[np.array([1, 0])]) == ["0002", "0001"]
+
+
+def id_mapped(ids, dim=4):
+    index = faiss.IndexIDMap2(faiss.IndexFlatL2(dim))
+    index.add_with_ids(np.zeros((len(ids), dim), dtype="float32"), np.array(ids, dtype="int64"))
+    return index
+
+
+def test_validate_accepts_matching_labels():
+    IndexHolder.validate(id_mapped([0, 2]), Labels.from_strings(np.array(["a", "", "b"])))
+
+
+def test_validate_rejects_ids_past_the_labels():
+    with pytest.raises(ValueError, match="metadata entries"):
+        IndexHolder.validate(id_mapped([0, 3]), Labels.from_strings(np.array(["a", "", "b"])))
+
+
+def test_validate_rejects_vectors_on_freed_ids():
+    with pytest.raises(ValueError, match="live entries"):
+        IndexHolder.validate(id_mapped([0]), Labels.from_strings(np.array(["a", "", "b"])))
+
+
+def test_validate_plain_index_needs_one_label_per_vector():
+    index = faiss.IndexFlatL2(4)
+    index.add(np.zeros((2, 4), dtype="float32"))
+    with pytest.raises(ValueError, match="2 vectors"):
+        IndexHolder.validate(index, Labels.from_strings(np.array(["a", "b", "c"])))
+
+
+def test_holder_does_not_report_changes_before_the_first_load(tmp_path):
+    _, (index_path, labels_path) = build(tmp_path, ["0001", "0002"])
+    holder = IndexHolder(index_path, labels_path)
+    assert not holder.changed()
+
+
+def test_holder_reloads_on_a_manifest_only_change(tmp_path, monkeypatch):
+    _, (index_path, labels_path) = build(tmp_path, ["0001", "0002"])
+    monkeypatch.setattr("bot.index_holder.check_manifest", lambda manifest, dim: {"model": "test"})
+    holder = IndexHolder(index_path, labels_path)
+    holder.load()
+    assert not holder.changed()
+    manifest_file = index_factory.manifest_path(index_path)
+    manifest = dict(index_factory.read_manifest(manifest_file), match={"max_distance": 1.0})
+    index_factory.save_manifest(manifest_file, manifest)
+    stat = os.stat(manifest_file)
+    os.utime(manifest_file, (stat.st_atime, stat.st_mtime + 10))
+    assert holder.changed()
+    holder.load()
+    assert holder.snapshot()[2]["match"] == {"max_distance": 1.0}
+
+
+def test_holder_refuses_an_index_its_check_rejects(tmp_path, monkeypatch):
+    _, (index_path, labels_path) = build(tmp_path, ["0001", "0002"])
+    monkeypatch.setattr("bot.index_holder.check_manifest", lambda manifest, dim: {"model": "test"})
+
+    def check(manifest):
+        raise ValueError("no threshold")
+
+    holder = IndexHolder(index_path, labels_path, check=check)
+    with pytest.raises(ValueError, match="no threshold"):
+        holder.load()
+    assert not holder.reload()
+
+
+@pytest.mark.parametrize("kind", ["pq", "ivfpq"])
+def test_pq_types_build_on_small_collections(kind):
+    vectors = np.random.default_rng(0).standard_normal((100, 16)).astype("float32")
+    spec = index_factory.make_spec(kind, "l2", pq_m=4)
+    index = index_factory.build_index(spec, vectors, np.arange(100))
+    assert index.ntotal == 100
+    assert index_factory.search(index, spec, vectors[:1], 1)[1][0, 0] == 0
@@ -0,0 +1,97 @@
+import asyncio
+import threading
+
+import pytest
+
+from bot.inference import RecognitionWorker
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_concurrent_submits_share_one_batch():
+    batches = []
+
+    def recognize(items):
+        batches.append(list(items))
+        return [item * 2 for item in items]
+
+    async def main():
+        worker = RecognitionWorker(recognize, max_batch_size=8, max_wait_ms=50)
+        results = await asyncio.gather(*(worker.submit(i) for i in range(5)))
+        await worker.stop()
+        return results
+
+    assert run(main()) == [0, 2, 4, 6, 8]
+    assert batches == [[0, 1, 2, 3, 4]]
+
+
+def test_batches_are_capped_at_max_batch_size():
+    batches = []
+
+    def recognize(items):
+        batches.append(len(items))
+        return items
+
+    async def main():
+        worker = RecognitionWorker(recognize, max_batch_size=3, max_wait_ms=50)
+        results = await asyncio.gather(*(worker.submit(i) for i in range(7)))
+        await worker.stop()
+        return results
+
+    assert run(main()) == list(range(7))
+    assert max(batches) <= 3
+    assert sum(batches) == 7
+
+
+def test_recognition_runs_off_the_event_loop():
+    threads = []
+
+    def recognize(items):
+        threads.append(threading.current_thread())
+        return items
+
+    async def main():
+        worker = RecognitionWorker(recognize, max_wait_ms=0)
+        await worker.submit(1)
+        await worker.stop()
+
+    run(main())
+    assert threads and threads[0] is not threading.main_thread()
+
+
+def test_failed_batch_fails_every_future():
+    def recognize(items):
+        raise ValueError("boom")
+
+    async def main():
+        worker = RecognitionWorker(recognize, max_wait_ms=20)
+        results = await asyncio.gather(worker.submit(1), worker.submit(2), return_exceptions=True)
+        await worker.stop()
+        return results
+
+    results = run(main())
+    assert all(isinstance(r, RuntimeError) for r in results)
+
+
+def test_stop_fails_queued_items():
+    release = threading.Event()
+
+    def recognize(items):
+        release.wait(5)
+        return items
+
+    async def main():
+        worker = RecognitionWorker(recognize, max_batch_size=1, max_wait_ms=0)
+        first = worker.submit(1)
+        await asyncio.sleep(0.05)  # first batch is running, the next one waits for the slot
+        queued = worker.submit(2)
+        release.set()
+        await worker.stop()
+        return await first, queued
+
+    first, queued = run(main())
+    assert first == 1
+    with pytest.raises(RuntimeError):
+        queued.result()
@@ -0,0 +1,50 @@
+import random
+
+import pytest
+
+from bot.metrics import Histogram, Metrics
+
+
+def test_empty_histogram():
+    assert Histogram().quantile(0.5) == 0.0
+
+
+def test_quantiles_are_within_one_bucket_of_the_exact_value():
+    rng = random.Random(0)
+    values = [rng.lognormvariate(3, 1) for _ in range(10000)]
+    histogram = Histogram()
+    for value in values:
+        histogram.observe(value)
+    values.sort()
+    for q in (0.5, 0.95, 0.99):
+        exact = values[int(q * len(values)) - 1]
+        assert histogram.quantile(q) == pytest.approx(exact, rel=0.34)
+
+
+def test_quantile_never_exceeds_the_max():
+    histogram = Histogram()
+    for value in (1.0, 1.0, 1.01):
+        histogram.observe(value)
+    assert histogram.quantile(0.99) <= 1.01
+    assert histogram.summary()["max"] == 1.01
+
+
+def test_values_past_the_last_bucket():
+    histogram = Histogram(bounds=[1, 10])
+    histogram.observe(500)
+    assert histogram.quantile(0.5) <= 500
+
+
+def test_snapshot_suffixes_units_and_reads_gauges():
+    metrics = Metrics()
+    with metrics.span("stage"):
+        pass
+    metrics.observe("batch_size", 3)
+    metrics.incr("hits", 2)
+    metrics.gauge("depth", lambda: 4)
+    metrics.gauge("broken", lambda: 1 / 0)
+    snapshot = metrics.snapshot()
+    assert set(snapshot["histograms"]) == {"stage_ms", "batch_size"}
+    assert snapshot["counters"] == {"hits": 2}
+    assert snapshot["gauges"] == {"depth": 4}
+    assert 'kas_stage_ms{quantile="0.5"}' in metrics.render_text()
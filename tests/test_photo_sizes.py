@@ -0,0 +1,50 @@
+from types import SimpleNamespace
+
+import pytest
+
+from bot.photo_sizes import pick_photo_size, needs_more_detail, retry_distance
+
+SIZES = [SimpleNamespace(width=w, height=h) for w, h in ((90, 67), (320, 240), (800, 600), (1280, 960))]
+
+
+def test_adequate_picks_the_smallest_size_covering_the_model_input():
+    assert pick_photo_size(SIZES, "adequate", min_side=0).width == 320
+
+
+def test_adequate_honours_min_side():
+    assert pick_photo_size(SIZES, "adequate", min_side=500).width == 800
+
+
+def test_adequate_falls_back_to_the_largest():
+    assert pick_photo_size(SIZES, "adequate", min_side=2000).width == 1280
+    assert pick_photo_size(SIZES[:2], "adequate", min_side=0).width == 320
+
+
+def test_largest_ignores_the_model_input():
+    assert pick_photo_size(list(reversed(SIZES)), "largest").width == 1280
+
+
+def test_unknown_policy_is_rejected():
+    with pytest.raises(ValueError):
+        pick_photo_size(SIZES, "smallest")
+
+
+def test_needs_more_detail():
+    assert needs_more_detail([])
+    assert not needs_more_detail([{"distance": 10.0}], retry_distance=None)
+    assert needs_more_detail([{"distance": 10.0}], retry_distance=5.0)
+    assert not needs_more_detail([{"distance": 4.0}], retry_distance=5.0)
+
+
+def test_retry_distance_defaults_to_match_threshold():
+    assert retry_distance(50.0, distance=None, fraction=0.8) == pytest.approx(40.0)
+    assert retry_distance(50.0, distance=30.0, fraction=0.8) == 30.0
+    # A match close to the calibrated cutoff retries, a confident one doesn't
+    assert needs_more_detail([{"distance": 45.0}], retry_distance(50.0, None, 0.8))
+    assert not needs_more_detail([{"distance": 20.0}], retry_distance(50.0, None, 0.8))
+
+
+def test_empty_result_retry_can_be_turned_off():
+    assert needs_more_detail([], retry_empty=True)
+    assert not needs_more_detail([], retry_empty=False)
+    assert needs_more_detail([{"distance": 45.0}], retry_distance=40.0, retry_empty=False)
@@ -0,0 +1,90 @@
+from PIL import Image
+
+from bot.query_cache import QueryCache, dhash
+
+
+def gradient(width=64, height=48, flip=False):
+    img = Image.new("L", (width, height))
+    img.putdata([(x * 255 // width) if not flip else 255 - (x * 255 // width)
+                 for y in range(height) for x in range(width)])
+    return img
+
+
+def test_dhash_is_stable_across_sizes():
+    assert (dhash(gradient(640, 480)) ^ dhash(gradient(64, 48))).bit_count() <= 2
+    assert dhash(gradient()) != dhash(gradient(flip=True))
+
+
+def test_file_and_hash_lookups():
+    cache = QueryCache(max_entries=10, hash_distance=2)
+    cache.put(0b1111, ["a"], None, generation=1, file_unique_id="f1")
+    assert cache.get_file("f1", 1) == ["a"]
+    assert cache.get_file("f2", 1) is None
+    assert cache.get_hash(0b1110, 1, file_unique_id="f2") == ["a"]  # 1 bit away
+    assert cache.get_file("f2", 1) == ["a"]  # linked by the hash hit
+    assert cache.get_hash(0b0000, 1) is None  # 4 bits away
+    assert cache.stats()["hits_file"] == 2
+
+
+def test_least_recently_used_entries_are_evicted():
+    cache = QueryCache(max_entries=2, hash_distance=0)
+    cache.put(1, ["a"], None, 1, file_unique_id="fa")
+    cache.put(2, ["b"], None, 1)
+    assert cache.get_hash(1, 1) == ["a"]  # 1 is now the most recent
+    cache.put(4, ["c"], None, 1)
+    assert cache.get_hash(2, 1) is None
+    assert cache.get_hash(1, 1) == ["a"]
+    assert cache.get_hash(4, 1) == ["c"]
+
+
+def test_evicted_entries_unlink_their_files():
+    cache = QueryCache(max_entries=1, hash_distance=0)
+    cache.put(1, ["a"], None, 1, file_unique_id="fa")
+    cache.put(2, ["b"], None, 1)
+    assert cache.get_file("fa", 1) is None
+
+
+def test_new_generation_empties_the_cache():
+    cache = QueryCache(max_entries=10, hash_distance=0)
+    cache.put(1, ["a"], None, 1, file_unique_id="fa")
+    assert cache.get_file("fa", 2) is None
+    assert cache.get_hash(1, 2) is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_put_keeps_the_closer_result():
+    cache = QueryCache(max_entries=10, hash_distance=0)
+    close, far = [{"id": "a", "distance": 1.0}], [{"id": "b", "distance": 5.0}]
+    cache.put(1, close, None, 1)
+    cache.put(1, far, None, 1)
+    assert cache.get_hash(1, 1) == close
+    cache.put(2, [], None, 1)
+    cache.put(2, far, None, 1)
+    assert cache.get_hash(2, 1) == far
+
+
+def test_disabled_cache_stores_nothing():
+    cache = QueryCache(max_entries=0)
+    cache.put(1, ["a"], None, 1, file_unique_id="fa")
+    assert cache.get_file("fa", 1) is None
+    assert cache.get_hash(1, 1) is None
+
+
+def test_near_duplicate_put_shares_the_entry():
+    # The small size found nothing, the larger size (1 bit off) found the dog
+    cache = QueryCache(max_entries=10, hash_distance=2)
+    match = [{"id": "a", "distance": 3.0}]
+    cache.put(0b1111, [], None, 1, file_unique_id="small")
+    cache.put(0b1110, match, None, 1, file_unique_id="large")
+    assert cache.get_file("small", 1) == match
+    assert cache.get_hash(0b1111, 1) == match
+    assert cache.stats()["entries"] == 1
+
+
+def test_link_file_points_at_the_kept_result():
+    cache = QueryCache(max_entries=10, hash_distance=0)
+    match = [{"id": "a", "distance": 3.0}]
+    cache.put(0b0000, [], None, 1, file_unique_id="small")
+    cache.put(0b1111, match, None, 1, file_unique_id="large")
+    cache.link_file("small", "large", 1)
+    assert cache.get_file("small", 1) == match
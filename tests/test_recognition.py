@@ -0,0 +1,84 @@
+import numpy as np
+import pytest
+
+from bot.index_factory import Labels
+from bot.recognition import aggregate_neighbours, fuse_candidates
+
+
+@pytest.fixture
+def labels():
+    # FAISS ids 0..5; id 3 was freed by a deleted image
+    return Labels.from_strings(np.array(["0001", "0001", "0002", "", "0003", "0002"]))
+
+
+def test_groups_neighbours_by_dog_closest_first(labels):
+    distances = np.array([1.0, 2.0, 3.0, 4.0], dtype="float32")
+    ids = np.array([2, 0, 1, 5])
+    candidates = aggregate_neighbours(distances, ids, labels)
+    assert [c["id"] for c in candidates] == ["0002", "0001"]
+    assert candidates[0] == {"id": "0002", "distance": 1.0, "mean_distance": 2.5, "votes": 2}
+    assert candidates[1]["votes"] == 2
+
+
+def test_vote_mode_prefers_more_photos(labels):
+    distances = np.array([1.0, 2.0, 2.5], dtype="float32")
+    ids = np.array([4, 0, 1])
+    assert aggregate_neighbours(distances, ids, labels, mode="vote")[0]["id"] == "0001"
+    assert aggregate_neighbours(distances, ids, labels, mode="min")[0]["id"] == "0003"
+
+
+def test_mean_mode_ranks_by_average_distance(labels):
+    distances = np.array([1.0, 9.0, 3.0, 3.0], dtype="float32")
+    ids = np.array([0, 1, 2, 5])
+    assert [c["id"] for c in aggregate_neighbours(distances, ids, labels, mode="mean")] == ["0002", "0001"]
+
+
+def test_missing_and_freed_ids_are_ignored(labels):
+    distances = np.array([0.5, 1.0, 2.0], dtype="float32")
+    ids = np.array([-1, 3, 4])
+    assert [c["id"] for c in aggregate_neighbours(distances, ids, labels)] == ["0003"]
+
+
+def test_max_distance_cuts_off_unknown_dogs(labels):
+    distances = np.array([50.0, 60.0], dtype="float32")
+    ids = np.array([0, 2])
+    assert aggregate_neighbours(distances, ids, labels, max_distance=40.0) == []
+    assert [c["id"] for c in aggregate_neighbours(distances, ids, labels, max_distance=55.0)] == ["0001"]
+
+
+def candidate(dog_id, distance, votes=1):
+    return {"id": dog_id, "distance": distance, "mean_distance": distance, "votes": votes}
+
+
+def test_fuse_averages_distances_over_photos():
+    fused = fuse_candidates([
+        [candidate("a", 1.0), candidate("b", 2.0)],
+        [candidate("b", 1.0), candidate("a", 3.0)],
+    ])
+    assert [(c["id"], c["distance"], c["photos"]) for c in fused] == [("b", 1.5, 2), ("a", 2.0, 2)]
+
+
+def test_fuse_uses_worst_candidate_where_a_dog_is_missing():
+    fused = fuse_candidates([
+        [candidate("a", 1.0), candidate("b", 4.0)],
+        [candidate("a", 2.0)],
+    ])
+    by_id = {c["id"]: c for c in fused}
+    assert by_id["a"]["distance"] == 1.5
+    assert by_id["b"]["distance"] == 3.0  # (4 + photo 2's worst, 2) / 2
+    assert by_id["b"]["photos"] == 1
+
+
+def test_fuse_skips_photos_without_candidates():
+    assert fuse_candidates([[], []]) == []
+    assert [c["id"] for c in fuse_candidates([[], [candidate("a", 1.0)]])] == ["a"]
+
+
+def test_match_threshold_comes_from_the_manifest(monkeypatch):
+    from bot import recognition
+    monkeypatch.setattr(recognition, "MATCH_MAX_DISTANCE", None)
+    assert recognition.match_threshold({"match": {"max_distance": 64.0}}) == 64.0
+    with pytest.raises(ValueError, match="no calibrated match threshold"):
+        recognition.match_threshold({})
+    monkeypatch.setattr(recognition, "MATCH_MAX_DISTANCE", 50.0)
+    assert recognition.match_threshold({}) == 50.0
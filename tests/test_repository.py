@@ -0,0 +1,51 @@
+import asyncio
+
+from bot.repository import DogRepository
+
+
+class FakeBucket:
+    def __init__(self, folders):
+        self.folders = folders
+
+    def list(self, folder, options):
+        if self.folders is None:
+            raise ConnectionError("storage down")
+        return [{"name": name, "metadata": {"eTag": f"v-{name}"}} for name in self.folders.get(folder, [])]
+
+
+class FakeClient:
+    def __init__(self, folders):
+        self.storage = self
+        self.bucket = FakeBucket(folders)
+
+    def from_(self, bucket):
+        return self.bucket
+
+
+MANIFEST = {"dogs": {"7": [["old.jpg", "m1"], ["deleted.jpg", "m2"]]}}
+
+
+def repository(folders):
+    repo = DogRepository(client=FakeClient(folders))
+
+    async def photo_manifest():
+        return MANIFEST
+
+    repo.photo_manifest = photo_manifest
+    return repo
+
+
+def test_profile_photos_are_listed_live():
+    repo = repository({"7": ["new.jpg", "old.jpg", "notes.txt"]})
+    assert asyncio.run(repo.photos("7")) == ["new.jpg", "old.jpg"]
+    assert repo.photo_version("7/new.jpg") == "v-new.jpg"
+
+
+def test_profile_photos_fall_back_to_the_manifest():
+    assert asyncio.run(repository(None).photos("7")) == ["old.jpg", "deleted.jpg"]
+    assert asyncio.run(repository(None).photos("8")) == []
+
+
+def test_collage_covers_come_from_the_manifest():
+    repo = repository({"7": ["new.jpg"], "8": ["only.jpg"]})
+    assert asyncio.run(repo.photo_lists(["7", "8"])) == {"7": ["old.jpg", "deleted.jpg"], "8": ["only.jpg"]}
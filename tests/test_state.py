@@ -0,0 +1,53 @@
+import asyncio
+
+from bot import state
+from bot.state import MemorySessions
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_get_returns_what_was_set():
+    async def main():
+        sessions = MemorySessions(ttl=60, max_entries=10)
+        await sessions.set(1, state.BROWSE, {"dogs": ["0001"]})
+        assert await sessions.get(1, state.BROWSE) == {"dogs": ["0001"]}
+        assert await sessions.get(1, state.RECOGNIZED) is None
+        await sessions.delete(1, state.BROWSE)
+        assert await sessions.get(1, state.BROWSE) is None
+
+    run(main())
+
+
+def test_entries_expire_after_ttl(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(state.time, "monotonic", lambda: now[0])
+
+    async def main():
+        sessions = MemorySessions(ttl=10, max_entries=10)
+        await sessions.set(1, state.RECOGNIZED, {"dog": "0001"})
+        now[0] += 8
+        assert await sessions.get(1, state.RECOGNIZED) == {"dog": "0001"}  # reading renews it
+        now[0] += 8
+        assert await sessions.get(1, state.RECOGNIZED) == {"dog": "0001"}
+        now[0] += 11
+        assert await sessions.get(1, state.RECOGNIZED) is None
+        assert sessions.stats()["entries"] == 0
+
+    run(main())
+
+
+def test_least_recently_used_entries_are_dropped():
+    async def main():
+        sessions = MemorySessions(ttl=60, max_entries=2)
+        await sessions.set(1, state.BROWSE, {"dogs": []})
+        await sessions.set(2, state.BROWSE, {"dogs": []})
+        await sessions.get(1, state.BROWSE)
+        await sessions.set(3, state.BROWSE, {"dogs": []})
+        assert await sessions.get(2, state.BROWSE) is None
+        assert await sessions.get(1, state.BROWSE) is not None
+        assert await sessions.get(3, state.BROWSE) is not None
+        assert sessions.stats() == {"entries": 2, "evicted": 1}
+
+    run(main())
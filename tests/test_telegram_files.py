@@ -0,0 +1,140 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from aiogram.utils.exceptions import BadRequest
+
+from bot import telegram_files
+from bot.telegram_files import FileIdStore, send_stored_photo, send_stored_media_group
+
+
+class FakeBot:
+    """Records what was sent; uploads get fresh file_ids, ids in `rejected` fail like stale ones."""
+
+    def __init__(self):
+        self.sent = []
+        self.rejected = set()
+        self.uploads = 0
+
+    def _message(self, media):
+        if isinstance(media, str):
+            if media in self.rejected:
+                raise BadRequest("Wrong file identifier/http url specified")
+            file_id = media
+        else:
+            self.uploads += 1
+            file_id = f"id-{self.uploads}"
+        return SimpleNamespace(photo=[SimpleNamespace(file_id=file_id)])
+
+    async def send_photo(self, chat_id, photo, **kwargs):
+        message = self._message(photo)
+        self.sent.append(photo if isinstance(photo, str) else "upload")
+        return message
+
+    async def send_media_group(self, chat_id, media):
+        # Attached bytes show up as "attach://<name>" references
+        ids = [None if item.media.startswith("attach://") else item.media for item in media]
+        messages = [self._message(file_id) for file_id in ids]
+        self.sent.append([file_id or "upload" for file_id in ids])
+        return messages
+
+
+@pytest.fixture
+def fake(monkeypatch, tmp_path):
+    bot = FakeBot()
+    monkeypatch.setattr(telegram_files, "bot", bot)
+    monkeypatch.setattr(telegram_files, "file_ids", FileIdStore(str(tmp_path / "files.db")))
+    return bot
+
+
+def load_counter():
+    calls = []
+
+    async def load():
+        calls.append(1)
+        return b"jpeg"
+
+    return load, calls
+
+
+def test_photo_is_uploaded_once_then_sent_by_file_id(fake):
+    load, calls = load_counter()
+
+    async def main():
+        await send_stored_photo(1, "7/a.jpg", "v1", "profile", load)
+        await send_stored_photo(1, "7/a.jpg", "v1", "profile", load)
+
+    asyncio.run(main())
+    assert fake.sent == ["upload", "id-1"]
+    assert len(calls) == 1
+    assert telegram_files.file_ids.stats()["hits"] == 1
+
+
+def test_new_version_or_variant_uploads_again(fake):
+    load, calls = load_counter()
+
+    async def main():
+        await send_stored_photo(1, "7/a.jpg", "v1", "profile", load)
+        await send_stored_photo(1, "7/a.jpg", "v2", "profile", load)
+        await send_stored_photo(1, "7/a.jpg", "v2", "gallery", load)
+
+    asyncio.run(main())
+    assert fake.sent == ["upload", "upload", "upload"]
+
+
+def test_rejected_file_id_falls_back_to_an_upload(fake):
+    load, calls = load_counter()
+
+    async def main():
+        await send_stored_photo(1, "7/a.jpg", "v1", "profile", load)
+        fake.rejected.add("id-1")
+        await send_stored_photo(1, "7/a.jpg", "v1", "profile", load)
+        await send_stored_photo(1, "7/a.jpg", "v1", "profile", load)
+
+    asyncio.run(main())
+    assert fake.sent == ["upload", "upload", "id-2"]  # the new id replaced the stale one
+    assert telegram_files.file_ids.stats()["stale"] == 1
+
+
+def test_file_ids_survive_a_restart(fake, tmp_path):
+    load, _ = load_counter()
+    asyncio.run(send_stored_photo(1, "7/a.jpg", "v1", "profile", load))
+    restarted = FileIdStore(str(tmp_path / "files.db"))
+    assert asyncio.run(restarted.get("7/a.jpg", "v1", "profile")) == "id-1"
+    assert asyncio.run(restarted.get("7/a.jpg", "v2", "profile")) is None
+
+
+def test_album_mixes_known_ids_and_uploads(fake):
+    loaded = []
+
+    async def load_many(paths):
+        loaded.append(list(paths))
+        return [None if path == "7/broken.jpg" else b"jpeg" for path in paths]
+
+    photos = [("7/a.jpg", "v1"), ("7/b.jpg", "v1"), ("7/broken.jpg", "v1")]
+
+    async def main():
+        await send_stored_photo(1, "7/a.jpg", "v1", "gallery", load_counter()[0])
+        return await send_stored_media_group(1, photos, "gallery", load_many)
+
+    messages = asyncio.run(main())
+    assert fake.sent[-1] == ["id-1", "upload"]  # the broken photo is left out
+    assert loaded[-1] == ["7/b.jpg", "7/broken.jpg"]
+    assert len(messages) == 2
+    assert asyncio.run(telegram_files.file_ids.get("7/b.jpg", "v1", "gallery")) == "id-2"
+
+
+def test_album_with_a_stale_id_is_uploaded_again(fake):
+    async def load_many(paths):
+        return [b"jpeg"] * len(paths)
+
+    photos = [("7/a.jpg", "v1"), ("7/b.jpg", "v1")]
+
+    async def main():
+        await send_stored_media_group(1, photos, "gallery", load_many)
+        fake.rejected.add("id-1")
+        return await send_stored_media_group(1, photos, "gallery", load_many)
+
+    asyncio.run(main())
+    assert fake.sent == [["upload", "upload"], ["upload", "upload"]]
+    assert telegram_files.file_ids.stats()["stale"] == 2
@@ -0,0 +1,100 @@
+import asyncio
+import io
+import os
+
+from PIL import Image
+
+from bot.thumbnails import ThumbnailCache, make_variant
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def renderer(data, calls):
+    async def render():
+        calls.append(data)
+        return data
+    return render
+
+
+def test_make_variant_fits_the_box():
+    buf = io.BytesIO()
+    Image.new("RGB", (2000, 1000), "red").save(buf, format="JPEG")
+    assert Image.open(io.BytesIO(make_variant(buf.getvalue(), "cell"))).size == (350, 175)
+
+
+def test_hits_come_from_memory_then_disk(tmp_path):
+    calls = []
+
+    async def main():
+        cache = ThumbnailCache(str(tmp_path), max_bytes=1000, memory_bytes=1000)
+        assert await cache.get_rendered("p", "v1", "cell", renderer(b"x" * 10, calls)) == b"x" * 10
+        assert await cache.get_rendered("p", "v1", "cell", renderer(b"y", calls)) == b"x" * 10
+        # A new process has an empty memory tier but finds the file
+        fresh = ThumbnailCache(str(tmp_path), max_bytes=1000, memory_bytes=1000)
+        assert await fresh.get_rendered("p", "v1", "cell", renderer(b"y", calls)) == b"x" * 10
+        return cache.stats(), fresh.stats()
+
+    stats, fresh_stats = run(main())
+    assert calls == [b"x" * 10]
+    assert (stats["misses"], stats["hits_memory"], fresh_stats["hits_disk"]) == (1, 1, 1)
+
+
+def test_new_version_is_a_new_key(tmp_path):
+    calls = []
+
+    async def main():
+        cache = ThumbnailCache(str(tmp_path), max_bytes=1000, memory_bytes=1000)
+        await cache.get_rendered("p", "v1", "cell", renderer(b"old", calls))
+        return await cache.get_rendered("p", "v2", "cell", renderer(b"new", calls))
+
+    assert run(main()) == b"new"
+
+
+def test_disk_budget_evicts_least_recently_used(tmp_path):
+    calls = []
+
+    async def main():
+        cache = ThumbnailCache(str(tmp_path), max_bytes=25, memory_bytes=0)
+        for path in ("a", "b"):
+            await cache.get_rendered(path, "", "cell", renderer(b"1" * 10, calls))
+        await cache.get_rendered("a", "", "cell", renderer(b"2" * 10, calls))  # disk hit, a is now newest
+        await cache.get_rendered("c", "", "cell", renderer(b"3" * 10, calls))
+        return cache
+
+    cache = run(main())
+    on_disk = set(os.listdir(tmp_path))
+    assert on_disk == {ThumbnailCache.key("a", "", "cell"), ThumbnailCache.key("c", "", "cell")}
+    assert cache.stats()["evictions"] == 1
+    assert cache.stats()["disk_bytes"] == 20
+
+
+def test_memory_budget_evicts_least_recently_used(tmp_path):
+    calls = []
+
+    async def main():
+        cache = ThumbnailCache(str(tmp_path), max_bytes=1000, memory_bytes=25)
+        for path in ("a", "b", "c"):
+            await cache.get_rendered(path, "", "cell", renderer(b"1" * 10, calls))
+        return cache
+
+    cache = run(main())
+    assert cache.stats()["memory_bytes"] == 20
+    assert ThumbnailCache.key("a", "", "cell") not in cache._memory
+
+
+def test_concurrent_misses_share_one_render(tmp_path):
+    calls = []
+
+    async def slow():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return b"data"
+
+    async def main():
+        cache = ThumbnailCache(str(tmp_path), max_bytes=1000, memory_bytes=1000)
+        return await asyncio.gather(*(cache.get_rendered("p", "", "cell", slow) for _ in range(3)))
+
+    assert run(main()) == [b"data"] * 3
+    assert calls == [1]